@@ -1,11 +1,13 @@
 from django.contrib import admin
 from .models import (
-    Portal, PortalCategory, MasterCategory, MasterCategoryMapping, Group, MasterNewsPost, NewsDistribution, PortalPrompt
+    Portal, PortalCategory, MasterCategory, MasterCategoryMapping, Group, MasterNewsPost, NewsDistribution, PortalPrompt,
+    PublishJob, PublishTask, RewriteCacheEntry, RewriteCacheStats, RewriteStats,
+    PortalHealth, ScheduledPublish, DraftVariation, DistributionDailyRollup
 )
 
 @admin.register(Portal)
 class PortalAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'base_url']
+    list_display = ['id', 'name', 'base_url', 'image_format', 'image_max_width', 'image_max_height']
     search_fields = ['id', 'name', 'base_url']
     list_filter = ['id', 'name', 'base_url']
     
@@ -47,13 +49,78 @@ class MasterNewsPostAdmin(admin.ModelAdmin):
 
 @admin.register(NewsDistribution)
 class NewsDistributionAdmin(admin.ModelAdmin):
-    list_display = ['id', 'news_post', 'portal', 'portal_category', 'status']
+    list_display = ['id', 'news_post', 'portal', 'portal_category', 'status', 'retry_count', 'next_retry_at']
     search_fields = ['id', 'news_post', 'portal', 'portal_category']
-    list_filter = ['id', 'news_post', 'portal', 'portal_category']
+    list_filter = ['id', 'news_post', 'portal', 'portal_category', 'status']
 
 
 @admin.register(PortalPrompt)
 class PortalPromptAdmin(admin.ModelAdmin):
-    list_display = ['id', 'portal', 'prompt_text', 'is_global_prompt']
+    list_display = ['id', 'portal', 'prompt_text', 'is_global_prompt', 'chunk_chars', 'chunk_parallelism', 'model',
+                    'fallback_model', 'latency_budget_ms']
     search_fields = ['id', 'portal', 'prompt_text', 'is_global_prompt']
     list_filter = ['id', 'portal', 'prompt_text', 'is_global_prompt']
+
+
+
+@admin.register(PublishJob)
+class PublishJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'news_post', 'master_category', 'requested_by', 'status', 'total_tasks', 'created_at']
+    search_fields = ['id', 'news_post__title']
+    list_filter = ['status', 'master_category']
+
+
+@admin.register(PublishTask)
+class PublishTaskAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'job', 'portal', 'portal_category', 'status', 'attempts', 'worker_id', 'leased_until', 'rewritten_at'
+    ]
+    search_fields = ['id', 'portal__name']
+    list_filter = ['status', 'portal']
+
+
+@admin.register(RewriteCacheEntry)
+class RewriteCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'portal_name', 'model', 'hit_count', 'last_used_at', 'expires_at']
+    search_fields = ['key', 'portal_name']
+    list_filter = ['model']
+
+
+@admin.register(RewriteCacheStats)
+class RewriteCacheStatsAdmin(admin.ModelAdmin):
+    list_display = ['id', 'hits', 'misses', 'saved_ms', 'updated_at']
+
+
+@admin.register(RewriteStats)
+class RewriteStatsAdmin(admin.ModelAdmin):
+    list_display = ['id', 'replies', 'invalid_replies', 'undecodable_replies', 'retried_fields', 'recovered_fields',
+                    'parse_ms', 'hedged_requests', 'hedge_wins', 'input_tokens', 'cached_input_tokens', 'output_tokens',
+                    'updated_at']
+
+
+@admin.register(DistributionDailyRollup)
+class DistributionDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['id', 'day', 'portal', 'author', 'master_category', 'status', 'count', 'retry_sum', 'updated_at']
+    list_filter = ['status', 'day']
+    search_fields = ['portal__name', 'author__username']
+
+
+@admin.register(PortalHealth)
+class PortalHealthAdmin(admin.ModelAdmin):
+    list_display = ['id', 'portal', 'state', 'health_score', 'consecutive_failures', 'avg_latency_ms', 'opened_at']
+    search_fields = ['portal__name']
+    list_filter = ['state']
+
+
+@admin.register(ScheduledPublish)
+class ScheduledPublishAdmin(admin.ModelAdmin):
+    list_display = ['id', 'news_post', 'master_category', 'publish_at', 'status', 'prepared_at', 'fired_at', 'job']
+    search_fields = ['id', 'news_post__title']
+    list_filter = ['status']
+
+
+@admin.register(DraftVariation)
+class DraftVariationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'news_post', 'portal', 'status', 'generated_at', 'updated_at']
+    search_fields = ['id', 'news_post__title', 'portal__name']
+    list_filter = ['status', 'portal']
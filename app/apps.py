@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (connects the stats cache invalidation receivers)
+        from . import rollups  # noqa: F401  (connects the receivers keeping rollups in step with saves and deletes)
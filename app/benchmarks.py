@@ -0,0 +1,27 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+
+@contextmanager
+def scratch_database():
+    """
+    Run a bench_* command against a throwaway database, created and destroyed
+    like the test runner's (test_<NAME>; in memory on SQLite), so synthetic
+    rows are never written to or deleted from the configured database. The
+    stats cache is disabled meanwhile so no numbers computed from them leak
+    to the shared cache.
+    """
+    caches = {**settings.CACHES, "stats": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    with override_settings(CACHES=caches):
+        old_config = setup_databases(
+            verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS}, serialized_aliases=set()
+        )
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            # SQLite ignores close() on an in-memory database: close again now the real name is restored
+            connections[DEFAULT_DB_ALIAS].close()
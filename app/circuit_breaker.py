@@ -0,0 +1,113 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PortalHealth
+
+logger = logging.getLogger("publish")
+
+# Weight of the newest call in the moving averages (health score, latency)
+EWMA_WEIGHT = 0.2
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a portal whose circuit is open."""
+
+
+def get_health(portal):
+    health, _ = PortalHealth.objects.get_or_create(portal=portal)
+    return health
+
+
+def allow_request(portal):
+    """
+    Whether a call to `portal` may go out now.
+
+    CLOSED always allows. OPEN allows nothing until CIRCUIT_RESET_SECONDS have
+    passed, then exactly one caller wins the switch to HALF_OPEN and probes.
+    A HALF_OPEN probe that never reported back is replaced after another reset period.
+    """
+    health = get_health(portal)
+    if health.state == "CLOSED":
+        return True
+
+    now = timezone.now()
+    reset_before = now - timedelta(seconds=settings.CIRCUIT_RESET_SECONDS)
+    if health.opened_at and health.opened_at > reset_before:
+        return False
+
+    # Conditional update: only one process gets to send the probe
+    won = PortalHealth.objects.filter(
+        pk=health.pk, state=health.state, opened_at=health.opened_at
+    ).update(state="HALF_OPEN", opened_at=now)
+    if won:
+        logger.info("Circuit for %s is half-open, sending probe", portal.name)
+    return bool(won)
+
+
+def record_success(portal, latency_ms):
+    now = timezone.now()
+    get_health(portal)
+    PortalHealth.objects.filter(portal=portal).update(
+        state="CLOSED",
+        consecutive_failures=0,
+        success_count=F("success_count") + 1,
+        health_score=F("health_score") * (1 - EWMA_WEIGHT) + EWMA_WEIGHT,
+        avg_latency_ms=F("avg_latency_ms") * (1 - EWMA_WEIGHT) + latency_ms * EWMA_WEIGHT,
+        opened_at=None,
+        last_success_at=now,
+        updated_at=now,
+    )
+
+
+def record_failure(portal, latency_ms, error=None):
+    now = timezone.now()
+    get_health(portal)
+    PortalHealth.objects.filter(portal=portal).update(
+        consecutive_failures=F("consecutive_failures") + 1,
+        failure_count=F("failure_count") + 1,
+        health_score=F("health_score") * (1 - EWMA_WEIGHT),
+        avg_latency_ms=F("avg_latency_ms") * (1 - EWMA_WEIGHT) + latency_ms * EWMA_WEIGHT,
+        last_failure_at=now,
+        last_error=str(error)[:1000] if error else None,
+        updated_at=now,
+    )
+    opened = PortalHealth.objects.filter(portal=portal).filter(
+        Q(state="HALF_OPEN") | Q(state="CLOSED", consecutive_failures__gte=settings.CIRCUIT_FAILURE_THRESHOLD)
+    ).update(state="OPEN", opened_at=now)
+    if opened:
+        logger.warning("Circuit for %s opened after failure: %s", portal.name, error)
+
+
+def reopen_time(portal):
+    """When an open circuit will next let a probe through (now if it is not open)."""
+    health = get_health(portal)
+    if health.state == "CLOSED" or not health.opened_at:
+        return timezone.now()
+    return health.opened_at + timedelta(seconds=settings.CIRCUIT_RESET_SECONDS)
+
+
+def health_summary(health):
+    """Serializable view of a PortalHealth row for the health endpoint."""
+    retry_after = None
+    if health.state == "OPEN" and health.opened_at:
+        reopen_at = health.opened_at + timedelta(seconds=settings.CIRCUIT_RESET_SECONDS)
+        retry_after = max(0, int((reopen_at - timezone.now()).total_seconds()))
+    return {
+        "portal_id": health.portal_id,
+        "portal_name": health.portal.name,
+        "state": health.state,
+        "health_score": round(health.health_score, 3),
+        "avg_latency_ms": round(health.avg_latency_ms, 1),
+        "consecutive_failures": health.consecutive_failures,
+        "success_count": health.success_count,
+        "failure_count": health.failure_count,
+        "opened_at": health.opened_at,
+        "retry_after_seconds": retry_after,
+        "last_success_at": health.last_success_at,
+        "last_failure_at": health.last_failure_at,
+        "last_error": health.last_error,
+    }
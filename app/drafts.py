@@ -0,0 +1,194 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DraftVariation, MasterCategoryMapping
+from .planner import PublishPlan
+from .rewrite_cache import make_cache_key
+from .utils import DEFAULT_REWRITE_OPTIONS, get_portals_from_assignment
+from user.models import UserCategoryGroupAssignment
+
+logger = logging.getLogger("publish")
+
+# Fields of a MasterNewsPost that feed its AI variations
+CONTENT_FIELDS = ["title", "short_description", "content", "meta_title", "slug"]
+
+
+def pregenerate_requested(data):
+    """Whether a create/update request asked for draft variations (`pregenerate_variations`, default AI_PREGENERATE_DRAFTS)."""
+    value = data.get("pregenerate_variations")
+    if value is None or value == "":
+        return settings.AI_PREGENERATE_DRAFTS
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def content_snapshot(news_post):
+    return tuple(getattr(news_post, field) for field in CONTENT_FIELDS)
+
+
+def draft_key(news_post, entry):
+    """Rewrite-cache key of the variation `entry` (a PortalPlan) would get for `news_post` now."""
+    return make_cache_key(
+        news_post.title,
+        news_post.short_description,
+        news_post.content,
+        news_post.meta_title,
+        news_post.slug,
+        entry.prompt_text,
+        entry.portal.name,
+        (entry.rewrite_options or DEFAULT_REWRITE_OPTIONS).rewrite_model,
+    )
+
+
+def draft_targets(news_post, user):
+    """
+    Plan entries for every portal `user` is assigned to (via
+    get_portals_from_assignment) that would get a GPT rewrite; portals only
+    mapped with `use_default_content` are left out.
+    """
+    pairs = []
+    assignments = UserCategoryGroupAssignment.objects.filter(user=user).select_related("master_category", "group")
+    for assignment in assignments:
+        pairs.extend(get_portals_from_assignment(assignment))
+
+    rewritten_categories = set(
+        MasterCategoryMapping.objects.filter(
+            portal_category_id__in={portal_category.id for _, portal_category in pairs},
+            use_default_content=False,
+        ).values_list("portal_category_id", flat=True)
+    )
+
+    targets = {}
+    for portal, portal_category in pairs:
+        if portal_category.id in rewritten_categories:
+            targets.setdefault(portal.id, (portal, portal_category, False, False))
+
+    plan = PublishPlan.for_targets(news_post, None, user, list(targets.values()))
+    return plan.entries
+
+
+def request_drafts(news_post, user):
+    """
+    Queue background AI variations of `news_post` for every portal `user`
+    publishes to. Drafts already generated from the current content are kept;
+    any other draft of the post is replaced. The publish worker generates them.
+    Never raises: a failure here must not block saving the post.
+    """
+    try:
+        return _request_drafts(news_post, user)
+    except Exception as e:
+        logger.exception("Could not request draft variations for post %s: %s", news_post.id, str(e))
+        return 0
+
+
+def _request_drafts(news_post, user):
+    entries = draft_targets(news_post, user)
+    keys = {entry.portal.id: draft_key(news_post, entry) for entry in entries}
+
+    with transaction.atomic():
+        stale = DraftVariation.objects.filter(news_post=news_post)
+        for portal_id, key in keys.items():
+            stale = stale.exclude(portal_id=portal_id, key=key)
+        stale.delete()
+        DraftVariation.objects.bulk_create(
+            [DraftVariation(news_post=news_post, portal_id=portal_id, key=key) for portal_id, key in keys.items()],
+            ignore_conflicts=True,
+        )
+
+    logger.info("Requested %s draft variations for post %s", len(keys), news_post.id)
+    return len(keys)
+
+
+def invalidate_drafts(news_post):
+    """Drop every draft variation of `news_post` (its content changed)."""
+    deleted, _ = DraftVariation.objects.filter(news_post=news_post).delete()
+    return deleted
+
+
+def claim_drafts(limit, lease_seconds=None):
+    """
+    Mark up to `limit` PENDING drafts (or GENERATING ones abandoned for longer
+    than the lease) as GENERATING and return them. Rows locked by another worker are skipped.
+    """
+    lease_seconds = lease_seconds or settings.PUBLISH_TASK_LEASE_SECONDS
+    now = timezone.now()
+
+    with transaction.atomic():
+        draft_ids = list(
+            DraftVariation.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status="PENDING")
+                | Q(status="GENERATING", updated_at__lt=now - timedelta(seconds=lease_seconds))
+            )
+            .order_by("id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not draft_ids:
+            return []
+        DraftVariation.objects.filter(id__in=draft_ids).update(status="GENERATING", updated_at=now)
+
+    return list(
+        DraftVariation.objects.filter(id__in=draft_ids)
+        .select_related("news_post", "news_post__created_by", "portal")
+        .order_by("id")
+    )
+
+
+def save_draft(draft, variation):
+    """
+    Store a generated variation, unless the draft was invalidated or re-keyed
+    meanwhile. A variation identical to the original post means GPT failed.
+    """
+    news_post = draft.news_post
+    original = (
+        news_post.title, news_post.short_description, news_post.content,
+        news_post.meta_title or news_post.title,
+    )
+    if variation is None or tuple(variation[:4]) == original:
+        DraftVariation.objects.filter(pk=draft.pk, key=draft.key).update(status="FAILED", updated_at=timezone.now())
+        return False
+
+    title, short_desc, content, meta_title, slug = variation
+    now = timezone.now()
+    return bool(DraftVariation.objects.filter(pk=draft.pk, key=draft.key).update(
+        status="READY",
+        ai_title=title,
+        ai_short_description=short_desc,
+        ai_content=content,
+        ai_meta_title=meta_title,
+        ai_slug=slug,
+        generated_at=now,
+        updated_at=now,
+    ))
+
+
+def ready_drafts(work):
+    """
+    READY draft variations still matching the current post content and prompt.
+    `work` is a list of (key, news_post, PortalPlan); returns {key: variation}.
+    """
+    wanted = {}
+    for key, news_post, entry in work:
+        if not entry.skipped and not entry.use_default_content:
+            wanted.setdefault((news_post.id, entry.portal.id), []).append((key, draft_key(news_post, entry)))
+    if not wanted:
+        return {}
+
+    post_ids = {post_id for post_id, _ in wanted}
+    portal_ids = {portal_id for _, portal_id in wanted}
+    drafts = DraftVariation.objects.filter(
+        news_post_id__in=post_ids, portal_id__in=portal_ids, status="READY"
+    )
+
+    variations = {}
+    for draft in drafts:
+        for key, current_key in wanted.get((draft.news_post_id, draft.portal_id), []):
+            if draft.key == current_key:
+                variations[key] = (
+                    draft.ai_title, draft.ai_short_description, draft.ai_content, draft.ai_meta_title, draft.ai_slug,
+                )
+    return variations
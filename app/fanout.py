@@ -0,0 +1,56 @@
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+# Per-key semaphores are shared by every executor in the process, so two jobs
+# publishing to the same portal at once still respect the per-portal limit.
+_key_semaphores = defaultdict(dict)
+_key_semaphores_lock = threading.Lock()
+
+
+def _semaphore_for(key, limit):
+    with _key_semaphores_lock:
+        semaphores = _key_semaphores[limit]
+        if key not in semaphores:
+            semaphores[key] = threading.BoundedSemaphore(limit)
+        return semaphores[key]
+
+
+class FanOutExecutor:
+    """
+    Runs independent units of work (one per portal) on a bounded thread pool.
+
+    - `max_workers` caps the total number of units in flight.
+    - `per_key_limit` caps how many units sharing the same key (portal)
+      run at the same time.
+    Results are always returned in the order of the input items.
+    """
+
+    def __init__(self, max_workers=None, per_key_limit=None):
+        self.max_workers = max_workers or settings.PUBLISH_MAX_CONCURRENCY
+        self.per_key_limit = per_key_limit or settings.PUBLISH_PER_PORTAL_CONCURRENCY
+
+    def _call(self, func, item, key):
+        semaphore = _semaphore_for(key(item), self.per_key_limit) if key else None
+        if semaphore:
+            semaphore.acquire()
+        try:
+            return func(item)
+        finally:
+            if semaphore:
+                semaphore.release()
+            # Each pool thread gets its own DB connection; don't leak it.
+            connection.close()
+
+    def map(self, func, items, key=None):
+        """Apply `func` to every item concurrently and return the results in input order."""
+        items = list(items)
+        if not items:
+            return []
+
+        workers = min(self.max_workers, len(items))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="publish") as pool:
+            return list(pool.map(lambda item: self._call(func, item, key), items))
@@ -0,0 +1,166 @@
+import html
+import re
+from html.parser import HTMLParser
+
+# Text inside these elements is never sent for rewriting
+RAW_TEXT_TAGS = {"script", "style", "code", "pre", "textarea"}
+
+# Elements without a closing tag (they never change the nesting depth)
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+}
+
+CHARREF_RE = re.compile(r"&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][-.a-zA-Z0-9]*);?")
+
+
+class _TextRunParser(HTMLParser):
+    """
+    Collects the source offsets of every text run outside RAW_TEXT_TAGS,
+    with the index of the top-level block it belongs to.
+    """
+
+    def __init__(self, source):
+        super().__init__(convert_charrefs=False)
+        self.source = source
+        # getpos() counts "\n" only; str.splitlines() would also break on "\r", "\x0c", U+2028, ...
+        self.line_offsets = [0]
+        for line in source.split("\n")[:-1]:
+            self.line_offsets.append(self.line_offsets[-1] + len(line) + 1)
+        self.runs = []
+        self.raw_depth = 0
+        self.depth = 0
+        self.block = 0
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
+
+    def _add_text(self, start, end):
+        if self.raw_depth or start >= end:
+            return
+        if self.runs and self.runs[-1][1] == start:
+            self.runs[-1][1] = end
+        else:
+            self.runs.append([start, end, self.block])
+
+    def handle_starttag(self, tag, attrs):
+        if self.depth == 0:
+            self.block += 1
+        if tag in RAW_TEXT_TAGS:
+            self.raw_depth += 1
+        if tag not in VOID_TAGS:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in RAW_TEXT_TAGS and self.raw_depth:
+            self.raw_depth -= 1
+        if tag not in VOID_TAGS and self.depth:
+            self.depth -= 1
+            if self.depth == 0:
+                # Text between top-level elements starts a block of its own
+                self.block += 1
+
+    def handle_data(self, data):
+        start = self._offset()
+        self._add_text(start, start + len(data))
+
+    def _handle_ref(self):
+        start = self._offset()
+        match = CHARREF_RE.match(self.source, start)
+        if match:
+            self._add_text(start, match.end())
+
+    def handle_entityref(self, name):
+        self._handle_ref()
+
+    def handle_charref(self, name):
+        self._handle_ref()
+
+
+class SegmentedHTML:
+    """
+    An HTML fragment split into markup and rewritable text segments.
+
+    Only the text is meant for the LLM: `segments` maps stable ids ("s1",
+    "s2", ...) to plain (unescaped) text, trimmed of surrounding whitespace.
+    `render()` re-stitches the original markup byte-for-byte around the
+    rewritten text; segments missing from the rewrite keep their source text.
+    """
+
+    def __init__(self, source):
+        self.source = source or ""
+        parser = _TextRunParser(self.source)
+        parser.feed(self.source)
+        parser.close()
+
+        # parts: literal source strings and segment ids, in document order
+        self.parts = []
+        self.segments = {}
+        self.blocks = {}
+        self._raw = {}
+        position = 0
+        for start, end, block in parser.runs:
+            raw = self.source[start:end]
+            stripped = raw.strip()
+            if not stripped:
+                continue
+            lead = len(raw) - len(raw.lstrip())
+            trail = len(raw) - len(raw.rstrip())
+            segment_id = f"s{len(self.segments) + 1}"
+
+            self.parts.append(self.source[position:start + lead])
+            self.parts.append((segment_id,))
+            self.segments[segment_id] = html.unescape(stripped)
+            self.blocks[segment_id] = block
+            self._raw[segment_id] = stripped
+            position = end - trail
+        self.parts.append(self.source[position:])
+
+    def __len__(self):
+        return len(self.segments)
+
+    def chunks(self, max_chars):
+        """
+        Split the segments into ordered chunks of at most ~`max_chars` characters
+        of text, breaking only between top-level blocks (paragraphs, lists,
+        figures, ...) unless a single block is larger than `max_chars`.
+        Returns a list of {segment_id: text} dicts.
+        """
+        blocks = []
+        for segment_id, text in self.segments.items():
+            if blocks and blocks[-1][0] == self.blocks[segment_id]:
+                blocks[-1][1].append((segment_id, text))
+            else:
+                blocks.append((self.blocks[segment_id], [(segment_id, text)]))
+
+        chunks, current, size = [], {}, 0
+        for _, block_segments in blocks:
+            block_size = sum(len(text) for _, text in block_segments)
+            if current and size + block_size > max_chars:
+                chunks.append(current)
+                current, size = {}, 0
+            for segment_id, text in block_segments:
+                if current and size + len(text) > max_chars and block_size > max_chars:
+                    chunks.append(current)
+                    current, size = {}, 0
+                current[segment_id] = text
+                size += len(text)
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def render(self, rewritten=None):
+        """The HTML with `rewritten` ({segment_id: text}) substituted into the markup."""
+        rewritten = rewritten or {}
+        output = []
+        for part in self.parts:
+            if isinstance(part, tuple):
+                segment_id = part[0]
+                text = rewritten.get(segment_id)
+                if isinstance(text, str) and text.strip():
+                    output.append(html.escape(text.strip(), quote=False))
+                else:
+                    output.append(self._raw[segment_id])
+            else:
+                output.append(part)
+        return "".join(output)
@@ -0,0 +1,113 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+
+from app.benchmarks import scratch_database
+from app.models import MasterNewsPost, NewsDistribution, Portal
+from app.stats import distribution_stats
+
+BENCH_PREFIX = "bench-distribution-stats"
+STATUSES = ["SUCCESS"] * 7 + ["FAILED"] * 2 + ["PENDING", "DEAD"]
+
+
+def legacy_distribution_stats(queryset):
+    """The previous AdminStatsAPIView._get_distribution_stats: one query per counter plus a group-by."""
+    portal_distribution = (
+        queryset.values("portal__name")
+        .annotate(total=Count("id"))
+        .order_by("portal__name")
+    )
+    return {
+        "news_distribution": {
+            "total_distributions": queryset.count(),
+            "successful_distributions": queryset.filter(status="SUCCESS").count(),
+            "failed_distributions": queryset.filter(status="FAILED").count(),
+            "pending_distributions": queryset.filter(status="PENDING").count(),
+            "dead_distributions": queryset.filter(status="DEAD").count(),
+            "retry_counts": queryset.aggregate(total=Sum("retry_count"))["total"] or 0,
+            "portal_distribution_counts": {item["portal__name"]: item["total"] for item in portal_distribution},
+        }
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the admin distribution stats (legacy per-counter queries vs the single conditional-aggregation "
+        "query of app.stats) on a synthetic NewsDistribution table, and check both agree and the new one runs "
+        "exactly one query. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="Synthetic distribution rows.")
+        parser.add_argument("--portals", type=int, default=200, help="Synthetic portals.")
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per variant (best is reported).")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = self._seed(options["rows"], options["portals"])
+            scenarios = [
+                ("all", NewsDistribution.objects.all()),
+                ("user", NewsDistribution.objects.filter(news_post__created_by=user)),
+            ]
+            self.stdout.write(f"{'scope':>6} {'variant':>8} {'best ms':>9} {'queries':>8}")
+            for scope, queryset in scenarios:
+                results = {}
+                for variant, function in (("legacy", legacy_distribution_stats), ("single", distribution_stats)):
+                    best, queries, results[variant] = self._time(function, queryset, options["repeat"])
+                    self.stdout.write(f"{scope:>6} {variant:>8} {best:>9.1f} {queries:>8}")
+                    if variant == "single" and queries != 1:
+                        raise CommandError(f"distribution_stats ran {queries} queries, expected 1")
+                if results["legacy"] != results["single"]:
+                    raise CommandError(f"Stats differ for scope {scope}: {results}")
+            self.stdout.write(self.style.SUCCESS("Results match; distribution_stats runs a single query."))
+
+    def _seed(self, rows, portal_count):
+        """The synthetic user owning `rows` distributions over `portal_count` portals."""
+        user = get_user_model().objects.create(username=BENCH_PREFIX, email=f"{BENCH_PREFIX}@example.com")
+
+        started = time.perf_counter()
+        portals = Portal.objects.bulk_create([
+            Portal(name=f"{BENCH_PREFIX}-{i}", base_url=f"https://{BENCH_PREFIX}-{i}.example.com")
+            for i in range(portal_count)
+        ])
+        post_count = -(-rows // portal_count)
+        posts = MasterNewsPost.objects.bulk_create(
+            [MasterNewsPost(title=f"{BENCH_PREFIX} {i}", slug=f"{BENCH_PREFIX}-{i}", created_by=user)
+             for i in range(post_count)],
+            batch_size=5000,
+        )
+
+        batch = []
+        for i in range(rows):
+            post, portal = posts[i // portal_count], portals[i % portal_count]
+            batch.append(NewsDistribution(
+                news_post=post, portal=portal, status=STATUSES[i % len(STATUSES)], retry_count=i % 4,
+            ))
+            if len(batch) == 10000:
+                NewsDistribution.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            NewsDistribution.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {rows} distribution rows in {time.perf_counter() - started:.1f}s")
+        return user
+
+    def _time(self, function, queryset, repeat):
+        """Best elapsed ms over `repeat` runs, queries per run and the result."""
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        best, result = None, None
+        for _ in range(repeat):
+            queries.clear()
+            with connection.execute_wrapper(count_query):
+                started = time.perf_counter()
+                result = function(queryset)
+                elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(queries), result
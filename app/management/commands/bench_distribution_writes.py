@@ -0,0 +1,73 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from app.benchmarks import scratch_database
+from app.models import MasterNewsPost, NewsDistribution, Portal
+from app.planner import PortalPlan
+from app.publishing import DistributionWriter, save_distribution
+
+BENCH_PREFIX = "bench-distribution-writes"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark persisting publish results row-at-a-time (save_distribution) "
+        "against the buffered bulk upsert (DistributionWriter). Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--portals", type=int, nargs="+", default=[10, 100, 1000],
+                            help="Portal counts to benchmark.")
+        parser.add_argument("--flush-size", type=int, default=None,
+                            help="DistributionWriter micro-batch size (default PUBLISH_RESULT_FLUSH_SIZE).")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = get_user_model().objects.create(username=BENCH_PREFIX, email=f"{BENCH_PREFIX}@example.com")
+            portals = Portal.objects.bulk_create([
+                Portal(name=f"{BENCH_PREFIX}-{i}", base_url=f"https://{BENCH_PREFIX}-{i}.example.com")
+                for i in range(max(options["portals"]))
+            ])
+
+            self.stdout.write(f"{'portals':>8} {'mode':>6} {'insert ms':>10} {'update ms':>10} {'queries':>8}")
+            for count in options["portals"]:
+                for mode in ("row", "bulk"):
+                    post = MasterNewsPost.objects.create(title=f"{BENCH_PREFIX} {mode} {count}", created_by=user)
+                    entries = [self._entry(portal, user) for portal in portals[:count]]
+                    insert_ms, _ = self._run(mode, post, entries, options["flush_size"])
+                    update_ms, queries = self._run(mode, post, entries, options["flush_size"])
+                    self.stdout.write(f"{count:>8} {mode:>6} {insert_ms:>10.1f} {update_ms:>10.1f} {queries:>8}")
+
+    def _entry(self, portal, user):
+        return PortalPlan(
+            portal=portal, portal_category=None, use_default_content=True, skipped=False,
+            prompt_text=None, prompt_source=None, rewrite_options=None, portal_user_id=1, publisher_id=user.id,
+            distribution_id=None, distribution_status=None,
+        )
+
+    def _run(self, mode, post, entries, flush_size):
+        """Persist one result per entry; returns (elapsed ms, queries run)."""
+        rewritten = (post.title, "short", "content", post.title, None)
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            started = time.perf_counter()
+            if mode == "row":
+                for entry in entries:
+                    save_distribution(post, entry, None, True, "OK", None, rewritten)
+            else:
+                writer = DistributionWriter(batch_size=flush_size)
+                for entry in entries:
+                    writer.add(post, entry, None, True, "OK", None, rewritten)
+                writer.flush()
+            elapsed = (time.perf_counter() - started) * 1000
+
+        assert NewsDistribution.objects.filter(news_post=post).count() == len(entries)
+        return elapsed, len(queries)
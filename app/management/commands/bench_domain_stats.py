@@ -0,0 +1,160 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from app.benchmarks import scratch_database
+from app.models import (
+    Group, MasterCategory, MasterCategoryMapping, MasterNewsPost, NewsDistribution, Portal, PortalCategory
+)
+from app.utils import get_portals_from_assignment
+from app.views import DomainDistributionStatsAPIView
+from user.models import Role, UserCategoryGroupAssignment, UserRole
+
+BENCH_PREFIX = "bench-domain-stats"
+STATUSES = ["SUCCESS"] * 7 + ["FAILED"] * 2 + ["PENDING", "DEAD"]
+
+
+def legacy_domain_stats(user, role_name):
+    """The previous DomainDistributionStatsAPIView.get: five queries per portal, one assignment walk per assignment."""
+    if role_name == "MASTER":
+        domains = Portal.objects.all()
+        scope = {}
+    else:
+        domains = set()
+        for assignment in UserCategoryGroupAssignment.objects.filter(user=user):
+            for portal, _ in get_portals_from_assignment(assignment):
+                domains.add(portal)
+        scope = {"news_post__created_by": user}
+
+    stats = []
+    for domain in domains:
+        distributions = NewsDistribution.objects.filter(portal=domain, **scope)
+        stats.append({
+            "portal_id": domain.id,
+            "portal_name": domain.name,
+            "total_distributions": distributions.count(),
+            "successful_distributions": distributions.filter(status="SUCCESS").count(),
+            "failed_distributions": distributions.filter(status="FAILED").count(),
+            "pending_distributions": distributions.filter(status="PENDING").count(),
+            "dead_distributions": distributions.filter(status="DEAD").count(),
+            "retry_counts": distributions.aggregate(total=Sum("retry_count"))["total"] or 0,
+        })
+    return stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the domain distribution stats endpoint against the previous per-portal queries for growing "
+        "portal counts, for MASTER and USER roles, and check the endpoint's query count stays constant. "
+        "Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--portals", type=int, nargs="+", default=[10, 50, 200],
+                            help="Portal counts to benchmark.")
+        parser.add_argument("--rows-per-portal", type=int, default=100, help="Distributions per portal.")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = DomainDistributionStatsAPIView.as_view()
+        endpoint_queries = {}
+
+        self.stdout.write(f"{'portals':>8} {'role':>7} {'variant':>9} {'ms':>9} {'queries':>8}")
+        with scratch_database():
+            for count in options["portals"]:
+                self._cleanup()
+                users = self._seed(count, options["rows_per_portal"])
+                for role_name, user in users.items():
+                    def endpoint():
+                        request = factory.get("/api/domain/distribution/")
+                        force_authenticate(request, user=user)
+                        return view(request).data["data"]
+
+                    legacy_ms, legacy_queries, legacy = self._measure(lambda: legacy_domain_stats(user, role_name))
+                    single_ms, single_queries, single = self._measure(endpoint)
+                    self.stdout.write(f"{count:>8} {role_name:>7} {'legacy':>9} {legacy_ms:>9.1f} {legacy_queries:>8}")
+                    self.stdout.write(f"{count:>8} {role_name:>7} {'endpoint':>9} {single_ms:>9.1f} {single_queries:>8}")
+
+                    def by_portal(stats):
+                        return sorted(stats, key=lambda item: item["portal_id"])
+
+                    if by_portal(legacy) != by_portal(single):
+                        raise CommandError(f"Stats differ for {role_name} with {count} portals")
+                    endpoint_queries.setdefault(role_name, set()).add(single_queries)
+
+        for role_name, counts in endpoint_queries.items():
+            if len(counts) != 1:
+                raise CommandError(f"{role_name} endpoint query count grows with portals: {sorted(counts)}")
+        self.stdout.write(self.style.SUCCESS("Results match; endpoint query counts are constant."))
+
+    def _seed(self, portal_count, rows_per_portal):
+        """
+        `portal_count` portals; a USER assigned half of them through a master
+        category and the rest through a group; a MASTER. Returns {role: user}.
+        """
+        User = get_user_model()
+        users = {}
+        for role_name in ("MASTER", "USER"):
+            user = User.objects.create(username=f"{BENCH_PREFIX}-{role_name.lower()}")
+            UserRole.objects.create(user=user, role=Role.objects.get_or_create(name=role_name)[0])
+            users[role_name] = user
+
+        portals = Portal.objects.bulk_create([
+            Portal(name=f"{BENCH_PREFIX}-{i}", base_url=f"https://{BENCH_PREFIX}-{i}.example.com")
+            for i in range(portal_count)
+        ])
+        categories = PortalCategory.objects.bulk_create([
+            PortalCategory(portal=portal, name=f"{BENCH_PREFIX}-{portal.id}", external_id="1") for portal in portals
+        ])
+        direct = MasterCategory.objects.create(name=f"{BENCH_PREFIX}-direct")
+        grouped = MasterCategory.objects.create(name=f"{BENCH_PREFIX}-grouped")
+        MasterCategoryMapping.objects.bulk_create([
+            MasterCategoryMapping(master_category=direct if i % 2 else grouped, portal_category=category)
+            for i, category in enumerate(categories)
+        ])
+        group = Group.objects.create(name=f"{BENCH_PREFIX}-group")
+        group.master_categories.add(grouped)
+        UserCategoryGroupAssignment.objects.create(user=users["USER"], master_category=direct)
+        UserCategoryGroupAssignment.objects.create(user=users["USER"], group=group)
+
+        posts = MasterNewsPost.objects.bulk_create([
+            MasterNewsPost(title=f"{BENCH_PREFIX} {i}", slug=f"{BENCH_PREFIX}-{i}", created_by=users["USER"])
+            for i in range(rows_per_portal)
+        ])
+        NewsDistribution.objects.bulk_create(
+            [
+                NewsDistribution(news_post=post, portal=portal, status=STATUSES[(i + j) % len(STATUSES)], retry_count=j % 3)
+                for i, portal in enumerate(portals)
+                for j, post in enumerate(posts)
+            ],
+            batch_size=5000,
+        )
+        return users
+
+    def _measure(self, function):
+        """(elapsed ms, queries run, result) of one call."""
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            started = time.perf_counter()
+            result = function()
+            elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, len(queries), result
+
+    def _cleanup(self):
+        User = get_user_model()
+        users = User.objects.filter(username__startswith=BENCH_PREFIX)
+        NewsDistribution.objects.filter(news_post__created_by__in=users).delete()
+        MasterNewsPost.objects.filter(created_by__in=users).delete()
+        Portal.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        MasterCategory.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        Group.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        users.delete()
@@ -0,0 +1,100 @@
+import json
+import time
+import uuid
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from app.benchmarks import scratch_database
+from app.html_segments import SegmentedHTML
+from app.models import MasterNewsPost
+from app.rewrite_prompts import shared_instructions
+from app.utils import estimate_tokens, estimate_variation_tokens, generate_variation_with_gpt
+
+SAMPLE_PARAGRAPH = (
+    '<p style="font-family: Georgia, serif; font-size: 18px; line-height: 1.7; color: #222222; margin: 0 0 16px;">'
+    'The city council on Tuesday approved a <strong>revised budget</strong> of '
+    '<span style="color: #b00020; font-weight: 600;">&#8377;1,240 crore</span> for the next fiscal year, '
+    'with officials saying the additional funds would go to '
+    '<a href="https://example.com/roads" target="_blank" rel="noopener noreferrer">road repairs</a> '
+    'and public transport.</p>'
+)
+SAMPLE_FIGURE = (
+    '<figure class="wp-block-image size-large" style="margin: 24px 0; text-align: center;">'
+    '<img src="https://cdn.example.com/uploads/2025/09/council-meeting-1200x800.jpg" alt="Council meeting" '
+    'width="1200" height="800" loading="lazy" style="max-width: 100%; height: auto; border-radius: 4px;" />'
+    '<figcaption style="font-size: 14px; color: #666666;">Councillors during the budget session.</figcaption>'
+    '</figure>'
+)
+
+
+def sample_article(paragraphs):
+    blocks = []
+    for index in range(paragraphs):
+        blocks.append(SAMPLE_PARAGRAPH)
+        if index % 4 == 3:
+            blocks.append(SAMPLE_FIGURE)
+    return "\n".join(blocks)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare GPT rewrite payloads with the full post HTML against HTML-aware segmentation "
+        "(text nodes only): estimated prompt/output tokens and, with --live, request latency "
+        "(the rewrites' cache entries and stats go to a throwaway test database)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=0,
+                            help="Also benchmark the N most recent posts from the database.")
+        parser.add_argument("--live", action="store_true",
+                            help="Call the OpenAI API once per article and mode to measure latency.")
+
+    def handle(self, *args, **options):
+        articles = [(f"sample-{n}p", "Council approves revised budget", sample_article(n)) for n in (4, 12, 40)]
+        posts = MasterNewsPost.objects.exclude(content="").order_by("-id")[:options["posts"]]
+        articles += [(f"post-{post.id}", post.title, post.content) for post in posts]
+
+        # Live rewrites record cache entries and stats: keep them out of the configured database
+        with scratch_database() if options["live"] else nullcontext():
+            self._report(articles, options["live"])
+
+    def _report(self, articles, live):
+        """One row of token estimates (and latencies with `live`) per (name, title, content) article."""
+        header = f"{'article':>14} {'html chars':>10} {'segments':>8} {'in tok full':>11} {'in tok seg':>10} " \
+                 f"{'out tok full':>12} {'out tok seg':>11} {'saved':>6}"
+        if live:
+            header += f" {'ms full':>8} {'ms seg':>8}"
+        self.stdout.write(header)
+
+        totals = [0, 0]
+        for name, title, content in articles:
+            segmented = SegmentedHTML(content)
+            body = json.dumps(segmented.segments, ensure_ascii=False)
+            full_in = estimate_tokens(shared_instructions(None), title, content)
+            seg_in = estimate_tokens(shared_instructions(segmented), title, body)
+            full_out = estimate_variation_tokens(title, "", content, title)
+            seg_out = estimate_variation_tokens(title, "", body, title)
+            totals[0] += full_in + full_out
+            totals[1] += seg_in + seg_out
+            saved = 1 - (seg_in + seg_out) / (full_in + full_out)
+
+            line = f"{name:>14} {len(content):>10} {len(segmented):>8} {full_in:>11} {seg_in:>10} " \
+                   f"{full_out:>12} {seg_out:>11} {saved:>6.0%}"
+            if live:
+                line += f" {self._latency(title, content, False):>8.0f} {self._latency(title, content, True):>8.0f}"
+            self.stdout.write(line)
+
+        if totals[0]:
+            self.stdout.write(f"Total estimated tokens: full {totals[0]}, segmented {totals[1]} "
+                              f"({1 - totals[1] / totals[0]:.0%} saved)")
+
+    def _latency(self, title, content, segments):
+        # A fresh portal name keeps earlier rewrites of the same article out of the measurement
+        portal_name = f"bench-{uuid.uuid4().hex[:8]}"
+        with override_settings(REWRITE_HTML_SEGMENTS=segments):
+            started = time.perf_counter()
+            generate_variation_with_gpt(title, title, content, "Rewrite the content slightly.", portal_name=portal_name)
+            elapsed = (time.perf_counter() - started) * 1000
+        return elapsed
@@ -0,0 +1,149 @@
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from app.benchmarks import scratch_database
+from app.models import MasterNewsPost, NewsDistribution, Portal
+from app.rollups import rebuild_rollups
+from app.stats import date_window, distribution_breakdown, rollup_distributions
+
+BENCH_PREFIX = "bench-stats-window"
+STATUSES = ["SUCCESS"] * 7 + ["FAILED"] * 2 + ["PENDING", "DEAD"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the stats date filters on synthetic history: the previous created_at__date lookups "
+        "against half-open created_at ranges (app.stats.DateWindow) and the daily rollups, for posts, one "
+        "author's posts and per-portal distribution counts. Checks every variant agrees and prints query plans. "
+        "Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=20_000, help="Synthetic posts.")
+        parser.add_argument("--portals", type=int, default=50, help="Portals each post is distributed to.")
+        parser.add_argument("--authors", type=int, default=20, help="Synthetic post authors.")
+        parser.add_argument("--days", type=int, default=365, help="Days of history the posts are spread over.")
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per variant (best is reported).")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            authors = self._seed(options)
+            author = authors[0]
+            today = timezone.localdate()
+            windows = [("today", 0), ("7 days", 6), ("30 days", 29)]
+
+            self.stdout.write(f"{'window':>8} {'query':>13} {'variant':>10} {'best ms':>9}  plan")
+            for label, span in windows:
+                window = date_window(today - timedelta(days=span), today)
+                date_cast = {"created_at__date__range": [window.first_day, window.last_day]}
+                scenarios = [
+                    ("posts", [
+                        ("date-cast", MasterNewsPost.objects.filter(**date_cast), "count"),
+                        ("half-open", MasterNewsPost.objects.filter(**window.lookup("created_at")), "count"),
+                    ]),
+                    ("author posts", [
+                        ("date-cast", MasterNewsPost.objects.filter(created_by=author, **date_cast), "count"),
+                        ("half-open", MasterNewsPost.objects.filter(created_by=author, **window.lookup("created_at")),
+                         "count"),
+                    ]),
+                    ("distributions", [
+                        ("date-cast", NewsDistribution.objects.filter(**date_cast), "breakdown"),
+                        ("half-open", NewsDistribution.objects.filter(**window.lookup("created_at")), "breakdown"),
+                        ("rollup", rollup_distributions(window), "breakdown"),
+                    ]),
+                ]
+                for query, variants in scenarios:
+                    results = []
+                    for variant, queryset, kind in variants:
+                        best, result = self._time(queryset, kind, options["repeat"])
+                        results.append(result)
+                        self.stdout.write(
+                            f"{label:>8} {query:>13} {variant:>10} {best:>9.1f}  {self._plan(queryset, kind)}"
+                        )
+                    if any(result != results[0] for result in results):
+                        raise CommandError(f"{query} over {label} differ between variants: {results}")
+            self.stdout.write(self.style.SUCCESS("All variants agree."))
+
+    def _seed(self, options):
+        """Synthetic authors, portals, posts spread over `days` and their distributions."""
+        User = get_user_model()
+        started = time.perf_counter()
+        User.objects.bulk_create([
+            User(username=f"{BENCH_PREFIX}-{i}", email=f"{BENCH_PREFIX}-{i}@example.com")
+            for i in range(options["authors"])
+        ])
+        authors = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by("id"))
+        portals = Portal.objects.bulk_create([
+            Portal(name=f"{BENCH_PREFIX}-{i}", base_url=f"https://{BENCH_PREFIX}-{i}.example.com")
+            for i in range(options["portals"])
+        ])
+
+        days = options["days"]
+        today = datetime.combine(timezone.localdate(), datetime.min.time())
+        per_day = -(-options["posts"] // days)
+        created = 0
+        for day in range(days):
+            count = min(per_day, options["posts"] - created)
+            if count <= 0:
+                break
+            with transaction.atomic():
+                posts = MasterNewsPost.objects.bulk_create([
+                    MasterNewsPost(
+                        title=f"{BENCH_PREFIX} {created + i}", slug=f"{BENCH_PREFIX}-{created + i}",
+                        created_by=authors[(created + i) % len(authors)],
+                    )
+                    for i in range(count)
+                ])
+                NewsDistribution.objects.bulk_create(
+                    [
+                        NewsDistribution(
+                            news_post=post, portal=portal,
+                            status=STATUSES[(post.id + j) % len(STATUSES)], retry_count=(post.id + j) % 3,
+                        )
+                        for post in posts
+                        for j, portal in enumerate(portals)
+                    ],
+                    batch_size=5000,
+                )
+                # auto_now_add stamps "now": move each post and its distributions back to its day,
+                # spread over four times of day
+                for quarter in range(4):
+                    ids = [post.id for post in posts[quarter::4]]
+                    stamp = timezone.make_aware(today - timedelta(days=day) + timedelta(hours=6 * quarter + 3))
+                    MasterNewsPost.objects.filter(id__in=ids).update(created_at=stamp)
+                    NewsDistribution.objects.filter(news_post_id__in=ids).update(created_at=stamp)
+            created += count
+
+        rebuild_rollups()
+        self.stdout.write(
+            f"Seeded {created} posts / {created * len(portals)} distributions over {days} days "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return authors
+
+    def _run(self, queryset, kind):
+        return queryset.count() if kind == "count" else distribution_breakdown(queryset)
+
+    def _time(self, queryset, kind, repeat):
+        """Best elapsed ms over `repeat` runs and the result."""
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = self._run(queryset.all(), kind)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def _plan(self, queryset, kind):
+        """The database's plan for one variant's query, on one line."""
+        if kind == "count":
+            queryset = queryset.values("pk")
+        else:
+            queryset = queryset.order_by().values("portal_id").annotate(rows=Count("pk"))
+        return " | ".join(line.strip() for line in queryset.explain().splitlines())
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily distribution rollups behind the stats endpoints from NewsDistribution "
+        "(backfill after deploying them, or repair drift after rows were changed outside the publish code)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only rebuild days from this date on (YYYY-MM-DD). Default: every day.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_date(options["since"])
+            if since is None:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+
+        started = time.perf_counter()
+        written = rebuild_rollups(since=since)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} rollup rows in {time.perf_counter() - started:.1f}s"
+        ))
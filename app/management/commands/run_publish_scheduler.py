@@ -0,0 +1,81 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from app.portal_client import close_portal_clients
+from app.scheduling import fire_due, next_wakeup, prepare_due
+
+
+class Command(BaseCommand):
+    help = (
+        "Publish scheduled posts on time: pre-generate their AI variations ahead of "
+        "schedule_date and queue their publish jobs when due (run_publish_worker delivers them)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-sleep", type=float, default=settings.SCHEDULED_PUBLISH_POLL_INTERVAL,
+                            help="Longest sleep between checks, so newly created schedules are noticed.")
+        parser.add_argument("--once", action="store_true",
+                            help="Fire and prepare everything currently due and exit.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Publish scheduler started")
+
+        if options["once"]:
+            try:
+                self._fire()
+                self._prepare()
+            finally:
+                close_portal_clients()
+            return
+
+        # Preparation makes blocking GPT calls: it gets its own thread so it never delays firing
+        stop = threading.Event()
+        preparer = threading.Thread(
+            target=self._prepare_until, args=(stop, options["max_sleep"]), name="schedule-prepare", daemon=True
+        )
+        preparer.start()
+        try:
+            while True:
+                self._fire()
+
+                # Sleep until the next schedule falls due, bounded by --max-sleep
+                wakeup = next_wakeup(prepare=False)
+                delay = options["max_sleep"]
+                if wakeup is not None:
+                    delay = min(delay, max((wakeup - timezone.now()).total_seconds(), 0))
+                if delay:
+                    time.sleep(delay)
+        finally:
+            stop.set()
+            preparer.join(timeout=options["max_sleep"])
+            close_portal_clients()
+
+    def _fire(self):
+        for schedule in fire_due():
+            job = f"job #{schedule.job_id}" if schedule.job_id else "no job"
+            self.stdout.write(f"Schedule #{schedule.id} (post {schedule.news_post_id}): {schedule.status}, {job}")
+
+    def _prepare(self):
+        prepared = prepare_due()
+        for schedule in prepared:
+            self.stdout.write(f"Schedule #{schedule.id} (post {schedule.news_post_id}): variations prepared")
+        return prepared
+
+    def _prepare_until(self, stop, max_sleep):
+        """Prepare schedules entering their preparation window until `stop` is set."""
+        try:
+            while not stop.is_set():
+                try:
+                    prepared = self._prepare()
+                except Exception as e:
+                    self.stderr.write(f"Preparing scheduled publishes failed: {e}")
+                    prepared = []
+                if not prepared:
+                    stop.wait(max_sleep)
+        finally:
+            connection.close()
@@ -0,0 +1,48 @@
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.portal_client import close_portal_clients
+from app.publishing import generate_pending_drafts, lease_tasks, run_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued publish tasks (portal rewrites + deliveries) in the background; "
+        "when no task is waiting, generate requested draft variations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.PUBLISH_WORKER_BATCH_SIZE,
+                            help="Maximum number of tasks leased per poll.")
+        parser.add_argument("--poll-interval", type=float, default=settings.PUBLISH_WORKER_POLL_INTERVAL,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Drain the queue once and exit instead of polling forever.")
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Publish worker {worker_id} started")
+
+        try:
+            while True:
+                tasks = lease_tasks(worker_id, limit=options["batch_size"])
+
+                for task, result in zip(tasks, run_tasks(tasks)):
+                    self.stdout.write(
+                        f"Job #{task.job_id} -> {task.portal.name}: {'SUCCESS' if result['success'] else 'FAILED'}"
+                    )
+
+                drafts = [] if tasks else generate_pending_drafts(limit=options["batch_size"])
+                for draft, new_status in drafts:
+                    self.stdout.write(f"Draft #{draft.id} (post {draft.news_post_id}) -> {draft.portal.name}: {new_status}")
+
+                if not tasks and not drafts:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        finally:
+            close_portal_clients()
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.portal_client import close_portal_clients
+from app.retries import run_due_retries
+
+
+class Command(BaseCommand):
+    help = "Retry FAILED/PENDING news distributions with exponential backoff, dead-lettering after the retry limit."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.PUBLISH_WORKER_BATCH_SIZE,
+                            help="Maximum number of distributions retried per poll.")
+        parser.add_argument("--poll-interval", type=float, default=settings.PUBLISH_WORKER_POLL_INTERVAL,
+                            help="Seconds to sleep when nothing is due.")
+        parser.add_argument("--once", action="store_true",
+                            help="Retry everything currently due and exit.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Retry scheduler started")
+
+        try:
+            while True:
+                retried = run_due_retries(limit=options["batch_size"])
+
+                for distribution, new_status in retried:
+                    self.stdout.write(
+                        f"Distribution #{distribution.id} -> {distribution.portal.name}: {new_status}"
+                    )
+
+                if not retried:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        finally:
+            close_portal_clients()
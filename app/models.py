@@ -31,11 +31,28 @@ class BaseModel(models.Model):
 
 class Portal(BaseModel):
     """Represents an external news portal (other Django project)."""
+
+    IMAGE_FORMAT_CHOICES = (
+        ("ORIGINAL", "Original"),
+        ("JPEG", "JPEG"),
+        ("WEBP", "WebP"),
+        ("PNG", "PNG"),
+    )
+
     name = models.CharField(max_length=150, unique=True)
     base_url = models.URLField(help_text="API's url ex: https://domain.com/portal_name")
     domain_url = models.URLField(help_text="Just the domain url ex: https://domain.com", null=True)
     api_key = models.CharField(max_length=255)
     secret_key = models.CharField(max_length=255)
+    request_timeout = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Seconds to wait for this portal's API. Empty = PORTAL_HTTP_TIMEOUT."
+    )
+
+    # Image variant pushed to /api/create-news/ (see app.post_images)
+    image_max_width = models.PositiveIntegerField(null=True, blank=True)
+    image_max_height = models.PositiveIntegerField(null=True, blank=True)
+    image_format = models.CharField(max_length=10, choices=IMAGE_FORMAT_CHOICES, default="ORIGINAL")
+    image_quality = models.PositiveSmallIntegerField(default=85, help_text="1-100, used for JPEG/WebP variants.")
 
     def __str__(self):
         return self.name
@@ -140,6 +157,13 @@ class MasterNewsPost(BaseModel):
         max_length=20, choices=STATUS_CHOICES, default="PUBLISHED"
     )
 
+    class Meta:
+        indexes = [
+            # Half-open created_at windows of the stats endpoints (app.stats.DateWindow), all posts / one author's
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["created_by", "created_at"]),
+        ]
+
     def __str__(self):
         return self.title
     
@@ -187,20 +211,61 @@ class NewsDistribution(BaseModel):
 
     status = models.CharField(
         max_length=20,
-        choices=(("PENDING", "Pending"), ("SUCCESS", "Success"), ("FAILED", "Failed")),
+        choices=(("PENDING", "Pending"), ("SUCCESS", "Success"), ("FAILED", "Failed"), ("DEAD", "Dead letter")),
         default="PENDING"
     )
     response_message = models.TextField(null=True, blank=True)
     sent_at = models.DateTimeField(auto_now_add=True)
     retry_count = models.PositiveIntegerField(default=0)
+    published_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="published_distributions",
+        help_text="User whose portal account delivered this row; retries deliver as the same account."
+    )
+    next_retry_at = models.DateTimeField(
+        null=True, blank=True, db_index=True,
+        help_text="When the retry scheduler should re-deliver this row (also used as its lease)."
+    )
     
     class Meta:
         unique_together = ("news_post", "portal")
+        indexes = [
+            # Covers the per-portal status counts and retry sums of app.stats
+            models.Index(fields=["portal", "status", "retry_count"]),
+            # created_at windows over distributions (rollup rebuilds with --since, date-bounded scans)
+            models.Index(fields=["created_at", "status", "portal"]),
+        ]
 
     def __str__(self):
         return f"{self.news_post.title} -> {self.portal.name}"
 
 
+class DistributionDailyRollup(models.Model):
+    """
+    NewsDistribution counts and retry sums per (created day, portal, post author,
+    master category, status). Kept current by app.rollups on every distribution
+    write; rebuilt from scratch by `manage.py rebuild_distribution_rollups`.
+    """
+    day = models.DateField(help_text="Local date of the distribution's created_at.")
+    portal = models.ForeignKey(Portal, on_delete=models.CASCADE, related_name="distribution_rollups")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="distribution_rollups")
+    master_category = models.ForeignKey(
+        MasterCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name="distribution_rollups"
+    )
+    status = models.CharField(max_length=20)
+    count = models.BigIntegerField(default=0)
+    retry_sum = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("day", "portal", "author", "master_category", "status")
+        indexes = [
+            models.Index(fields=["author", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.portal_id} {self.status}: {self.count}"
+
+
 class PortalPrompt(models.Model):
     """Stores custom AI rewrite prompts for each portal (or globally)."""
     portal = models.OneToOneField(
@@ -220,6 +285,29 @@ class PortalPrompt(models.Model):
     )
     created_at = models.DateTimeField(default=timezone.now)
 
+    # Long articles are rewritten in concurrent chunks (see app.utils.generate_chunked_variation)
+    chunk_chars = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Max characters of article text per rewrite chunk. Empty = REWRITE_CHUNK_CHARS."
+    )
+    chunk_parallelism = models.PositiveSmallIntegerField(
+        null=True, blank=True, help_text="Chunks rewritten at the same time. Empty = REWRITE_CHUNK_PARALLELISM."
+    )
+
+    # Model choice and latency SLO (see app.rewrite_service.RewriteService.ahedged_response)
+    model = models.CharField(
+        max_length=100, blank=True, default="", help_text="OpenAI model for rewrites. Empty = OPENAI_REWRITE_MODEL."
+    )
+    fallback_model = models.CharField(
+        max_length=100, blank=True, default="",
+        help_text="Model of the hedged request sent when the first one is slow. Empty = OPENAI_FALLBACK_MODEL, "
+                  "or the same model.",
+    )
+    latency_budget_ms = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Latency budget of one rewrite request; a hedged request is sent at the model's p95 latency "
+                  "or at this budget, whichever comes first. Empty = REWRITE_LATENCY_BUDGET_MS.",
+    )
+
     class Meta:
         verbose_name = "Portal Prompt"
         verbose_name_plural = "Portal Prompts"
@@ -249,3 +337,232 @@ class PortalPrompt(models.Model):
         if self.is_global_prompt:
             return f"🌍 Global Prompt: {self.name}"
         return f"{self.portal.name} Prompt"
+
+
+class DraftVariation(BaseModel):
+    """
+    A portal's AI variation of a MasterNewsPost generated ahead of publishing
+    (see app.drafts). `key` is the rewrite-cache key of the inputs it was made
+    from, so a draft is only used while the post and prompt are unchanged.
+    """
+
+    STATUS_CHOICES = (
+        ("PENDING", "Pending"),
+        ("GENERATING", "Generating"),
+        ("READY", "Ready"),
+        ("FAILED", "Failed"),
+    )
+
+    news_post = models.ForeignKey(MasterNewsPost, on_delete=models.CASCADE, related_name="draft_variations")
+    portal = models.ForeignKey(Portal, on_delete=models.CASCADE, related_name="draft_variations")
+    key = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PENDING")
+
+    ai_title = models.CharField(max_length=255, null=True, blank=True)
+    ai_short_description = models.CharField(max_length=300, null=True, blank=True)
+    ai_content = models.TextField(null=True, blank=True)
+    ai_meta_title = models.CharField(max_length=255, null=True, blank=True)
+    ai_slug = models.SlugField(max_length=255, null=True, blank=True)
+    generated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("news_post", "portal")
+        indexes = [
+            models.Index(fields=["status", "updated_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.news_post.title} -> {self.portal.name} ({self.status})"
+
+
+class PublishJob(BaseModel):
+    """
+    A background request to publish a MasterNewsPost to every portal
+    mapped under a master category. Holds one PublishTask per portal.
+    """
+
+    STATUS_CHOICES = (
+        ("QUEUED", "Queued"),
+        ("RUNNING", "Running"),
+        ("COMPLETED", "Completed"),
+    )
+
+    news_post = models.ForeignKey(MasterNewsPost, on_delete=models.CASCADE, related_name="publish_jobs")
+    master_category = models.ForeignKey(
+        MasterCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name="publish_jobs"
+    )
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="publish_jobs")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="QUEUED")
+    total_tasks = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job #{self.pk} - {self.news_post.title} ({self.status})"
+
+
+class ScheduledPublish(BaseModel):
+    """
+    A publish of a MasterNewsPost deferred until `publish_at` (the post's schedule_date).
+    The `run_publish_scheduler` process pre-generates the AI variations shortly
+    before (PENDING -> PREPARED) and queues the PublishJob on time (-> FIRED).
+    """
+
+    STATUS_CHOICES = (
+        ("PENDING", "Pending"),
+        ("PREPARED", "Prepared"),
+        ("FIRED", "Fired"),
+        ("CANCELLED", "Cancelled"),
+        ("FAILED", "Failed"),
+    )
+
+    news_post = models.ForeignKey(MasterNewsPost, on_delete=models.CASCADE, related_name="scheduled_publishes")
+    master_category = models.ForeignKey(
+        MasterCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name="scheduled_publishes"
+    )
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="scheduled_publishes")
+    excluded_portals = models.JSONField(default=list, blank=True)
+
+    publish_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PENDING")
+    prepared_at = models.DateTimeField(null=True, blank=True)
+    fired_at = models.DateTimeField(null=True, blank=True)
+    job = models.ForeignKey(
+        PublishJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="scheduled_publishes"
+    )
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # "next due" lookups: WHERE status IN (...) ORDER BY publish_at
+            models.Index(fields=["status", "publish_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.news_post.title} @ {self.publish_at} ({self.status})"
+
+
+class PublishTask(BaseModel):
+    """
+    A single portal delivery inside a PublishJob.
+    Workers lease QUEUED tasks (or RUNNING tasks whose lease expired),
+    run the rewrite + delivery and write the result into NewsDistribution.
+    """
+
+    STATUS_CHOICES = (
+        ("QUEUED", "Queued"),
+        ("RUNNING", "Running"),
+        ("SUCCESS", "Success"),
+        ("FAILED", "Failed"),
+        ("SKIPPED", "Skipped"),
+    )
+
+    job = models.ForeignKey(PublishJob, on_delete=models.CASCADE, related_name="tasks")
+    portal = models.ForeignKey(Portal, on_delete=models.CASCADE, related_name="publish_tasks")
+    portal_category = models.ForeignKey(PortalCategory, on_delete=models.SET_NULL, null=True, blank=True)
+    use_default_content = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="QUEUED")
+    attempts = models.PositiveIntegerField(default=0)
+    worker_id = models.CharField(max_length=100, null=True, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    response_message = models.TextField(null=True, blank=True)
+    rewritten_at = models.DateTimeField(null=True, blank=True, help_text="When the portal's variation was ready.")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "leased_until"]),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.job_id} -> {self.portal.name} ({self.status})"
+
+
+class RewriteCacheEntry(models.Model):
+    """
+    Cached GPT variation, keyed by a hash of everything that shapes the output
+    (post fields, prompt text, portal and model). Evicted by TTL and LRU.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    portal_name = models.CharField(max_length=150, null=True, blank=True)
+    model = models.CharField(max_length=100)
+    result = models.JSONField(help_text="[title, short_description, description, meta_title, slug]")
+    generation_ms = models.PositiveIntegerField(default=0, help_text="Latency of the GPT call that produced this entry.")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.portal_name} [{self.model}] {self.key[:12]}"
+
+
+class RewriteCacheStats(models.Model):
+    """Single-row counters for the rewrite cache (hits, misses, GPT time saved)."""
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    saved_ms = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Rewrite cache stats"
+
+    def __str__(self):
+        return f"hits={self.hits} misses={self.misses}"
+
+
+class RewriteStats(models.Model):
+    """Single-row counters for GPT rewrite replies (JSON parsing, field retries, hedged requests, token usage)."""
+    replies = models.PositiveBigIntegerField(default=0)
+    invalid_replies = models.PositiveBigIntegerField(default=0, help_text="Replies with missing or empty fields.")
+    undecodable_replies = models.PositiveBigIntegerField(default=0, help_text="Replies with no JSON object at all.")
+    invalid_fields = models.PositiveBigIntegerField(default=0)
+    retried_fields = models.PositiveBigIntegerField(default=0)
+    recovered_fields = models.PositiveBigIntegerField(default=0)
+    parse_ms = models.FloatField(default=0)
+    hedged_requests = models.PositiveBigIntegerField(default=0, help_text="Requests that fired a hedged duplicate.")
+    hedge_wins = models.PositiveBigIntegerField(default=0, help_text="Hedged requests answered by the duplicate.")
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    cached_input_tokens = models.PositiveBigIntegerField(default=0, help_text="Input tokens served from the prompt cache.")
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Rewrite stats"
+
+    def __str__(self):
+        return f"replies={self.replies} invalid={self.invalid_replies}"
+
+
+class PortalHealth(models.Model):
+    """
+    Circuit breaker state and health score of a portal, shared by every
+    web/worker process. Fed by the outcome of each outbound portal call.
+    """
+
+    STATE_CHOICES = (
+        ("CLOSED", "Closed"),        # Calls flow normally
+        ("OPEN", "Open"),            # Portal is failing, calls fail fast
+        ("HALF_OPEN", "Half open"),  # One probe call allowed to test recovery
+    )
+
+    portal = models.OneToOneField(Portal, on_delete=models.CASCADE, related_name="health")
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default="CLOSED")
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveBigIntegerField(default=0)
+    failure_count = models.PositiveBigIntegerField(default=0)
+    health_score = models.FloatField(default=1.0, help_text="Moving average of call success (1 = healthy).")
+    avg_latency_ms = models.FloatField(default=0)
+    opened_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Portal health"
+
+    def __str__(self):
+        return f"{self.portal.name} ({self.state})"
@@ -0,0 +1,153 @@
+from collections import namedtuple
+
+from django.db.models import Q
+
+from .models import MasterCategoryMapping, NewsDistribution, PortalPrompt
+from .utils import RewriteOptions
+from user.models import PortalUserMapping
+
+DEFAULT_PROMPT_TEXT = "Rewrite the content slightly for clarity and engagement."
+
+# One portal delivery as resolved by the planner.
+PortalPlan = namedtuple("PortalPlan", [
+    "portal",
+    "portal_category",
+    "use_default_content",
+    "skipped",
+    "prompt_text",          # None for use_default_content mappings
+    "prompt_source",        # "PORTAL", "GLOBAL", "DEFAULT" or None
+    "rewrite_options",      # RewriteOptions of the resolved prompt
+    "portal_user_id",       # None when the user has no MATCHED account on the portal
+    "publisher_id",         # User publishing the post (owner of portal_user_id)
+    "distribution_id",      # Existing NewsDistribution for (post, portal), if any
+    "distribution_status",
+])
+
+
+class PublishPlan:
+    """
+    Everything needed to publish a post to a set of portals, resolved up front
+    in a constant number of queries: mappings, prompts (portal-specific with
+    global fallback), the user's portal accounts and existing distributions.
+    """
+
+    def __init__(self, news_post, master_category_id, user, entries):
+        self.news_post = news_post
+        self.master_category_id = master_category_id
+        self.user = user
+        self.entries = entries
+
+    @classmethod
+    def for_targets(cls, news_post, master_category_id, user, targets):
+        """
+        Plan an explicit list of (portal, portal_category, use_default_content, skipped) targets.
+        Runs three queries regardless of how many portals are targeted.
+        """
+        portal_ids = {portal.id for portal, _, _, _ in targets}
+
+        portal_prompts = {}
+        global_prompt = None
+        prompts = PortalPrompt.objects.filter(is_active=True).filter(
+            Q(portal_id__in=portal_ids) | Q(portal__isnull=True)
+        ).order_by("id")
+        for prompt in prompts:
+            if prompt.portal_id is None:
+                global_prompt = global_prompt or prompt
+            else:
+                portal_prompts.setdefault(prompt.portal_id, prompt)
+
+        portal_user_ids = {}
+        user_mappings = PortalUserMapping.objects.filter(
+            user=user, portal_id__in=portal_ids, status="MATCHED"
+        ).order_by("id").values_list("portal_id", "portal_user_id")
+        for portal_id, portal_user_id in user_mappings:
+            portal_user_ids.setdefault(portal_id, portal_user_id)
+
+        distributions = {
+            row["portal_id"]: row
+            for row in NewsDistribution.objects.filter(
+                news_post=news_post, portal_id__in=portal_ids
+            ).values("portal_id", "id", "status")
+        }
+
+        entries = []
+        for portal, portal_category, use_default_content, skipped in targets:
+            if use_default_content:
+                prompt, prompt_source = None, None
+            elif portal.id in portal_prompts:
+                prompt, prompt_source = portal_prompts[portal.id], "PORTAL"
+            elif global_prompt:
+                prompt, prompt_source = global_prompt, "GLOBAL"
+            else:
+                prompt, prompt_source = None, "DEFAULT"
+            prompt_text = prompt.prompt_text if prompt else (DEFAULT_PROMPT_TEXT if prompt_source else None)
+
+            distribution = distributions.get(portal.id) or {}
+            entries.append(PortalPlan(
+                portal=portal,
+                portal_category=portal_category,
+                use_default_content=use_default_content,
+                skipped=skipped,
+                prompt_text=prompt_text,
+                prompt_source=prompt_source,
+                rewrite_options=RewriteOptions.from_prompt(prompt),
+                portal_user_id=portal_user_ids.get(portal.id),
+                publisher_id=user.id,
+                distribution_id=distribution.get("id"),
+                distribution_status=distribution.get("status"),
+            ))
+
+        return cls(news_post, master_category_id, user, entries)
+
+    def to_dict(self):
+        """Dry-run view of the plan, one row per portal in delivery order."""
+        portals = []
+        for entry in self.entries:
+            if entry.skipped:
+                action = "SKIP"
+            elif entry.portal_user_id is None:
+                action = "NO_USER_MAPPING"
+            else:
+                action = "PUBLISH"
+            portals.append({
+                "portal_id": entry.portal.id,
+                "portal": entry.portal.name,
+                "category": entry.portal_category.name if entry.portal_category else None,
+                "action": action,
+                "use_default_content": entry.use_default_content,
+                "prompt_source": entry.prompt_source,
+                "portal_user_id": entry.portal_user_id,
+                "existing_distribution_id": entry.distribution_id,
+                "existing_distribution_status": entry.distribution_status,
+            })
+
+        return {
+            "news_post": self.news_post.id,
+            "master_category": self.master_category_id,
+            "total_portals": len(self.entries),
+            "to_publish": sum(1 for row in portals if row["action"] == "PUBLISH"),
+            "gpt_rewrites": sum(
+                1 for entry in self.entries if not entry.skipped and not entry.use_default_content
+            ),
+            "portals": portals,
+        }
+
+
+def build_publish_plan(news_post, master_category_id, user, excluded_portals=None):
+    """
+    Plan a publish of `news_post` to every portal mapped under `master_category_id`.
+    Portals listed in `excluded_portals` (by id or name) are kept in the plan as skipped.
+    Four queries in total, however many portals are mapped.
+    """
+    excluded_portals = excluded_portals or []
+    mappings = MasterCategoryMapping.objects.filter(
+        master_category_id=master_category_id
+    ).select_related("portal_category", "portal_category__portal").order_by("id")
+
+    targets = []
+    for mapping in mappings:
+        portal = mapping.portal_category.portal
+        skipped = portal.id in excluded_portals or portal.name in excluded_portals
+        targets.append((portal, mapping.portal_category, mapping.use_default_content, skipped))
+
+    return PublishPlan.for_targets(news_post, master_category_id, user, targets)
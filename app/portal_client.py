@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+from .circuit_breaker import CircuitOpenError, allow_request, record_failure, record_success
+
+logger = logging.getLogger("publish")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        return True
+    except ImportError:
+        return False
+
+
+class PortalClient:
+    """
+    Keep-alive HTTP client for one portal `base_url`.
+
+    Connections are pooled and reused across publishes, tag lookups and
+    username checks. Uses httpx with HTTP/2 when PORTAL_HTTP2 is enabled
+    (and the `h2` package is installed), otherwise a pooled requests.Session.
+    """
+
+    def __init__(self, base_url, pool_size=None, http2=None):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.pool_size = pool_size or settings.PORTAL_HTTP_POOL_SIZE
+        http2 = settings.PORTAL_HTTP2 if http2 is None else http2
+
+        if http2 and not _http2_available():
+            logger.warning("PORTAL_HTTP2 is enabled but 'h2' is not installed; using HTTP/1.1 for %s", base_url)
+            http2 = False
+        self.http2 = http2
+
+        if self.http2:
+            import httpx
+            self._session = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+        else:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+
+    def url(self, path):
+        return urljoin(self.base_url, path.lstrip("/"))
+
+    def request(self, method, path, timeout=None, data=None, **kwargs):
+        timeout = timeout or settings.PORTAL_HTTP_TIMEOUT
+        if data is not None:
+            # requests drops None form values; keep httpx consistent with that
+            data = {key: value for key, value in data.items() if value is not None}
+        return self._session.request(method, self.url(path), timeout=timeout, data=data, **kwargs)
+
+    def post_multipart(self, path, fields, image=None, timeout=None):
+        """
+        POST form `fields` plus an optional PostImage as multipart/form-data.
+        The image part is pre-encoded once and shared by every portal upload.
+        """
+        if image is None:
+            return self.post(path, data=fields, timeout=timeout)
+
+        body = image.multipart_body(fields)
+        headers = {"Content-Type": body.content_type, "Content-Length": str(len(body))}
+        timeout = timeout or settings.PORTAL_HTTP_TIMEOUT
+        if self.http2:
+            return self._session.request("POST", self.url(path), content=body, headers=headers, timeout=timeout)
+        return self._session.request("POST", self.url(path), data=body, headers=headers, timeout=timeout)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self._session.close()
+
+
+class GuardedPortalClient:
+    """
+    A portal's pooled PortalClient behind its circuit breaker.
+
+    Calls to a portal whose circuit is open raise CircuitOpenError without
+    touching the network. Every completed call feeds the breaker: exceptions
+    and 5xx responses count as failures, anything else as success.
+    """
+
+    def __init__(self, portal, client):
+        self.portal = portal
+        self.client = client
+
+    def _call(self, method, *args, **kwargs):
+        if not allow_request(self.portal):
+            raise CircuitOpenError(f"Circuit open for portal {self.portal.name}; call skipped.")
+
+        started = time.monotonic()
+        try:
+            response = getattr(self.client, method)(*args, **kwargs)
+        except Exception as e:
+            record_failure(self.portal, (time.monotonic() - started) * 1000, e)
+            raise
+
+        latency_ms = (time.monotonic() - started) * 1000
+        if response.status_code >= 500:
+            record_failure(self.portal, latency_ms, f"HTTP {response.status_code}")
+        else:
+            record_success(self.portal, latency_ms)
+        return response
+
+    def get(self, path, **kwargs):
+        return self._call("get", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self._call("post", path, **kwargs)
+
+    def post_multipart(self, path, fields, image=None, timeout=None):
+        return self._call("post_multipart", path, fields, image=image, timeout=timeout)
+
+
+def get_pooled_client(base_url):
+    """Shared PortalClient for `base_url`."""
+    key = base_url.rstrip("/")
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = PortalClient(base_url)
+    return client
+
+
+def get_portal_client(portal):
+    """Client for `portal`: the pooled connection for its base_url, guarded by its circuit breaker."""
+    return GuardedPortalClient(portal, get_pooled_client(portal.base_url))
+
+
+def portal_timeout(portal, default=None):
+    """Per-portal timeout override, else the caller's default, else PORTAL_HTTP_TIMEOUT."""
+    return getattr(portal, "request_timeout", None) or default or settings.PORTAL_HTTP_TIMEOUT
+
+
+def close_portal_clients():
+    """Close every pooled connection (e.g. when a worker shuts down)."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,226 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import uuid
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .models import Portal
+
+logger = logging.getLogger("publish")
+
+# Variants live under MEDIA_ROOT/<VARIANT_DIR>/<sha256 of original>/<spec>.<ext>
+VARIANT_DIR = "post_variants"
+
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+
+class MultipartBody:
+    """
+    A multipart/form-data body assembled from pre-encoded parts.
+
+    Iterating yields the encoded form fields, then the shared file part
+    bytes as-is (no copy), then the closing boundary. `len()` gives the
+    Content-Length so HTTP clients stream it without chunked encoding.
+    """
+
+    def __init__(self, boundary, fields, file_parts=()):
+        self.boundary = boundary
+        self._chunks = [_encode_fields(boundary, fields)]
+        for part in file_parts:
+            self._chunks.extend(part.chunks)
+        self._chunks.append(f"--{boundary}--\r\n".encode())
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks)
+
+
+def _encode_fields(boundary, fields):
+    lines = []
+    for name, value in fields.items():
+        if value is None:
+            continue
+        lines.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        )
+    return "".join(lines).encode("utf-8")
+
+
+class EncodedFilePart:
+    """A file field encoded once (header + raw bytes) for reuse in many bodies."""
+
+    def __init__(self, boundary, field_name, filename, content, content_type):
+        self.field_name = field_name
+        self.filename = filename
+        self.content = content
+        filename = filename.replace('"', "%22")
+        header = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self.chunks = (header, content, b"\r\n")
+
+
+class ImageSpec(namedtuple("ImageSpec", ["max_width", "max_height", "format", "quality"])):
+    """Size/format bounds a portal wants for uploaded images."""
+
+    @classmethod
+    def from_portal(cls, portal):
+        """The portal's spec, or None when it accepts the original upload as-is."""
+        image_format = getattr(portal, "image_format", "ORIGINAL") or "ORIGINAL"
+        max_width = getattr(portal, "image_max_width", None)
+        max_height = getattr(portal, "image_max_height", None)
+        if image_format == "ORIGINAL" and not max_width and not max_height:
+            return None
+        return cls(max_width, max_height, image_format, getattr(portal, "image_quality", None) or 85)
+
+    def cache_name(self, original_format):
+        image_format = original_format if self.format == "ORIGINAL" else self.format
+        extension = FORMAT_EXTENSIONS.get(image_format, (image_format or "img").lower())
+        return f"{self.max_width or 0}x{self.max_height or 0}-q{self.quality}.{extension}"
+
+
+def render_variant(content, spec):
+    """Resize `content` to fit within the spec's bounds and re-encode it. Returns (bytes, format)."""
+    with Image.open(BytesIO(content)) as image:
+        original_format = image.format
+        image = ImageOps.exif_transpose(image)
+        if spec.max_width or spec.max_height:
+            image.thumbnail(
+                (spec.max_width or image.width, spec.max_height or image.height),
+                Image.Resampling.LANCZOS,
+            )
+
+        image_format = original_format if spec.format == "ORIGINAL" else spec.format
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        output = BytesIO()
+        image.save(output, format=image_format, quality=spec.quality, optimize=True)
+        return output.getvalue(), image_format
+
+
+def get_variant(content, content_hash, spec):
+    """
+    Return (storage_name, bytes) of the variant of `content` for `spec`,
+    generating and caching it under MEDIA_ROOT on first use.
+    """
+    with Image.open(BytesIO(content)) as image:
+        original_format = image.format
+    name = f"{VARIANT_DIR}/{content_hash}/{spec.cache_name(original_format)}"
+
+    if default_storage.exists(name):
+        with default_storage.open(name, "rb") as variant_file:
+            return name, variant_file.read()
+
+    variant, _ = render_variant(content, spec)
+    default_storage.save(name, ContentFile(variant))
+    return name, variant
+
+
+def portal_image_specs(portals):
+    """Distinct ImageSpecs requested by `portals` (portals wanting the original are left out)."""
+    specs = []
+    for portal in portals:
+        spec = ImageSpec.from_portal(portal)
+        if spec and spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def generate_post_image_variants(news_post, portals=None):
+    """
+    Pre-generate the image variants `portals` (default: every portal with an
+    image spec) need for `news_post`, so publishing only reads them from the cache.
+    Never raises: a failure here must not block saving the post.
+    """
+    if portals is None:
+        portals = Portal.objects.exclude(
+            image_format="ORIGINAL", image_max_width__isnull=True, image_max_height__isnull=True
+        )
+    try:
+        image = PostImage.load(news_post)
+        if image is None:
+            return []
+        return [image.variant(spec).filename for spec in portal_image_specs(portals)]
+    except Exception as e:
+        logger.exception("Could not generate image variants for post %s: %s", news_post.id, str(e))
+        return []
+
+
+class PostImage:
+    """
+    The post image of a MasterNewsPost, read from storage once per publish.
+
+    The file handle is closed as soon as the bytes are loaded; every portal
+    upload then reuses the same pre-encoded multipart part.
+    """
+
+    FIELD_NAME = "post_image"
+
+    def __init__(self, filename, content, content_type=None):
+        self.boundary = uuid.uuid4().hex
+        self.filename = filename
+        self.content = content
+        self.content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        self.part = EncodedFilePart(self.boundary, self.FIELD_NAME, filename, content, self.content_type)
+        self._content_hash = None
+        self._variants = {}
+        self._variants_lock = threading.Lock()
+
+    @property
+    def content_hash(self):
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.content).hexdigest()
+        return self._content_hash
+
+    def variant(self, spec):
+        """
+        PostImage for the resized/re-encoded variant described by `spec`.
+        Each variant is loaded (or generated) once and then shared by every
+        portal using the same spec. Falls back to the original on failure.
+        """
+        if spec is None:
+            return self
+        with self._variants_lock:
+            if spec not in self._variants:
+                try:
+                    name, content = get_variant(self.content, self.content_hash, spec)
+                    stem = os.path.splitext(self.filename)[0]
+                    extension = os.path.splitext(name)[1]
+                    self._variants[spec] = PostImage(f"{stem}{extension}", content)
+                except Exception as e:
+                    logger.warning("Image variant %s failed for %s: %s", spec, self.filename, str(e))
+                    self._variants[spec] = self
+            return self._variants[spec]
+
+    def for_portal(self, portal):
+        """The image variant `portal` asked for (or the original)."""
+        return self.variant(ImageSpec.from_portal(portal))
+
+    @classmethod
+    def load(cls, news_post):
+        """Read `news_post.post_image` once; returns None when the post has no image."""
+        if not news_post.post_image:
+            return None
+        with news_post.post_image.open("rb") as image_file:
+            content = image_file.read()
+        return cls(os.path.basename(news_post.post_image.name), content)
+
+    def multipart_body(self, fields):
+        """Encode `fields` plus the shared image part into a MultipartBody."""
+        return MultipartBody(self.boundary, fields, [self.part])
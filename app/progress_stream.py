@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import PublishJob, PublishTask
+
+# Task status -> the terminal phase reported for it
+FINAL_PHASES = {"SUCCESS": "delivered", "FAILED": "failed", "SKIPPED": "skipped"}
+
+# Idle streams send an SSE comment this often so proxies keep the connection open
+KEEPALIVE_SECONDS = 15
+
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class JobEventStream:
+    """
+    Follows a PublishJob and turns task state changes into SSE events:
+    one `job` event up front, then per portal `started`, `rewritten` and
+    `delivered` / `failed` / `skipped` as soon as the worker records them,
+    and a closing `done` event with the final counts (or `timeout`).
+    """
+
+    def __init__(self, job_id, poll_interval=None, timeout=None):
+        self.job_id = job_id
+        self.poll_interval = poll_interval or settings.PUBLISH_STREAM_POLL_INTERVAL
+        self.timeout = timeout or settings.PUBLISH_STREAM_TIMEOUT
+        self.deadline = time.monotonic() + self.timeout
+        self.finished = False
+        self._sent = set()
+        self._last_event_at = time.monotonic()
+
+    def poll(self):
+        """Read the job's tasks once; returns the encoded events not sent yet."""
+        events = []
+        if not self._sent:
+            job = PublishJob.objects.get(pk=self.job_id)
+            events.append(sse_event("job", {
+                "job_id": job.id,
+                "news_post": job.news_post_id,
+                "status": job.status,
+                "total_tasks": job.total_tasks,
+            }))
+            self._sent.add("job")
+
+        tasks = PublishTask.objects.filter(job_id=self.job_id).select_related(
+            "portal", "portal_category"
+        ).order_by("id")
+
+        counts = {key: 0 for key, _ in PublishTask.STATUS_CHOICES}
+        for task in tasks:
+            counts[task.status] += 1
+            phases = []
+            if task.status != "QUEUED" and task.status != "SKIPPED":
+                phases.append("started")
+            if task.rewritten_at:
+                phases.append("rewritten")
+            if task.status in FINAL_PHASES:
+                phases.append(FINAL_PHASES[task.status])
+
+            for phase in phases:
+                if (task.id, phase) in self._sent:
+                    continue
+                self._sent.add((task.id, phase))
+                final = phase == FINAL_PHASES.get(task.status)
+                events.append(sse_event(phase, {
+                    "task_id": task.id,
+                    "portal": task.portal.name,
+                    "category": task.portal_category.name if task.portal_category else None,
+                    "success": task.status == "SUCCESS" if final else None,
+                    "response": task.response_message if final else None,
+                    "attempts": task.attempts,
+                }))
+
+        if counts["QUEUED"] == 0 and counts["RUNNING"] == 0:
+            events.append(sse_event("done", {"job_id": self.job_id, "counts": counts}))
+            self.finished = True
+        elif time.monotonic() >= self.deadline:
+            events.append(sse_event("timeout", {"job_id": self.job_id, "counts": counts}))
+            self.finished = True
+        elif not events and time.monotonic() - self._last_event_at >= KEEPALIVE_SECONDS:
+            events.append(": keep-alive\n\n")
+
+        if events:
+            self._last_event_at = time.monotonic()
+        return events
+
+    def __iter__(self):
+        while not self.finished:
+            yield from self.poll()
+            if not self.finished:
+                time.sleep(self.poll_interval)
+
+    async def __aiter__(self):
+        # Under ASGI the stream waits on the event loop instead of holding a worker thread
+        while not self.finished:
+            for event in await sync_to_async(self.poll)():
+                yield event
+            if not self.finished:
+                await asyncio.sleep(self.poll_interval)
+
+
+def job_event_response(request, job):
+    """
+    StreamingHttpResponse following `job` as Server-Sent Events.
+    Served asynchronously under the ASGI app (recon/asgi.py), synchronously under WSGI.
+    """
+    stream = JobEventStream(job.id)
+    is_asgi = isinstance(getattr(request, "_request", request), ASGIRequest)
+    response = StreamingHttpResponse(
+        stream.__aiter__() if is_asgi else iter(stream),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
@@ -0,0 +1,625 @@
+import logging
+import random
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, F
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .circuit_breaker import CircuitOpenError, reopen_time
+from .drafts import claim_drafts, draft_key, ready_drafts, save_draft
+from .fanout import FanOutExecutor
+from .portal_client import get_portal_client, portal_timeout
+from .post_images import PostImage
+from .models import NewsDistribution, PublishJob, PublishTask
+from .planner import PublishPlan
+from .rollups import write_distributions
+from .utils import generate_variation_with_gpt, generate_variations_batch_with_gpt
+
+logger = logging.getLogger("publish")
+
+
+def build_portal_payload(news_post, portal_category, portal_user_id, rewritten):
+    """
+    Build the form payload expected by a portal's /api/create-news/ endpoint.
+    `rewritten` is the (title, short_desc, content, meta_title, slug) tuple.
+    """
+    rewritten_title, rewritten_short, rewritten_content, rewritten_meta, rewritten_slug = rewritten
+    return {
+        "post_cat": portal_category.external_id if portal_category else None,
+        "post_title": rewritten_title,
+        "post_short_des": rewritten_short,
+        "post_des": rewritten_content,
+        "meta_title": rewritten_meta,
+        "slug": rewritten_slug,
+        "post_tag": news_post.post_tag or "",
+        "author": portal_user_id,
+
+        # Dates
+        "Event_date": (news_post.Event_date or timezone.now().date()).isoformat(),
+        "Eventend_date": (news_post.Event_end_date or timezone.now().date()).isoformat(),
+        "schedule_date": (news_post.schedule_date or timezone.now()).isoformat(),
+
+        # Flags
+        "is_active": int(bool(news_post.latest_news)) if news_post.latest_news is not None else 0,
+        "Event": int(bool(news_post.upcoming_event)) if news_post.upcoming_event is not None else 0,
+        "Head_Lines": int(bool(news_post.Head_Lines)) if news_post.Head_Lines is not None else 0,
+        "articles": int(bool(news_post.articles)) if news_post.articles is not None else 0,
+        "trending": int(bool(news_post.trending)) if news_post.trending is not None else 0,
+        "BreakingNews": int(bool(news_post.BreakingNews)) if news_post.BreakingNews is not None else 0,
+        "post_status": news_post.counter or 0,
+    }
+
+
+def rewrite_for_portal(news_post, entry):
+    """
+    Return the (title, short_desc, content, meta_title, slug) variation for a planned portal.
+    Mappings flagged `use_default_content` get the original post untouched.
+    """
+    if entry.use_default_content:
+        return (
+            news_post.title,
+            news_post.short_description,
+            news_post.content,
+            news_post.meta_title or news_post.title,
+            news_post.slug or slugify(news_post.meta_title or news_post.title),
+        )
+
+    return generate_variation_with_gpt(
+        news_post.title,
+        news_post.short_description,
+        news_post.content,
+        entry.prompt_text,
+        news_post.meta_title,
+        news_post.slug,
+        portal_name=entry.portal.name,
+        options=entry.rewrite_options,
+    )
+
+
+def prefetch_variations(work):
+    """
+    Rewrite all GPT-bound deliveries up front, one batched request per
+    (post, prompt) group instead of one request per portal. Draft variations
+    generated ahead of time from the same content are used as-is.
+    `work` is a list of (key, news_post, PortalPlan); returns {key: variation}.
+    """
+    try:
+        drafts = ready_drafts(work)
+    except Exception as e:
+        logger.warning("Draft variation lookup failed: %s", str(e))
+        drafts = {}
+
+    groups = {}
+    for key, news_post, entry in work:
+        if entry.skipped or entry.use_default_content or key in drafts:
+            continue
+        groups.setdefault(
+            (news_post.id, entry.prompt_text, entry.rewrite_options), []
+        ).append((key, news_post, entry))
+
+    def rewrite_group(item):
+        (_, prompt_text, options), group = item
+        news_post = group[0][1]
+        return generate_variations_batch_with_gpt(
+            news_post.title,
+            news_post.short_description,
+            news_post.content,
+            prompt_text,
+            [entry.portal.name for _, _, entry in group],
+            news_post.meta_title,
+            news_post.slug,
+            options=options,
+        )
+
+    items = list(groups.items())
+    variations = dict(drafts)
+    for (_, group), by_portal in zip(items, FanOutExecutor().map(rewrite_group, items)):
+        for key, _, entry in group:
+            variations[key] = by_portal[entry.portal.name]
+    return variations
+
+
+def generate_pending_drafts(limit=None):
+    """
+    Generate claimed draft variations (see app.drafts), batched per post
+    and prompt like publish rewrites. Returns [(draft, new_status)].
+    """
+    drafts = claim_drafts(limit or settings.PUBLISH_WORKER_BATCH_SIZE)
+
+    by_post = {}
+    for draft in drafts:
+        by_post.setdefault(draft.news_post_id, []).append(draft)
+
+    work = []
+    for post_drafts in by_post.values():
+        news_post = post_drafts[0].news_post
+        plan = PublishPlan.for_targets(
+            news_post, None, news_post.created_by, [(draft.portal, None, False, False) for draft in post_drafts]
+        )
+        for draft, entry in zip(post_drafts, plan.entries):
+            if draft_key(news_post, entry) == draft.key:
+                work.append((draft.id, news_post, entry))
+
+    try:
+        variations = prefetch_variations(work)
+    except Exception as e:
+        logger.exception("Draft generation failed: %s", str(e))
+        variations = {}
+
+    return [
+        (draft, "READY" if save_draft(draft, variations.get(draft.id)) else "FAILED")
+        for draft in drafts
+    ]
+
+
+def deliver_to_portal(news_post, portal, portal_category, portal_user_id, rewritten, image=None):
+    """
+    POST an already rewritten variation to the portal's /api/create-news/.
+    Returns (success, response_message). Raises CircuitOpenError when the
+    portal's circuit is open so callers can defer instead of counting a failure.
+    """
+    payload = build_portal_payload(news_post, portal_category, portal_user_id, rewritten)
+    try:
+        if image is None:
+            image = PostImage.load(news_post)
+        if image is not None:
+            image = image.for_portal(portal)
+        response = get_portal_client(portal).post_multipart(
+            "/api/create-news/", payload, image=image, timeout=portal_timeout(portal, 10)
+        )
+        return response.status_code in [200, 201], response.text
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        return False, str(e)
+
+
+def next_retry_time(retry_count):
+    """
+    When a failed distribution should be retried: exponential backoff
+    (DISTRIBUTION_RETRY_BASE_SECONDS * 2^retry_count, capped) with jitter.
+    """
+    delay = min(
+        settings.DISTRIBUTION_RETRY_BASE_SECONDS * (2 ** retry_count),
+        settings.DISTRIBUTION_RETRY_MAX_SECONDS,
+    )
+    return timezone.now() + timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+class DistributionWriter:
+    """
+    Buffers NewsDistribution results and upserts them with one
+    bulk_create(update_conflicts=True) per flush instead of one
+    update_or_create per portal. Flushes automatically every
+    `batch_size` results so long jobs persist progress in micro-batches.
+    Publish tasks passed to `add` are completed only once their row is
+    written (as FAILED if the write fails), never before.
+    Thread-safe: fan-out workers add to the same writer.
+    """
+
+    UPDATE_FIELDS = [
+        "portal_category", "master_category", "published_by", "status", "response_message", "retry_count",
+        "next_retry_at", "ai_title", "ai_short_description", "ai_content", "ai_meta_title", "ai_slug", "updated_at",
+    ]
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.PUBLISH_RESULT_FLUSH_SIZE
+        self._rows = {}
+        self._completions = []
+        self._task_ids = set()
+        self._lock = threading.Lock()
+
+    def add(self, news_post, entry, master_category_id, success, response_msg, next_retry_at, rewritten, task=None):
+        rewritten_title, rewritten_short, rewritten_content, rewritten_meta, rewritten_slug = rewritten
+        row = NewsDistribution(
+            news_post=news_post,
+            portal=entry.portal,
+            portal_category=entry.portal_category,
+            master_category_id=master_category_id,
+            published_by_id=entry.publisher_id,
+            status="SUCCESS" if success else "FAILED",
+            response_message=response_msg,
+            retry_count=0,
+            next_retry_at=next_retry_at,
+            ai_title=rewritten_title,
+            ai_short_description=rewritten_short,
+            ai_content=rewritten_content,
+            ai_meta_title=rewritten_meta,
+            ai_slug=rewritten_slug,
+        )
+        with self._lock:
+            # One row per (post, portal): a later result replaces an earlier one
+            self._rows[(news_post.id, entry.portal.id)] = row
+            if task is not None:
+                self._completions.append((task, {"success": success, "response": response_msg}))
+                self._task_ids.add(task.id)
+            full = len(self._rows) >= self.batch_size
+        if full:
+            self.flush()
+
+    def completes(self, task):
+        """Whether `task` was handed to this writer, which then completes it on flush."""
+        with self._lock:
+            return task.id in self._task_ids
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = list(self._rows.values()), {}
+            completions, self._completions = self._completions, []
+        if not rows:
+            return 0
+
+        conflict_target = {}
+        if connection.features.supports_update_conflicts_with_target:
+            conflict_target["unique_fields"] = ["news_post", "portal"]
+        written = NewsDistribution.objects.filter(
+            news_post_id__in={row.news_post_id for row in rows}, portal_id__in={row.portal_id for row in rows}
+        )
+        try:
+            write_distributions(written, lambda: NewsDistribution.objects.bulk_create(
+                rows, update_conflicts=True, update_fields=self.UPDATE_FIELDS, **conflict_target
+            ))
+        except Exception as e:
+            # Delivered but not recorded: fail the tasks rather than leave them to be delivered again
+            for task, _ in completions:
+                complete_task(task, {"success": False, "response": f"Could not record the result: {e}"})
+            raise
+
+        for task, result in completions:
+            complete_task(task, result)
+        return len(rows)
+
+
+def save_distribution(news_post, entry, master_category_id, success, response_msg, next_retry_at, rewritten):
+    """
+    Record a delivery outcome. The plan already knows whether a row exists
+    for (post, portal), so this is a single UPDATE or INSERT.
+    """
+    rewritten_title, rewritten_short, rewritten_content, rewritten_meta, rewritten_slug = rewritten
+    fields = {
+        "portal_category": entry.portal_category,
+        "master_category_id": master_category_id,
+        "published_by_id": entry.publisher_id,
+        "status": "SUCCESS" if success else "FAILED",
+        "response_message": response_msg,
+        # A fresh publish starts a new retry budget (a dead-lettered row republished gets its full retries)
+        "retry_count": 0,
+        "next_retry_at": next_retry_at,
+        "ai_title": rewritten_title,
+        "ai_short_description": rewritten_short,
+        "ai_content": rewritten_content,
+        "ai_meta_title": rewritten_meta,
+        "ai_slug": rewritten_slug,
+    }
+
+    def write():
+        if entry.distribution_id and NewsDistribution.objects.filter(pk=entry.distribution_id).update(
+            updated_at=timezone.now(), **fields
+        ):
+            return
+        NewsDistribution.objects.update_or_create(news_post=news_post, portal=entry.portal, defaults=fields)
+
+    write_distributions(NewsDistribution.objects.filter(news_post=news_post, portal=entry.portal), write)
+
+
+def publish_to_portal(news_post, entry, master_category_id, rewritten=None, image=None, writer=None, task=None):
+    """
+    Rewrite, deliver and record a single planned portal publish.
+    Pass `rewritten` to deliver a variation generated elsewhere (e.g. a batched rewrite),
+    `image` (a PostImage) to reuse image bytes already loaded for this publish,
+    `writer` (a DistributionWriter) to buffer the NewsDistribution write and
+    `task` (a leased PublishTask) for the writer to complete once that write is done.
+    Returns a result dict in the shape the publish endpoints report:
+    {"portal", "category", "success", "response"}.
+    """
+    portal = entry.portal
+    category_name = entry.portal_category.name if entry.portal_category else None
+
+    if entry.skipped:
+        return {
+            "portal": portal.name,
+            "category": category_name,
+            "success": False,
+            "response": "Skipped manually by user",
+        }
+
+    rewritten = rewritten or rewrite_for_portal(news_post, entry)
+
+    if entry.portal_user_id is None:
+        return {
+            "portal": portal.name,
+            "category": category_name,
+            "success": False,
+            "response": "No valid portal user mapping found.",
+        }
+
+    try:
+        success, response_msg = deliver_to_portal(
+            news_post, portal, entry.portal_category, entry.portal_user_id, rewritten, image=image
+        )
+        next_retry_at = None if success else next_retry_time(0)
+    except CircuitOpenError as e:
+        # Portal is down: hand the delivery to the retry scheduler for when the circuit re-opens
+        success, response_msg = False, str(e)
+        next_retry_at = reopen_time(portal)
+
+    if writer is not None:
+        writer.add(news_post, entry, master_category_id, success, response_msg, next_retry_at, rewritten, task=task)
+    else:
+        save_distribution(news_post, entry, master_category_id, success, response_msg, next_retry_at, rewritten)
+
+    return {
+        "portal": portal.name,
+        "category": category_name,
+        "success": success,
+        "response": response_msg,
+    }
+
+
+def enqueue_publish_job(plan):
+    """
+    Create a PublishJob with one PublishTask per planned portal.
+    Portals the plan marks as skipped (excluded by the user) are recorded as SKIPPED.
+    """
+    with transaction.atomic():
+        job = PublishJob.objects.create(
+            news_post=plan.news_post,
+            master_category_id=plan.master_category_id,
+            requested_by=plan.user,
+        )
+
+        tasks = []
+        for entry in plan.entries:
+            tasks.append(PublishTask(
+                job=job,
+                portal=entry.portal,
+                portal_category=entry.portal_category,
+                use_default_content=entry.use_default_content,
+                status="SKIPPED" if entry.skipped else "QUEUED",
+                response_message="Skipped manually by user" if entry.skipped else None,
+                finished_at=timezone.now() if entry.skipped else None,
+            ))
+        PublishTask.objects.bulk_create(tasks)
+
+        job.total_tasks = len(tasks)
+        if not any(task.status == "QUEUED" for task in tasks):
+            job.status = "COMPLETED"
+            job.finished_at = timezone.now()
+        job.save(update_fields=["total_tasks", "status", "finished_at", "updated_at"])
+
+    logger.info("Queued publish job %s with %s tasks", job.id, job.total_tasks)
+    return job
+
+
+def lease_tasks(worker_id, limit=None, lease_seconds=None):
+    """
+    Claim up to `limit` runnable tasks for `worker_id`.
+    Runnable tasks are QUEUED ones and RUNNING ones whose lease has expired
+    (their worker died). Rows locked by other workers are skipped. Expired
+    tasks that already had PUBLISH_TASK_MAX_ATTEMPTS leases are failed instead:
+    their portal may have received the post already.
+    """
+    limit = limit or settings.PUBLISH_WORKER_BATCH_SIZE
+    lease_seconds = lease_seconds or settings.PUBLISH_TASK_LEASE_SECONDS
+    max_attempts = settings.PUBLISH_TASK_MAX_ATTEMPTS
+    now = timezone.now()
+    expired = Q(status="RUNNING", leased_until__lt=now)
+
+    with transaction.atomic():
+        exhausted = list(
+            PublishTask.objects.select_for_update(skip_locked=True)
+            .filter(expired, attempts__gte=max_attempts)
+            .values_list("id", "job_id")
+        )
+        if exhausted:
+            PublishTask.objects.filter(id__in=[task_id for task_id, _ in exhausted]).update(
+                status="FAILED",
+                response_message=f"Gave up after {max_attempts} attempts",
+                leased_until=None,
+                finished_at=now,
+                updated_at=now,
+            )
+            for job_id in {job_id for _, job_id in exhausted}:
+                close_job_if_done(job_id)
+            logger.warning(
+                "Gave up on publish tasks %s after %s attempts", [task_id for task_id, _ in exhausted], max_attempts
+            )
+
+        task_ids = list(
+            PublishTask.objects.select_for_update(skip_locked=True)
+            .filter(Q(status="QUEUED") | (expired & Q(attempts__lt=max_attempts)))
+            .order_by("id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not task_ids:
+            return []
+
+        PublishTask.objects.filter(id__in=task_ids).update(
+            status="RUNNING",
+            worker_id=worker_id,
+            leased_until=now + timedelta(seconds=lease_seconds),
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+        PublishJob.objects.filter(
+            tasks__id__in=task_ids, status="QUEUED"
+        ).update(status="RUNNING", started_at=now, updated_at=now)
+
+    return list(
+        PublishTask.objects.filter(id__in=task_ids, worker_id=worker_id)
+        .select_related("job", "job__news_post", "job__requested_by", "portal", "portal_category")
+        .order_by("id")
+    )
+
+
+def renew_lease(task, lease_seconds=None):
+    """
+    Extend the lease of a task its worker still holds. Returns False when the
+    lease was lost (it expired and another worker may have taken the task over).
+    """
+    lease_seconds = lease_seconds or settings.PUBLISH_TASK_LEASE_SECONDS
+    now = timezone.now()
+    return PublishTask.objects.filter(id=task.id, status="RUNNING", worker_id=task.worker_id).update(
+        leased_until=now + timedelta(seconds=lease_seconds), updated_at=now
+    ) > 0
+
+
+def mark_rewritten(task_ids):
+    """Stamp tasks whose variation is ready (progress streams report it as a phase)."""
+    now = timezone.now()
+    PublishTask.objects.filter(id__in=task_ids, rewritten_at__isnull=True).update(rewritten_at=now, updated_at=now)
+
+
+def run_task(task, entry, rewritten=None, image=None, writer=None):
+    """
+    Execute a leased task from its plan entry and store its outcome. With a
+    `writer`, a delivered task is completed by the writer after its
+    NewsDistribution row is flushed, so it never reports success unrecorded.
+    """
+    job = task.job
+    try:
+        if rewritten is None and not entry.skipped:
+            rewritten = rewrite_for_portal(job.news_post, entry)
+            mark_rewritten([task.id])
+        # The rewrite (or the batch it was prefetched with) may have outlived the
+        # lease: never deliver a task another worker may be delivering too
+        if not renew_lease(task):
+            logger.warning("Publish task %s lost its lease before delivery; skipping it", task.id)
+            return {"success": False, "response": "Lease lost before delivery"}
+        result = publish_to_portal(
+            job.news_post, entry, job.master_category_id, rewritten=rewritten, image=image, writer=writer, task=task
+        )
+    except Exception as e:
+        logger.exception("Publish task %s failed: %s", task.id, str(e))
+        result = {"success": False, "response": str(e)}
+
+    if writer is None or not writer.completes(task):
+        complete_task(task, result)
+    return result
+
+
+def plan_tasks(tasks):
+    """Resolve a PortalPlan for every task, planning each job's tasks together."""
+    by_job = {}
+    for task in tasks:
+        by_job.setdefault(task.job_id, []).append(task)
+
+    entries = {}
+    for job_tasks in by_job.values():
+        job = job_tasks[0].job
+        plan = PublishPlan.for_targets(
+            job.news_post,
+            job.master_category_id,
+            job.requested_by,
+            [(task.portal, task.portal_category, task.use_default_content, False) for task in job_tasks],
+        )
+        for task, entry in zip(job_tasks, plan.entries):
+            entries[task.id] = entry
+    return entries
+
+
+def run_tasks(tasks):
+    """
+    Execute leased tasks concurrently (bounded globally and per portal).
+    Each job's tasks are planned together, GPT rewrites sharing a prompt are
+    generated together, each post image is read once and shared by all
+    of that post's uploads, and NewsDistribution results are written in bulk.
+    Results are returned in the same order as `tasks`.
+    """
+    entries = plan_tasks(tasks)
+
+    images = {}
+    for task in tasks:
+        news_post = task.job.news_post
+        if news_post.id not in images:
+            try:
+                images[news_post.id] = PostImage.load(news_post)
+            except Exception as e:
+                logger.exception("Could not read image for post %s: %s", news_post.id, str(e))
+                images[news_post.id] = None
+
+    try:
+        variations = prefetch_variations([(task.id, task.job.news_post, entries[task.id]) for task in tasks])
+    except Exception as e:
+        logger.exception("Batched rewrite failed, falling back to per-portal rewrites: %s", str(e))
+        variations = {}
+    if variations:
+        mark_rewritten(list(variations))
+
+    writer = DistributionWriter()
+    try:
+        return FanOutExecutor().map(
+            lambda task: run_task(
+                task, entries[task.id], variations.get(task.id), images.get(task.job.news_post_id), writer
+            ),
+            tasks,
+            key=lambda task: task.portal_id,
+        )
+    finally:
+        writer.flush()
+
+
+def complete_task(task, result):
+    """
+    Persist a task outcome and close the job once no work is left. Only the
+    worker holding the task's lease can complete it; returns False otherwise.
+    """
+    now = timezone.now()
+    completed = PublishTask.objects.filter(id=task.id, status="RUNNING", worker_id=task.worker_id).update(
+        status="SUCCESS" if result["success"] else "FAILED",
+        response_message=result["response"],
+        leased_until=None,
+        finished_at=now,
+        updated_at=now,
+    )
+    if not completed:
+        logger.warning("Publish task %s is no longer leased by %s; outcome not recorded", task.id, task.worker_id)
+        return False
+
+    close_job_if_done(task.job_id)
+    return True
+
+
+def close_job_if_done(job_id):
+    """Mark a job COMPLETED once none of its tasks is queued or running."""
+    now = timezone.now()
+    pending = PublishTask.objects.filter(job_id=job_id, status__in=["QUEUED", "RUNNING"])
+    if not pending.exists():
+        PublishJob.objects.filter(id=job_id).exclude(status="COMPLETED").update(
+            status="COMPLETED", finished_at=now, updated_at=now
+        )
+
+
+def job_progress(job):
+    """Summarise task states for a job; used by the job-status endpoint."""
+    counts = {key: 0 for key, _ in PublishTask.STATUS_CHOICES}
+    results = []
+    for task in job.tasks.select_related("portal", "portal_category").order_by("id"):
+        counts[task.status] += 1
+        results.append({
+            "portal": task.portal.name,
+            "category": task.portal_category.name if task.portal_category else None,
+            "status": task.status,
+            "success": task.status == "SUCCESS",
+            "response": task.response_message,
+            "attempts": task.attempts,
+        })
+
+    done = counts["SUCCESS"] + counts["FAILED"] + counts["SKIPPED"]
+    return {
+        "job_id": job.id,
+        "news_post": job.news_post_id,
+        "master_category": job.master_category_id,
+        "status": job.status,
+        "total_tasks": job.total_tasks,
+        "completed_tasks": done,
+        "counts": counts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "results": results,
+    }
@@ -0,0 +1,135 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, F
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .circuit_breaker import CircuitOpenError, reopen_time
+from .fanout import FanOutExecutor
+from .models import NewsDistribution
+from .post_images import PostImage
+from .publishing import deliver_to_portal, next_retry_time
+from .rollups import write_distributions
+from user.models import PortalUserMapping
+
+logger = logging.getLogger("publish")
+
+
+def lease_due_distributions(limit=None, lease_seconds=None):
+    """
+    Claim FAILED/PENDING distributions whose `next_retry_at` has passed.
+    Rows without a schedule (written before the scheduler existed) are due once
+    they have been idle for a lease period, unless they were created more than
+    DISTRIBUTION_RETRY_MAX_AGE_SECONDS ago: old failures are not re-posted.
+    Claimed rows get `next_retry_at` pushed forward by the lease so other
+    schedulers skip them meanwhile.
+    """
+    limit = limit or settings.PUBLISH_WORKER_BATCH_SIZE
+    lease = timedelta(seconds=lease_seconds or settings.PUBLISH_TASK_LEASE_SECONDS)
+    now = timezone.now()
+    unscheduled = Q(
+        next_retry_at__isnull=True,
+        updated_at__lte=now - lease,
+        created_at__gte=now - timedelta(seconds=settings.DISTRIBUTION_RETRY_MAX_AGE_SECONDS),
+    )
+
+    with transaction.atomic():
+        distribution_ids = list(
+            NewsDistribution.objects.select_for_update(skip_locked=True)
+            .filter(status__in=["FAILED", "PENDING"])
+            .filter(Q(next_retry_at__lte=now) | unscheduled)
+            .order_by("next_retry_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not distribution_ids:
+            return []
+        NewsDistribution.objects.filter(id__in=distribution_ids).update(next_retry_at=now + lease, updated_at=now)
+
+    return list(
+        NewsDistribution.objects.filter(id__in=distribution_ids)
+        .select_related("news_post", "portal", "portal_category")
+        .order_by("id")
+    )
+
+
+def retry_distribution(distribution, image=None):
+    """
+    Re-deliver a distribution using its stored ai_* variation (no new GPT call).
+    It is delivered as the portal account of the user who published it (the
+    post author for rows recorded before the publisher was stored).
+    Returns the new status: SUCCESS, FAILED (rescheduled) or DEAD.
+    """
+    news_post = distribution.news_post
+    rewritten = (
+        distribution.ai_title or news_post.title,
+        distribution.ai_short_description or news_post.short_description,
+        distribution.ai_content or news_post.content,
+        distribution.ai_meta_title or news_post.meta_title or news_post.title,
+        distribution.ai_slug or news_post.slug or slugify(news_post.meta_title or news_post.title),
+    )
+
+    portal_user = PortalUserMapping.objects.filter(
+        user_id=distribution.published_by_id or news_post.created_by_id, portal=distribution.portal, status="MATCHED"
+    ).order_by("id").first()
+    if portal_user:
+        try:
+            success, response_msg = deliver_to_portal(
+                news_post, distribution.portal, distribution.portal_category,
+                portal_user.portal_user_id, rewritten, image=image,
+            )
+        except CircuitOpenError as e:
+            # Not an attempt: wait for the circuit to let calls through again
+            NewsDistribution.objects.filter(pk=distribution.pk).update(
+                response_message=str(e),
+                next_retry_at=reopen_time(distribution.portal),
+                updated_at=timezone.now(),
+            )
+            return distribution.status
+    else:
+        success, response_msg = False, "No valid portal user mapping found."
+
+    retry_count = distribution.retry_count + 1
+    if success:
+        new_status, next_retry_at = "SUCCESS", None
+    elif retry_count >= settings.DISTRIBUTION_MAX_RETRIES:
+        new_status, next_retry_at = "DEAD", None
+        logger.warning(
+            "Distribution %s (%s) moved to dead letter after %s retries",
+            distribution.id, distribution.portal.name, retry_count,
+        )
+    else:
+        new_status, next_retry_at = "FAILED", next_retry_time(retry_count)
+
+    written = NewsDistribution.objects.filter(pk=distribution.pk)
+    write_distributions(written, lambda: written.update(
+        status=new_status,
+        response_message=response_msg,
+        retry_count=F("retry_count") + 1,
+        next_retry_at=next_retry_at,
+        updated_at=timezone.now(),
+    ))
+    return new_status
+
+
+def run_due_retries(limit=None):
+    """Lease and retry due distributions concurrently; returns [(distribution, new_status)]."""
+    distributions = lease_due_distributions(limit=limit)
+
+    images = {}
+    for distribution in distributions:
+        if distribution.news_post_id not in images:
+            try:
+                images[distribution.news_post_id] = PostImage.load(distribution.news_post)
+            except Exception as e:
+                logger.exception("Could not read image for post %s: %s", distribution.news_post_id, str(e))
+                images[distribution.news_post_id] = None
+
+    statuses = FanOutExecutor().map(
+        lambda distribution: retry_distribution(distribution, images.get(distribution.news_post_id)),
+        distributions,
+        key=lambda distribution: distribution.portal_id,
+    )
+    return list(zip(distributions, statuses))
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import RewriteCacheEntry, RewriteCacheStats
+from .rewrite_prompts import PROMPT_VERSION
+
+logger = logging.getLogger("ai_variation")
+
+STATS_PK = 1
+
+
+def make_cache_key(title, short_desc, desc, meta_title, slug, prompt_text, portal_name, model):
+    """Content hash of every input that influences a GPT variation (including the prompt template version)."""
+    raw = json.dumps(
+        [title, short_desc, desc, meta_title, slug, prompt_text, portal_name, model, PROMPT_VERSION],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _bump_stats(hits=0, misses=0, saved_ms=0):
+    RewriteCacheStats.objects.get_or_create(pk=STATS_PK)
+    RewriteCacheStats.objects.filter(pk=STATS_PK).update(
+        hits=F("hits") + hits,
+        misses=F("misses") + misses,
+        saved_ms=F("saved_ms") + saved_ms,
+        updated_at=timezone.now(),
+    )
+
+
+def get_cached_variation(key):
+    """
+    Return the cached (title, short_desc, desc, meta_title, slug) tuple for `key`,
+    or None on a miss. Expired entries are dropped on read.
+    """
+    now = timezone.now()
+    entry = RewriteCacheEntry.objects.filter(key=key).first()
+
+    if entry and entry.expires_at > now:
+        RewriteCacheEntry.objects.filter(pk=entry.pk).update(
+            hit_count=F("hit_count") + 1, last_used_at=now
+        )
+        _bump_stats(hits=1, saved_ms=entry.generation_ms)
+        return tuple(entry.result)
+
+    if entry:
+        entry.delete()
+    _bump_stats(misses=1)
+    return None
+
+
+def store_variation(key, result, portal_name=None, model=None, generation_ms=0):
+    """Save a fresh GPT variation and trim the cache back under its limits."""
+    now = timezone.now()
+    RewriteCacheEntry.objects.update_or_create(
+        key=key,
+        defaults={
+            "portal_name": portal_name,
+            "model": model or "",
+            "result": list(result),
+            "generation_ms": int(generation_ms),
+            "last_used_at": now,
+            "expires_at": now + timedelta(seconds=settings.REWRITE_CACHE_TTL_SECONDS),
+        },
+    )
+    evict_entries()
+
+
+def evict_entries():
+    """Drop expired entries, then least-recently-used ones above REWRITE_CACHE_MAX_ENTRIES."""
+    RewriteCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+
+    max_entries = settings.REWRITE_CACHE_MAX_ENTRIES
+    cutoff = (
+        RewriteCacheEntry.objects.order_by("-last_used_at", "-id")
+        .values_list("last_used_at", "id")[max_entries:max_entries + 1]
+    )
+    cutoff = list(cutoff)
+    if cutoff:
+        last_used_at, entry_id = cutoff[0]
+        RewriteCacheEntry.objects.filter(last_used_at__lt=last_used_at).delete()
+        RewriteCacheEntry.objects.filter(last_used_at=last_used_at, id__lte=entry_id).delete()
+
+
+def cache_stats():
+    """Hit/miss counters and the GPT time saved by serving from the cache."""
+    stats, _ = RewriteCacheStats.objects.get_or_create(pk=STATS_PK)
+    lookups = stats.hits + stats.misses
+    return {
+        "hits": stats.hits,
+        "misses": stats.misses,
+        "hit_ratio": round(stats.hits / lookups, 4) if lookups else 0.0,
+        "saved_gpt_seconds": round(stats.saved_ms / 1000, 2),
+        "entries": RewriteCacheEntry.objects.count(),
+        "max_entries": settings.REWRITE_CACHE_MAX_ENTRIES,
+        "ttl_seconds": settings.REWRITE_CACHE_TTL_SECONDS,
+    }
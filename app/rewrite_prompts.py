@@ -0,0 +1,103 @@
+import hashlib
+import json
+
+# Bump whenever the wording or layout below changes: it is part of every
+# rewrite cache key, so variations produced by an older template are not reused.
+PROMPT_VERSION = "v2"
+
+SEGMENT_RULES = [
+    "- description_segments holds the text nodes of the article body, in document order, keyed by id.",
+    "  Rewrite each segment's text and return the same ids. Consecutive segments may be parts of one",
+    "  sentence split by inline formatting, so keep them readable when joined. Return plain text only (no HTML).",
+]
+HTML_RULES = [
+    "- Preserve all HTML tags, attributes, styles, images, links, lists, and formatting inside the description.",
+    "- Do not remove, add, or modify any HTML structure.",
+]
+FIELD_RULES = [
+    "- Rewrite the textual content for: title, short_description, the description, and meta_title.",
+    "- The short_description must be a concise 1–2 sentence less than 160 characters, summary of the rewritten description.",
+    "- Generate a new slug as a clean, URL-safe version of the rewritten meta_title (lowercase, hyphen separated).",
+]
+
+INSTRUCTIONS_TEMPLATE = """You rewrite news articles for publishing portals (rewrite template {version}).
+Each portal must have a unique variation of the rewritten content.
+
+Rules:
+{rules}
+- Ensure wording differs between portals, but keep meaning intact.
+- Only rewrite the fields present in the article message; follow the portal instructions that come after it.
+- Return ONLY valid JSON with the keys requested in the last message."""
+
+
+def shared_instructions(segmented):
+    """The static, versioned instructions every rewrite request for a full-HTML or segmented article starts with."""
+    rules = (SEGMENT_RULES if segmented is not None else HTML_RULES) + FIELD_RULES
+    return INSTRUCTIONS_TEMPLATE.format(version=PROMPT_VERSION, rules="\n".join(rules))
+
+
+def article_message(article, note=None, context=None):
+    """The article fields to rewrite (plus optional read-only context), serialized the same way for every portal."""
+    header = "Article" if note is None else f"Article ({note})"
+    message = f"{header}:\n{json.dumps(article, ensure_ascii=False, indent=2)}"
+    if context:
+        message += f"\n\nExcerpt of the article body (context only, do not return it):\n{context}"
+    return message
+
+
+def build_rewrite_input(segmented, article, prompt_text, instruction, note=None, context=None):
+    """
+    Messages of one rewrite request, laid out for provider-side prompt caching:
+    a long prefix that is byte-identical for every portal rewriting the same
+    article (versioned instructions, then the article), followed by the small
+    portal-specific suffix (the PortalPrompt text and the per-request instruction).
+    """
+    return [
+        {"role": "developer", "content": shared_instructions(segmented)},
+        {"role": "user", "content": article_message(article, note, context)},
+        {"role": "developer", "content": f"Portal instructions:\n{prompt_text}"},
+        {"role": "user", "content": instruction},
+    ]
+
+
+def prompt_cache_key(messages):
+    """Routing hint for the provider's prompt cache: a hash of the shared prefix of `messages`."""
+    prefix = "\n".join(message["content"] for message in messages[:2])
+    return f"rewrite-{PROMPT_VERSION}-{hashlib.sha256(prefix.encode('utf-8')).hexdigest()[:32]}"
+
+
+def portal_instruction(portal_name, keys):
+    return (
+        f"Rewrite the article for the portal: {portal_name}\n"
+        f"Return ONLY valid JSON with keys: {', '.join(keys)}."
+    )
+
+
+def batch_instruction(portal_names, keys):
+    return (
+        f"Rewrite the article once for EACH of these portals: {json.dumps(portal_names, ensure_ascii=False)}\n"
+        "Return ONLY a valid JSON object whose keys are exactly the portal names above and whose values\n"
+        f"are objects with keys: {', '.join(keys)}."
+    )
+
+
+def headline_instruction(portal_name, keys):
+    return (
+        f"Rewrite the headline fields of the article for the portal: {portal_name}\n"
+        "The short_description must summarise the whole article (see the excerpt).\n"
+        f"Return ONLY valid JSON with keys: {', '.join(keys)}."
+    )
+
+
+def part_instruction(portal_name, number, total):
+    return (
+        f"Rewrite part {number} of {total} of the article for the portal: {portal_name}\n"
+        "Return ONLY valid JSON with the key: description_segments."
+    )
+
+
+def retry_instruction(portal_name, keys):
+    return (
+        f"Your rewrite of this article for the portal: {portal_name} left these fields missing or empty.\n"
+        f"Rewrite ONLY them and return ONLY valid JSON with keys: {', '.join(keys)}."
+    )
@@ -0,0 +1,119 @@
+import json
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+# Plain-text fields of every variation (the description is sent separately)
+FIELD_NAMES = ("title", "short_description", "meta_title", "slug")
+
+_decoder = json.JSONDecoder()
+
+
+def _string():
+    return {"type": "string"}
+
+
+def object_schema(properties):
+    """A strict JSON-schema object: every property required, nothing else allowed."""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def variation_schema(fields=FIELD_NAMES, segment_ids=None, html_description=False):
+    """Schema of one rewritten variation: `fields`, plus the description as HTML or as segments."""
+    properties = {name: _string() for name in fields}
+    if html_description:
+        properties["description"] = _string()
+    if segment_ids:
+        properties["description_segments"] = object_schema({segment_id: _string() for segment_id in segment_ids})
+    return object_schema(properties)
+
+
+def batch_schema(portal_names, schema):
+    """Schema of a batched reply: one `schema` variation per portal name."""
+    return object_schema({portal_name: schema for portal_name in portal_names})
+
+
+def text_format(name, schema):
+    """
+    Extra `responses.create` arguments asking for schema-constrained JSON.
+    Empty when OPENAI_STRUCTURED_OUTPUTS is off (the prompt alone asks for JSON).
+    """
+    if not settings.OPENAI_STRUCTURED_OUTPUTS:
+        return {}
+    return {"text": {"format": {"type": "json_schema", "name": name, "schema": schema, "strict": True}}}
+
+
+ParsedReply = namedtuple("ParsedReply", [
+    "data",         # decoded JSON object ({} when the reply was not JSON)
+    "invalid",      # dotted paths of required strings missing, empty or mistyped
+    "decoded",      # False when no JSON object could be read at all
+    "parse_ms",
+])
+
+
+def decode_json(content):
+    """
+    Decode a reply in a single pass: the whole text as JSON, else the first
+    JSON object embedded in it (e.g. wrapped in a code fence or prose).
+    Raises ValueError when there is none.
+    """
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        start = content.find("{")
+        if start < 0:
+            raise ValueError("No JSON object in GPT response")
+        return _decoder.raw_decode(content, start)[0]
+
+
+def invalid_paths(data, schema, source=None, prefix=""):
+    """
+    Dotted paths of the schema's string leaves that `data` lacks or leaves empty.
+    With `source` (the payload that was sent), leaves whose source text was
+    empty are not expected back and never count as invalid.
+    """
+    if not isinstance(data, dict):
+        data = {}
+    invalid = []
+    for name, prop in schema["properties"].items():
+        value = data.get(name)
+        original = source.get(name) if isinstance(source, dict) else None
+        if prop["type"] == "object":
+            invalid.extend(invalid_paths(value, prop, original, f"{prefix}{name}."))
+        elif source is not None and not (isinstance(original, str) and original.strip()):
+            continue
+        elif not isinstance(value, str) or not value.strip():
+            invalid.append(f"{prefix}{name}")
+    return invalid
+
+
+def parse_reply(content, schema, source=None):
+    """Decode and validate a GPT reply against `schema` (see invalid_paths) in one pass."""
+    started = time.perf_counter()
+    decoded = True
+    try:
+        data = decode_json(content or "")
+    except ValueError:
+        data, decoded = {}, False
+    if not isinstance(data, dict):
+        data, decoded = {}, False
+    invalid = invalid_paths(data, schema, source)
+    return ParsedReply(data, invalid, decoded, (time.perf_counter() - started) * 1000)
+
+
+def merge_reply(data, patch):
+    """Copy the valid values of a retry reply (`patch`) into `data`, recursing into objects."""
+    for name, value in patch.items():
+        if isinstance(value, dict):
+            if not isinstance(data.get(name), dict):
+                data[name] = {}
+            merge_reply(data[name], value)
+        elif isinstance(value, str) and value.strip():
+            data[name] = value
+    return data
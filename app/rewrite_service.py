@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, RateLimitError
+
+from django.conf import settings
+
+logger = logging.getLogger("ai_variation")
+
+# Errors worth retrying; everything else (bad request, auth, ...) fails at once
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class RewriteServiceError(Exception):
+    """An OpenAI request that still failed after the service's retries."""
+
+
+class TokenBucket:
+    """
+    Allows `per_minute` units per minute with bursts up to one minute's worth.
+
+    `reserve()` takes units immediately (the balance may go negative) and
+    returns how long the caller must wait before using them, so concurrent
+    callers queue up fairly instead of racing. After a 429 the refill rate is
+    halved and then recovers gradually with each successful request.
+    """
+
+    MIN_SCALE = 0.1
+    RECOVERY_STEP = 0.05
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.available = self.capacity
+        self.scale = 1.0
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.capacity * self.scale / 60.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+        return 0.0 if self.available >= 0 else -self.available / self.rate
+
+    def adjust(self, amount):
+        """Correct an earlier reservation once the real usage is known."""
+        self._refill()
+        self.available -= amount
+
+    def throttle(self):
+        self.scale = max(self.MIN_SCALE, self.scale / 2)
+
+    def recover(self):
+        self.scale = min(1.0, self.scale + self.RECOVERY_STEP)
+
+
+class LatencyWindow:
+    """Latencies (seconds) of the most recent successful requests to one model."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        """The `pct` percentile, or None until REWRITE_HEDGE_MIN_SAMPLES requests were seen."""
+        if not self.samples or len(self.samples) < settings.REWRITE_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+HedgedResponse = namedtuple("HedgedResponse", [
+    "response",
+    "model",        # model that produced `response`
+    "hedged",       # a duplicate request was sent
+    "hedge_won",    # ... and it answered first
+])
+
+
+def retry_delay(attempt, error=None):
+    """
+    Seconds to wait before retry `attempt` (0-based): the server's Retry-After
+    when it sent one, else exponential backoff with full jitter.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, unit in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+        try:
+            return min(float(headers[header]) / unit, settings.OPENAI_BACKOFF_MAX_SECONDS)
+        except (KeyError, TypeError, ValueError):
+            continue
+    ceiling = min(settings.OPENAI_BACKOFF_MAX_SECONDS, settings.OPENAI_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+class RewriteService:
+    """
+    Process-wide async gateway to the OpenAI API.
+
+    Runs an AsyncOpenAI client on a private event loop thread so that every
+    rewrite in the process (request threads, worker fan-out threads) shares:
+    - a cap on in-flight requests (OPENAI_MAX_CONCURRENCY),
+    - requests- and tokens-per-minute buckets (OPENAI_REQUESTS_PER_MINUTE,
+      OPENAI_TOKENS_PER_MINUTE) matching the account limits,
+    - adaptive backoff: 429s and transient errors are retried (honouring
+      Retry-After) and a 429 also slows both buckets down until calls succeed again.
+
+    Latency-sensitive callers await `ahedged_response()`,
+    which race a duplicate (or fallback-model) request against a slow one.
+
+    Sync code passes a coroutine to `run()`, which awaits `acreate_response()`
+    on the service loop (the only loop it may be awaited from).
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+        self._pid = None
+        # Touched from the service loop only
+        self.latencies = defaultdict(LatencyWindow)
+
+    def _start(self):
+        self._loop = asyncio.new_event_loop()
+        self._pid = os.getpid()
+        self.client = AsyncOpenAI(
+            api_key=settings.OPEN_AI_KEY, max_retries=0, timeout=settings.OPENAI_REQUEST_TIMEOUT
+        )
+        self.requests_bucket = TokenBucket(settings.OPENAI_REQUESTS_PER_MINUTE)
+        self.tokens_bucket = TokenBucket(settings.OPENAI_TOKENS_PER_MINUTE)
+        self.semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+        threading.Thread(target=self._loop.run_forever, name="rewrite-service", daemon=True).start()
+
+    def run(self, coro):
+        """Run `coro` on the service loop and block until it finishes."""
+        with self._lock:
+            # (Re)start lazily, and again in a forked child: threads do not survive fork()
+            if self._loop is None or self._pid != os.getpid():
+                self._start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _wait_for_capacity(self, estimated_tokens):
+        delay = max(
+            self.requests_bucket.reserve(1),
+            self.tokens_bucket.reserve(estimated_tokens),
+        )
+        if delay > 0:
+            logger.info("OpenAI rate limit budget exhausted, waiting %.2fs", delay)
+            await asyncio.sleep(delay)
+
+    async def acreate_response(self, estimated_tokens, sent=None, **request):
+        """
+        `client.responses.create(**request)` within the concurrency cap and
+        rate limits, retried with backoff. `estimated_tokens` (input + expected
+        output) is charged to the tokens bucket up front and corrected from
+        the reported usage. `sent` (an asyncio.Event) is set once the request
+        leaves the queue and goes out. Raises RewriteServiceError when retries run out.
+        """
+        async with self.semaphore:
+            last_error = None
+            for attempt in range(settings.OPENAI_MAX_RETRIES + 1):
+                await self._wait_for_capacity(estimated_tokens)
+                started = time.monotonic()
+                if sent is not None:
+                    sent.set()
+                try:
+                    response = await self.client.responses.create(**request)
+                except RETRYABLE_ERRORS as e:
+                    last_error = e
+                    if isinstance(e, RateLimitError):
+                        self.requests_bucket.throttle()
+                        self.tokens_bucket.throttle()
+                    if attempt == settings.OPENAI_MAX_RETRIES:
+                        break
+                    delay = retry_delay(attempt, e)
+                    logger.warning(
+                        "OpenAI %s (attempt %s/%s), retrying in %.2fs",
+                        type(e).__name__, attempt + 1, settings.OPENAI_MAX_RETRIES + 1, delay,
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                except Exception as e:
+                    raise RewriteServiceError(f"OpenAI request failed: {e}") from e
+
+                self.latencies[request.get("model")].add(time.monotonic() - started)
+                self.requests_bucket.recover()
+                self.tokens_bucket.recover()
+                usage = getattr(response, "usage", None)
+                total_tokens = getattr(usage, "total_tokens", None)
+                if isinstance(total_tokens, int):
+                    self.tokens_bucket.adjust(total_tokens - estimated_tokens)
+                return response
+
+        raise RewriteServiceError(
+            f"OpenAI request failed after {settings.OPENAI_MAX_RETRIES + 1} attempts: {last_error}"
+        ) from last_error
+
+    def hedge_delay(self, model, latency_budget_ms=None):
+        """
+        Seconds after which a request to `model` gets a hedged duplicate: the
+        model's recent REWRITE_HEDGE_PERCENTILE latency, capped by the latency
+        budget. None (never hedge) without either, or with REWRITE_HEDGING off.
+        """
+        if not settings.REWRITE_HEDGING:
+            return None
+        budget_ms = latency_budget_ms or settings.REWRITE_LATENCY_BUDGET_MS
+        candidates = [
+            self.latencies[model].percentile(settings.REWRITE_HEDGE_PERCENTILE),
+            budget_ms / 1000 if budget_ms else None,
+        ]
+        candidates = [seconds for seconds in candidates if seconds]
+        return min(candidates) if candidates else None
+
+    async def ahedged_response(self, estimated_tokens, model, fallback_model=None, latency_budget_ms=None,
+                               validate=None, **request):
+        """
+        acreate_response() on `model` with a latency SLO. When no reply has
+        arrived hedge_delay() after the request was sent, a duplicate request
+        is sent on `fallback_model` (or `model` again); it is also sent at once
+        if the first request fails or its reply does not pass `validate(response)`.
+        The first valid reply wins and the other request is cancelled.
+        Both requests go through the same concurrency cap and rate limits:
+        time queued for them does not count towards hedge_delay(), and no
+        slow-reply hedge is sent while the concurrency cap is reached.
+        Returns a HedgedResponse; raises RewriteServiceError when every request failed.
+        """
+        hedge_after = self.hedge_delay(model, latency_budget_ms)
+        hedge_model = fallback_model or model
+        can_hedge = settings.REWRITE_HEDGING and (hedge_after is not None or hedge_model != model)
+
+        sent = asyncio.Event()
+        primary = asyncio.ensure_future(self.acreate_response(estimated_tokens, sent=sent, model=model, **request))
+        sending = asyncio.ensure_future(sent.wait())
+        pending, hedge, hedge_at = {primary}, None, None
+        last_error = invalid = None
+
+        def start_hedge(reason):
+            logger.info("Rewrite request on %s %s, hedging on %s", model, reason, hedge_model)
+            task = asyncio.ensure_future(self.acreate_response(estimated_tokens, model=hedge_model, **request))
+            pending.add(task)
+            return task
+
+        try:
+            while pending:
+                waiting, timeout = pending, None
+                if hedge is None and can_hedge and hedge_after is not None:
+                    if hedge_at is None and sending.done():
+                        hedge_at = time.monotonic() + hedge_after
+                    if hedge_at is None:
+                        # Still queued for the concurrency cap or rate limits: not model latency yet
+                        waiting = pending | {sending}
+                    else:
+                        timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                done.discard(sending)
+                if not done:
+                    if hedge_at is None or time.monotonic() < hedge_at:
+                        continue
+                    if self.semaphore.locked():
+                        # A duplicate would only queue behind the requests it competes with
+                        hedge_at += hedge_after
+                        continue
+                    hedge = start_hedge(f"slower than {hedge_after:.2f}s")
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    try:
+                        response = task.result()
+                    except RewriteServiceError as e:
+                        last_error = e
+                        continue
+                    result = HedgedResponse(
+                        response, hedge_model if task is hedge else model, hedge is not None, task is hedge
+                    )
+                    if validate is None or validate(response):
+                        return result
+                    invalid = invalid or result
+                if hedge is None and can_hedge:
+                    hedge = start_hedge("failed" if invalid is None else "returned an invalid reply")
+        finally:
+            sending.cancel()
+            for task in pending:
+                task.cancel()
+
+        if invalid is not None:
+            return invalid
+        raise last_error
+
+
+_service = RewriteService()
+
+
+def get_rewrite_service():
+    return _service
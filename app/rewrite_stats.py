@@ -0,0 +1,79 @@
+import logging
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import RewriteStats
+
+logger = logging.getLogger("ai_variation")
+
+STATS_PK = 1
+
+
+def bump_rewrite_stats(**counters):
+    """Add `counters` (RewriteStats field -> amount) to the shared row. Never raises."""
+    counters = {name: amount for name, amount in counters.items() if amount}
+    if not counters:
+        return
+    try:
+        RewriteStats.objects.get_or_create(pk=STATS_PK)
+        RewriteStats.objects.filter(pk=STATS_PK).update(
+            updated_at=timezone.now(),
+            **{name: F(name) + amount for name, amount in counters.items()},
+        )
+    except Exception as e:
+        logger.warning("Could not record rewrite stats: %s", str(e))
+
+
+def record_response(hedged):
+    """Count the hedging outcome and token usage of a rewrite_service.HedgedResponse."""
+    usage = getattr(hedged.response, "usage", None)
+    details = getattr(usage, "input_tokens_details", None)
+
+    def tokens(source, name):
+        value = getattr(source, name, None)
+        return value if isinstance(value, int) else 0
+
+    bump_rewrite_stats(
+        hedged_requests=1 if hedged.hedged else 0,
+        hedge_wins=1 if hedged.hedge_won else 0,
+        input_tokens=tokens(usage, "input_tokens"),
+        cached_input_tokens=tokens(details, "cached_tokens"),
+        output_tokens=tokens(usage, "output_tokens"),
+    )
+    return hedged
+
+
+def record_reply(parsed):
+    """Count a parsed GPT reply (a rewrite_schema.ParsedReply) and return it."""
+    bump_rewrite_stats(
+        replies=1,
+        invalid_replies=1 if parsed.invalid else 0,
+        undecodable_replies=0 if parsed.decoded else 1,
+        invalid_fields=len(parsed.invalid),
+        parse_ms=parsed.parse_ms,
+    )
+    return parsed
+
+
+def rewrite_stats():
+    """Parse-failure rate, parse time, field-retry and hedging outcomes, and prompt-cache usage of GPT rewrites."""
+    stats, _ = RewriteStats.objects.get_or_create(pk=STATS_PK)
+    replies = stats.replies
+    return {
+        "replies": replies,
+        "invalid_replies": stats.invalid_replies,
+        "undecodable_replies": stats.undecodable_replies,
+        "parse_failure_rate": round(stats.invalid_replies / replies, 4) if replies else 0.0,
+        "avg_parse_ms": round(stats.parse_ms / replies, 3) if replies else 0.0,
+        "invalid_fields": stats.invalid_fields,
+        "retried_fields": stats.retried_fields,
+        "recovered_fields": stats.recovered_fields,
+        "hedged_requests": stats.hedged_requests,
+        "hedge_wins": stats.hedge_wins,
+        "hedge_win_rate": round(stats.hedge_wins / stats.hedged_requests, 4) if stats.hedged_requests else 0.0,
+        "input_tokens": stats.input_tokens,
+        "cached_input_tokens": stats.cached_input_tokens,
+        "cached_input_ratio": round(stats.cached_input_tokens / stats.input_tokens, 4) if stats.input_tokens else 0.0,
+        "output_tokens": stats.output_tokens,
+    }
@@ -0,0 +1,248 @@
+import logging
+import random
+import threading
+import time
+
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import DistributionDailyRollup, MasterNewsPost, NewsDistribution
+from .signals import distributions_changed
+from .stats import date_window
+
+logger = logging.getLogger("publish")
+
+# Tries per distribution write transaction before giving up on lock/unique conflicts with concurrent writers
+WRITE_ATTEMPTS = 4
+
+# Grain of DistributionDailyRollup, in key-tuple order
+ROLLUP_KEY_FIELDS = ("day", "portal_id", "author_id", "master_category_id", "status")
+
+# NewsDistribution values that place a row in the rollup
+STATE_FIELDS = ("id", "created_at", "portal_id", "news_post__created_by_id", "master_category_id", "status", "retry_count")
+
+
+def distribution_states(queryset):
+    """{distribution id: (rollup key, retry_count)} for the rows of a NewsDistribution queryset."""
+    states = {}
+    for pk, created_at, portal_id, author_id, category_id, status, retry_count in (
+        queryset.order_by().values_list(*STATE_FIELDS)
+    ):
+        key = (timezone.localdate(created_at), portal_id, author_id, category_id, status)
+        states[pk] = (key, retry_count)
+    return states
+
+
+def state_deltas(before, after):
+    """Rollup key -> [count, retry_sum] changes turning the `before` states into the `after` states."""
+    deltas = {}
+    for states, sign in ((before, -1), (after, 1)):
+        for key, retry_count in states.values():
+            delta = deltas.setdefault(key, [0, 0])
+            delta[0] += sign
+            delta[1] += sign * retry_count
+    return {key: delta for key, delta in deltas.items() if any(delta)}
+
+
+def apply_rollup_deltas(deltas, create=True):
+    """
+    Add `deltas` (rollup key -> [count, retry_sum]) to DistributionDailyRollup:
+    one UPDATE for the keys that already have a row and, with `create`, one
+    bulk INSERT for the rest. Runs in the caller's transaction and raises on
+    conflicts with concurrent writers (see write_distributions).
+    """
+    if not deltas:
+        return
+    with transaction.atomic():
+        _apply_deltas(deltas, create)
+
+
+def _apply_deltas(deltas, create):
+    match = Q()
+    for key in deltas:
+        match |= Q(**dict(zip(ROLLUP_KEY_FIELDS, key)))
+
+    existing = {}
+    rows = (
+        DistributionDailyRollup.objects.select_for_update()
+        .filter(match)
+        .order_by("pk")
+        .values_list("pk", *ROLLUP_KEY_FIELDS)
+    )
+    for pk, *key in rows:
+        # Rows without a master category are not covered by the unique constraint: use the first
+        existing.setdefault(tuple(key), pk)
+
+    if existing:
+        DistributionDailyRollup.objects.filter(pk__in=existing.values()).update(
+            count=F("count") + Case(
+                *[When(pk=pk, then=Value(deltas[key][0])) for key, pk in existing.items()], default=Value(0)
+            ),
+            retry_sum=F("retry_sum") + Case(
+                *[When(pk=pk, then=Value(deltas[key][1])) for key, pk in existing.items()], default=Value(0)
+            ),
+            updated_at=timezone.now(),
+        )
+
+    if create:
+        DistributionDailyRollup.objects.bulk_create([
+            DistributionDailyRollup(**dict(zip(ROLLUP_KEY_FIELDS, key)), count=count, retry_sum=retry_sum)
+            for key, (count, retry_sum) in deltas.items()
+            if key not in existing
+        ])
+
+
+def write_distributions(queryset, write):
+    """
+    Run `write()`, a write to the NewsDistribution rows of `queryset`, and
+    keep the rollups in step in the same transaction: the rows' states are
+    read (and locked) before the write and re-read after, and the difference
+    is applied. The queryset may match more rows than are written (unchanged
+    rows cancel out), so it must select every row the write touches.
+
+    Lock or unique conflicts with concurrent writers (e.g. "database is
+    locked" on SQLite) retry the whole transaction up to WRITE_ATTEMPTS times
+    when it is the outermost one; inside a caller's transaction they are
+    raised for the caller to retry. Sends distributions_changed and returns
+    write()'s result.
+    """
+    attempts = WRITE_ATTEMPTS if transaction.get_autocommit() else 1
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                before = distribution_states(queryset.select_for_update(of=("self",)))
+                # Saves made by write() are covered here, not by distribution_saving/_saved
+                _writing.depth = getattr(_writing, "depth", 0) + 1
+                try:
+                    result = write()
+                finally:
+                    _writing.depth -= 1
+                deltas = state_deltas(before, distribution_states(queryset))
+                apply_rollup_deltas(deltas)
+            break
+        except (IntegrityError, OperationalError) as e:
+            if attempt == attempts - 1:
+                raise
+            logger.warning("Distribution write conflicted, retrying: %s", str(e))
+            time.sleep(random.uniform(0.05, 0.2) * (attempt + 1))
+
+    if deltas:
+        distributions_changed.send(sender=NewsDistribution, author_ids={key[2] for key in deltas})
+    return result
+
+
+# Nesting depth of write_distributions() calls on this thread
+_writing = threading.local()
+
+
+@receiver(pre_save, sender=NewsDistribution)
+def distribution_saving(sender, instance, raw=False, **kwargs):
+    """Remember the stored state of a row about to be saved outside write_distributions (e.g. from the admin)."""
+    if raw or getattr(_writing, "depth", 0):
+        return
+    if instance._state.adding or instance.pk is None:
+        instance._rollup_before = {}
+    else:
+        instance._rollup_before = distribution_states(NewsDistribution.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=NewsDistribution)
+def distribution_saved(sender, instance, raw=False, **kwargs):
+    before = instance.__dict__.pop("_rollup_before", None)
+    if raw or before is None:
+        return
+    deltas = state_deltas(before, distribution_states(NewsDistribution.objects.filter(pk=instance.pk)))
+    apply_rollup_deltas(deltas)
+    if deltas:
+        distributions_changed.send(sender=NewsDistribution, author_ids={key[2] for key in deltas})
+
+
+# Distributions being deleted, per delete call (its `origin`): rollup states
+# collected from pre_delete and applied once the call's last row is gone
+_deleting = threading.local()
+
+
+@receiver(pre_delete, sender=NewsDistribution)
+def distribution_deleting(sender, instance, origin=None, **kwargs):
+    pending = getattr(_deleting, "pending", None)
+    if pending is None or pending["origin"] is not origin:
+        # Django sends every pre_delete of a delete call before its first post_delete
+        pending = _deleting.pending = {"origin": origin, "rows": [], "remaining": 0}
+    pending["rows"].append((
+        instance.news_post_id,
+        (timezone.localdate(instance.created_at), instance.portal_id, instance.master_category_id, instance.status),
+        instance.retry_count,
+    ))
+    pending["remaining"] += 1
+
+
+@receiver(post_delete, sender=NewsDistribution)
+def distribution_deleted(sender, instance, origin=None, **kwargs):
+    pending = getattr(_deleting, "pending", None)
+    if pending is None or pending["origin"] is not origin:
+        return
+    pending["remaining"] -= 1
+    if pending["remaining"]:
+        return
+    _deleting.pending = None
+
+    # Still inside the delete's transaction; the posts (deleted after their distributions) still exist
+    authors = dict(
+        MasterNewsPost.objects.filter(id__in={post_id for post_id, _, _ in pending["rows"]})
+        .values_list("id", "created_by_id")
+    )
+    before = {}
+    for index, (post_id, (day, portal_id, category_id, status), retry_count) in enumerate(pending["rows"]):
+        before[index] = ((day, portal_id, authors.get(post_id), category_id, status), retry_count)
+    deltas = state_deltas(before, {})
+
+    # Never create rows: a key without one belongs to a portal or author whose rollups are deleted too
+    apply_rollup_deltas(deltas, create=False)
+    if deltas:
+        distributions_changed.send(sender=NewsDistribution, author_ids={key[2] for key in deltas})
+
+
+def rebuild_rollups(since=None):
+    """
+    Recompute DistributionDailyRollup from NewsDistribution, for every day or
+    only from the `since` date on. Returns the number of rollup rows written.
+    """
+    distributions = NewsDistribution.objects.all()
+    rollups = DistributionDailyRollup.objects.all()
+    if since:
+        distributions = distributions.filter(created_at__gte=date_window(since, since).start)
+        rollups = rollups.filter(day__gte=since)
+
+    grouped = (
+        distributions.order_by()
+        .annotate(day=TruncDate("created_at"))
+        .values("day", "portal_id", "news_post__created_by_id", "master_category_id", "status")
+        .annotate(count=Count("id"), retry_sum=Sum("retry_count"))
+    )
+
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=5000):
+            batch.append(DistributionDailyRollup(
+                day=row["day"],
+                portal_id=row["portal_id"],
+                author_id=row["news_post__created_by_id"],
+                master_category_id=row["master_category_id"],
+                status=row["status"],
+                count=row["count"],
+                retry_sum=row["retry_sum"] or 0,
+            ))
+            if len(batch) == 5000:
+                written += len(DistributionDailyRollup.objects.bulk_create(batch))
+                batch = []
+        written += len(DistributionDailyRollup.objects.bulk_create(batch))
+
+    # Any author's numbers may have moved
+    distributions_changed.send(sender=NewsDistribution, author_ids=None)
+    return written
@@ -0,0 +1,141 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ScheduledPublish
+from .planner import build_publish_plan
+from .publishing import enqueue_publish_job, prefetch_variations
+
+logger = logging.getLogger("publish")
+
+# Schedules the scheduler still has to act on
+WAITING_STATUSES = ["PENDING", "PREPARED"]
+
+
+def schedule_publish(plan, publish_at):
+    """
+    Defer `plan` until `publish_at`. A waiting schedule for the same post and
+    master category is replaced, so re-scheduling never publishes twice.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ScheduledPublish.objects.filter(
+            news_post=plan.news_post,
+            master_category_id=plan.master_category_id,
+            status__in=WAITING_STATUSES,
+        ).update(status="CANCELLED", updated_at=now)
+
+        schedule = ScheduledPublish.objects.create(
+            news_post=plan.news_post,
+            master_category_id=plan.master_category_id,
+            requested_by=plan.user,
+            excluded_portals=[entry.portal.id for entry in plan.entries if entry.skipped],
+            publish_at=publish_at,
+        )
+
+    logger.info("Scheduled post %s for %s (schedule %s)", plan.news_post.id, publish_at, schedule.id)
+    return schedule
+
+
+def reschedule_post(news_post, content_changed=True):
+    """
+    Keep waiting schedules in step with an edited post: move them to its
+    schedule_date and, when its content changed, send prepared ones back to
+    PENDING so their AI variations are regenerated from the new content.
+    """
+    if not news_post.schedule_date:
+        return 0
+    changes = {"publish_at": news_post.schedule_date, "updated_at": timezone.now()}
+    if content_changed:
+        changes.update(status="PENDING", prepared_at=None)
+    return ScheduledPublish.objects.filter(news_post=news_post, status__in=WAITING_STATUSES).update(**changes)
+
+
+def next_wakeup(prepare=True):
+    """
+    The earliest moment the scheduler has work: the next schedule falling due
+    or, with `prepare`, the next PENDING schedule entering its preparation
+    window. Two index lookups on (status, publish_at); None when nothing waits.
+    """
+    lead = timedelta(seconds=settings.SCHEDULED_PUBLISH_PREPARE_SECONDS if prepare else 0)
+    times = []
+    for status, offset in (("PENDING", lead), ("PREPARED", timedelta())):
+        publish_at = ScheduledPublish.objects.filter(status=status).order_by(
+            "publish_at"
+        ).values_list("publish_at", flat=True).first()
+        if publish_at:
+            times.append(publish_at - offset)
+    return min(times) if times else None
+
+
+def _claim(statuses, due_before, limit, **changes):
+    """Move up to `limit` due schedules out of `statuses`; rows claimed by another scheduler are skipped."""
+    with transaction.atomic():
+        schedule_ids = list(
+            ScheduledPublish.objects.select_for_update(skip_locked=True)
+            .filter(status__in=statuses, publish_at__lte=due_before)
+            .order_by("publish_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not schedule_ids:
+            return []
+        ScheduledPublish.objects.filter(id__in=schedule_ids).update(updated_at=timezone.now(), **changes)
+
+    return list(
+        ScheduledPublish.objects.filter(id__in=schedule_ids)
+        .select_related("news_post", "requested_by")
+        .order_by("publish_at")
+    )
+
+
+def _plan(schedule):
+    return build_publish_plan(
+        schedule.news_post, schedule.master_category_id, schedule.requested_by, schedule.excluded_portals
+    )
+
+
+def fire_due(limit=None):
+    """Queue a PublishJob for every schedule whose publish_at has passed."""
+    now = timezone.now()
+    schedules = _claim(
+        WAITING_STATUSES, now, limit or settings.PUBLISH_WORKER_BATCH_SIZE, status="FIRED", fired_at=now
+    )
+
+    for schedule in schedules:
+        try:
+            plan = _plan(schedule)
+            if not plan.entries:
+                raise ValueError("No portals mapped for this master category.")
+            schedule.job = enqueue_publish_job(plan)
+            ScheduledPublish.objects.filter(pk=schedule.pk).update(job=schedule.job)
+        except Exception as e:
+            logger.exception("Scheduled publish %s failed: %s", schedule.id, str(e))
+            schedule.status = "FAILED"
+            ScheduledPublish.objects.filter(pk=schedule.pk).update(status="FAILED", error=str(e))
+    return schedules
+
+
+def prepare_due(limit=None):
+    """
+    Pre-generate the AI variations of schedules due within
+    SCHEDULED_PUBLISH_PREPARE_SECONDS. They land in the rewrite cache, so
+    the publish worker only has to deliver when the job fires.
+    """
+    now = timezone.now()
+    horizon = now + timedelta(seconds=settings.SCHEDULED_PUBLISH_PREPARE_SECONDS)
+    schedules = _claim(
+        ["PENDING"], horizon, limit or settings.SCHEDULED_PUBLISH_PREPARE_BATCH_SIZE,
+        status="PREPARED", prepared_at=now,
+    )
+
+    for schedule in schedules:
+        try:
+            plan = _plan(schedule)
+            prefetch_variations([(entry.portal.id, schedule.news_post, entry) for entry in plan.entries])
+        except Exception as e:
+            # Not fatal: the worker rewrites whatever is missing when the job runs
+            logger.exception("Could not prepare scheduled publish %s: %s", schedule.id, str(e))
+    return schedules
@@ -11,7 +11,10 @@ class PortalSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Portal
-        fields = ["id", "name", "base_url", "api_key", "secret_key"]
+        fields = [
+            "id", "name", "base_url", "api_key", "secret_key", "request_timeout",
+            "image_max_width", "image_max_height", "image_format", "image_quality",
+        ]
 
     # def validate_name(self, value):
     #     if Portal.objects.filter(name=value).exclude(id=self.instance.id if self.instance else None).exists():
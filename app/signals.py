@@ -0,0 +1,78 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import MasterNewsPost, NewsDistribution
+from .stats_cache import invalidate_stats
+
+# Sent by app.rollups after bulk/queryset writes that bypass post_save,
+# with `author_ids`: the post authors whose distribution counts changed (None: any author)
+distributions_changed = Signal()
+
+
+# Invalidations waiting for the current transaction to commit
+_pending = threading.local()
+
+
+def _invalidate_on_commit(author_ids=None, post_ids=()):
+    """
+    Invalidate the stats of `author_ids` (None: everyone) and of the authors
+    of `post_ids` once the current transaction commits: a refresh started
+    before the commit would cache the old numbers as current. Writes of one
+    transaction (e.g. a cascading delete of many posts) are merged into a
+    single invalidation.
+    """
+    pending = getattr(_pending, "batch", None)
+    if pending is None:
+        pending = _pending.batch = {"author_ids": set(), "post_ids": set()}
+    if author_ids is None or pending["author_ids"] is None:
+        pending["author_ids"] = None
+    else:
+        pending["author_ids"].update(author_ids)
+    pending["post_ids"].update(post_ids)
+
+    # Run right away outside a transaction. Inside one, every write queues a
+    # flush: the first to run takes the whole batch and the rest find nothing.
+    # Writes rolled back stay pending and only widen the next invalidation.
+    transaction.on_commit(_flush_invalidations)
+
+
+def _flush_invalidations():
+    pending = getattr(_pending, "batch", None)
+    if pending is None:
+        return
+    _pending.batch = None
+
+    author_ids = pending["author_ids"]
+    if author_ids is not None and pending["post_ids"]:
+        try:
+            author_ids |= set(
+                MasterNewsPost.objects.filter(id__in=pending["post_ids"]).values_list("created_by_id", flat=True)
+            )
+        except Exception:
+            author_ids = None
+    invalidate_stats(author_ids)
+
+
+@receiver(distributions_changed)
+def distributions_changed_handler(sender, author_ids=None, **kwargs):
+    _invalidate_on_commit(author_ids)
+
+
+# No post_delete receiver here: it would turn every cascading post delete into one
+# query per distribution. Deleting a post is caught by master_news_post_changed.
+@receiver(post_save, sender=NewsDistribution)
+def news_distribution_changed(sender, instance, **kwargs):
+    # The post's author is looked up when the batch is flushed, once per transaction
+    if NewsDistribution.news_post.is_cached(instance):
+        _invalidate_on_commit([instance.news_post.created_by_id])
+    else:
+        _invalidate_on_commit((), post_ids=[instance.news_post_id])
+
+
+@receiver(post_save, sender=MasterNewsPost)
+@receiver(post_delete, sender=MasterNewsPost)
+def master_news_post_changed(sender, instance, **kwargs):
+    _invalidate_on_commit([instance.created_by_id])
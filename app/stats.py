@@ -0,0 +1,142 @@
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DistributionDailyRollup
+
+# Counters of the "news_distribution" stats block, in response order
+DISTRIBUTION_COUNTERS = {
+    "total_distributions": Count("id"),
+    "successful_distributions": Count("id", filter=Q(status="SUCCESS")),
+    "failed_distributions": Count("id", filter=Q(status="FAILED")),
+    "pending_distributions": Count("id", filter=Q(status="PENDING")),
+    "dead_distributions": Count("id", filter=Q(status="DEAD")),
+    "retry_counts": Coalesce(Sum("retry_count"), 0),
+}
+
+# The same counters over DistributionDailyRollup rows
+ROLLUP_COUNTERS = {
+    "total_distributions": Coalesce(Sum("count"), 0),
+    "successful_distributions": Coalesce(Sum("count", filter=Q(status="SUCCESS")), 0),
+    "failed_distributions": Coalesce(Sum("count", filter=Q(status="FAILED")), 0),
+    "pending_distributions": Coalesce(Sum("count", filter=Q(status="PENDING")), 0),
+    "dead_distributions": Coalesce(Sum("count", filter=Q(status="DEAD")), 0),
+    "retry_counts": Coalesce(Sum("retry_sum"), 0),
+}
+
+
+class DateWindow(namedtuple("DateWindow", ["first_day", "last_day", "start", "end"])):
+    """
+    The inclusive local days [first_day, last_day] of a stats request and the
+    same window as a half-open datetime range [start, end) in the current
+    timezone. Filtering `start <= column < end` keeps the column bare, so an
+    index on it can be used (a `__date` lookup casts every row first).
+    """
+
+    __slots__ = ()
+
+    def lookup(self, field):
+        """Filter kwargs restricting the datetime `field` to the window."""
+        return {f"{field}__gte": self.start, f"{field}__lt": self.end}
+
+    def key(self):
+        return f"{self.first_day.isoformat()}..{self.last_day.isoformat()}"
+
+
+def date_window(first_day, last_day):
+    """DateWindow covering the local days first_day..last_day (inclusive)."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first_day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min), tz)
+    return DateWindow(first_day, last_day, start, end)
+
+
+def request_date_window(query_params):
+    """
+    The DateWindow of the stats endpoints: `?today=true` or
+    `?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD` (both days included).
+    None when neither is given; ValidationError for malformed dates.
+    """
+    today_param = query_params.get("today")
+    start_date = query_params.get("start_date")
+    end_date = query_params.get("end_date")
+
+    if today_param and today_param.lower() == "true":
+        today = timezone.localdate()
+        return date_window(today, today)
+    if start_date and end_date:
+        try:
+            first_day, last_day = parse_date(start_date), parse_date(end_date)
+        except ValueError:
+            first_day = last_day = None
+        if first_day is None or last_day is None:
+            raise ValidationError("start_date and end_date must be YYYY-MM-DD dates.")
+        if first_day > last_day:
+            raise ValidationError("start_date must not be after end_date.")
+        return date_window(first_day, last_day)
+    return None
+
+
+def window_lookup(window, field="created_at"):
+    """`window.lookup(field)`, or no filter at all without a window."""
+    return window.lookup(field) if window else {}
+
+
+def rollup_distributions(window, **filters):
+    """DistributionDailyRollup rows of the days of `window` (plus `filters`)."""
+    return DistributionDailyRollup.objects.filter(day__range=(window.first_day, window.last_day), **filters)
+
+
+def distribution_breakdown(queryset):
+    """
+    Per-portal DISTRIBUTION_COUNTERS of a NewsDistribution (or
+    DistributionDailyRollup) queryset, computed in a single grouped query with
+    conditional aggregates. Returns a list of dicts with portal_id, portal__name
+    and the counters, ordered by portal name.
+    """
+    counters = ROLLUP_COUNTERS if queryset.model is DistributionDailyRollup else DISTRIBUTION_COUNTERS
+    return list(
+        queryset.order_by()
+        .values("portal_id", "portal__name")
+        .annotate(**counters)
+        .order_by("portal__name", "portal_id")
+    )
+
+
+def distribution_stats(queryset):
+    """
+    The "news_distribution" block of the admin stats: status counts, retry
+    sum and totals per portal name. One query (totals are summed from the
+    per-portal breakdown).
+    """
+    rows = distribution_breakdown(queryset)
+    stats = {name: sum(row[name] for row in rows) for name in DISTRIBUTION_COUNTERS}
+
+    portal_counts = {}
+    for row in rows:
+        portal_counts[row["portal__name"]] = portal_counts.get(row["portal__name"], 0) + row["total_distributions"]
+    stats["portal_distribution_counts"] = portal_counts
+    return {"news_distribution": stats}
+
+
+def domain_distribution_stats(domains, queryset):
+    """
+    Per-domain stats of the domain distribution endpoint: one entry per Portal
+    in `domains` (zeros when it has no rows), counters from one grouped query
+    over `queryset`. Runs one query, plus one if `domains` is an unevaluated queryset.
+    """
+    rows = {row["portal_id"]: row for row in distribution_breakdown(queryset)}
+    counters = ROLLUP_COUNTERS if queryset.model is DistributionDailyRollup else DISTRIBUTION_COUNTERS
+
+    stats = []
+    for domain in domains:
+        row = rows.get(domain.id, {})
+        domain_stats = {"portal_id": domain.id, "portal_name": domain.name}
+        domain_stats.update({name: row.get(name, 0) for name in counters})
+        stats.append(domain_stats)
+    return stats
@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+logger = logging.getLogger("publish")
+
+COUNTERS = ("fresh_hits", "stale_hits", "misses", "refreshes")
+
+# Lookup counters are kept per process and published under a key only that
+# process writes: add() + incr() on a shared key is a read-modify-write on the
+# file backend, so concurrent processes would lose counts
+_COUNTERS_REGISTRY_KEY = "stats:counters:processes"
+# A process's counters expire this long after its last lookup (it has most likely
+# exited); stats_cache_stats() then drops it from the registry
+COUNTERS_TTL_SECONDS = 24 * 60 * 60
+_counters_lock = threading.Lock()
+_process = {"pid": None, "id": None, "counts": None}
+
+
+def _cache():
+    return caches["stats"]
+
+
+def _version_key(scope):
+    return f"stats:version:{scope}"
+
+
+def _versions(author_id):
+    """
+    Current data versions an entry depends on: the global epoch, plus every
+    write (MASTER scopes) or writes by `author_id` (USER scopes).
+    """
+    keys = [_version_key("epoch"), _version_key(author_id or "all")]
+    found = _cache().get_many(keys)
+    return [found.get(key) for key in keys]
+
+
+def invalidate_stats(author_ids=None):
+    """
+    Mark cached stats stale after a distribution or post write: every MASTER
+    entry and the USER entries of `author_ids` (every entry when None).
+    Entries are not deleted, so readers keep getting the stale numbers while
+    one of them refreshes.
+    """
+    scopes = ["epoch"] if author_ids is None else ["all", *set(author_ids)]
+    version = uuid.uuid4().hex
+    try:
+        _cache().set_many({_version_key(scope): version for scope in scopes}, timeout=None)
+    except Exception as e:
+        logger.warning("Could not invalidate stats cache: %s", str(e))
+
+
+def _bump(counter):
+    cache = _cache()
+    try:
+        with _counters_lock:
+            if _process["pid"] != os.getpid():
+                # First lookup of this process (or of a worker forked from it): start its own counters
+                _process.update(pid=os.getpid(), id=uuid.uuid4().hex, counts=dict.fromkeys(COUNTERS, 0))
+            _process["counts"][counter] += 1
+            process_id = _process["id"]
+            cache.set(f"stats:counters:{process_id}", _process["counts"], timeout=COUNTERS_TTL_SECONDS)
+
+        # A registration lost to a concurrent one is restored on this process's next lookup
+        processes = cache.get(_COUNTERS_REGISTRY_KEY) or []
+        if process_id not in processes:
+            live = _live_counters(processes)
+            cache.set(_COUNTERS_REGISTRY_KEY, [*live, process_id], timeout=None)
+    except Exception:
+        pass
+
+
+def _live_counters(processes):
+    """{process: counts} of the registered `processes` whose counters have not expired, in registry order."""
+    found = _cache().get_many([f"stats:counters:{process}" for process in processes])
+    return {
+        process: found[f"stats:counters:{process}"] for process in processes if f"stats:counters:{process}" in found
+    }
+
+
+def stats_key(endpoint, role_name, user, window):
+    """Cache key of one dashboard view: (endpoint, role, user for USER scopes, app.stats.DateWindow)."""
+    owner = user.id if role_name == "USER" else "all"
+    return f"stats:{endpoint}:{role_name}:{owner}:{window.key() if window else 'all-time'}"
+
+
+def _store(key, author_id, compute):
+    versions = _versions(author_id)
+    value = compute()
+    _cache().set(
+        key, {"value": value, "versions": versions, "stored_at": time.time()},
+        timeout=settings.STATS_CACHE_MAX_STALE_SECONDS,
+    )
+    return value
+
+
+def _refresh_in_background(key, author_id, compute):
+    """Recompute `key` on a thread unless another process or thread already is."""
+    lock_key = f"{key}:refreshing"
+    if not _cache().add(lock_key, 1, timeout=settings.STATS_CACHE_TTL_SECONDS):
+        return
+
+    def refresh():
+        try:
+            _store(key, author_id, compute)
+            _bump("refreshes")
+        except Exception as e:
+            logger.warning("Could not refresh cached stats %s: %s", key, str(e))
+        finally:
+            _cache().delete(lock_key)
+            connection.close()
+
+    threading.Thread(target=refresh, name="stats-refresh", daemon=True).start()
+
+
+def cached_stats(endpoint, role_name, user, window, compute):
+    """
+    Stats for one dashboard view with stale-while-revalidate semantics:
+
+    - fresh entry (younger than STATS_CACHE_TTL_SECONDS, no write since): returned as is;
+    - stale entry (older, or invalidated by a write) up to STATS_CACHE_MAX_STALE_SECONDS
+      old: returned as is while a background thread recomputes it;
+    - no entry: `compute()` runs inline and its result is cached.
+    """
+    key = stats_key(endpoint, role_name, user, window)
+    author_id = user.id if role_name == "USER" else None
+    entry = _cache().get(key)
+
+    if entry is None:
+        _bump("misses")
+        return _store(key, author_id, compute)
+
+    fresh = (
+        time.time() - entry["stored_at"] < settings.STATS_CACHE_TTL_SECONDS
+        and entry["versions"] == _versions(author_id)
+    )
+    if fresh:
+        _bump("fresh_hits")
+    else:
+        _bump("stale_hits")
+        _refresh_in_background(key, author_id, compute)
+    return entry["value"]
+
+
+def stats_cache_stats():
+    """Lookup counters (summed over every process) and hit ratios of the dashboard stats cache."""
+    cache = _cache()
+    processes = cache.get(_COUNTERS_REGISTRY_KEY) or []
+    live = _live_counters(processes)
+    counts = {counter: sum(process.get(counter, 0) for process in live.values()) for counter in COUNTERS}
+    if len(live) < len(processes):
+        # Forget exited processes (one registering meanwhile re-registers on its next lookup)
+        try:
+            cache.set(_COUNTERS_REGISTRY_KEY, list(live), timeout=None)
+        except Exception:
+            pass
+    lookups = counts["fresh_hits"] + counts["stale_hits"] + counts["misses"]
+    return {
+        **counts,
+        "hit_ratio": round((counts["fresh_hits"] + counts["stale_hits"]) / lookups, 4) if lookups else 0.0,
+        "fresh_hit_ratio": round(counts["fresh_hits"] / lookups, 4) if lookups else 0.0,
+        "ttl_seconds": settings.STATS_CACHE_TTL_SECONDS,
+        "max_stale_seconds": settings.STATS_CACHE_MAX_STALE_SECONDS,
+        "backend": settings.CACHES["stats"]["BACKEND"],
+    }
@@ -1,3 +1,403 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .circuit_breaker import allow_request, get_health, record_failure, record_success
+from .html_segments import SegmentedHTML
+from .models import (
+    DistributionDailyRollup, MasterCategory, MasterCategoryMapping, MasterNewsPost, NewsDistribution, Portal,
+    PortalCategory, PortalHealth, PortalPrompt, PublishJob, PublishTask,
+)
+from .planner import PublishPlan, build_publish_plan
+from .publishing import (
+    DistributionWriter, complete_task, lease_tasks, plan_tasks, run_task, save_distribution
+)
+from .retries import retry_distribution
+from .rollups import ROLLUP_KEY_FIELDS, rebuild_rollups
+from .stats import distribution_stats
+from .stats_cache import _bump, stats_cache_stats
+from user.models import PortalUserMapping
+
+
+class SegmentedHTMLTests(SimpleTestCase):
+    def assertRoundTrips(self, source):
+        document = SegmentedHTML(source)
+        self.assertEqual(document.render(), source)
+        return document
+
+    def test_segments_text_nodes(self):
+        document = self.assertRoundTrips("<p>Hello <b>world</b></p>\n<p>Again</p>")
+        self.assertEqual(document.segments, {"s1": "Hello", "s2": "world", "s3": "Again"})
+
+    def test_line_breaks_other_than_newline(self):
+        # HTMLParser only counts "\n" as a line break; "\r", "\x0c" and U+2028 are plain text
+        for separator in ("\r", "\r\n", "\x0c", "\u2028", "\u2029", "\x85"):
+            with self.subTest(separator=repr(separator)):
+                source = f"<p>Line{separator}break</p>\n<p>Another one</p>"
+                document = self.assertRoundTrips(source)
+                self.assertEqual(document.segments, {"s1": f"Line{separator}break", "s2": "Another one"})
+                self.assertEqual(
+                    document.render({"s1": "XX", "s2": "YY"}), "<p>XX</p>\n<p>YY</p>"
+                )
+
+
+class DistributionStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create(username="author")
+        portals = [
+            Portal.objects.create(name=f"portal-{i}", base_url=f"https://portal-{i}.example.com") for i in range(3)
+        ]
+        posts = [MasterNewsPost.objects.create(title=f"Post {i}", created_by=cls.author) for i in range(2)]
+        statuses = ["SUCCESS", "FAILED", "PENDING"]
+        NewsDistribution.objects.bulk_create([
+            NewsDistribution(news_post=post, portal=portal, status=statuses[(i + j) % 3], retry_count=j)
+            for i, post in enumerate(posts)
+            for j, portal in enumerate(portals)
+        ])
+        dead_letter = MasterNewsPost.objects.create(title="Dead letter", created_by=cls.author)
+        NewsDistribution.objects.create(news_post=dead_letter, portal=portals[0], status="DEAD", retry_count=5)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            stats = distribution_stats(NewsDistribution.objects.all())
+        self.assertEqual(stats, {
+            "news_distribution": {
+                "total_distributions": 7,
+                "successful_distributions": 2,
+                "failed_distributions": 2,
+                "pending_distributions": 2,
+                "dead_distributions": 1,
+                "retry_counts": 11,
+                "portal_distribution_counts": {"portal-0": 3, "portal-1": 2, "portal-2": 2},
+            }
+        })
+
+    def test_single_query_for_one_author(self):
+        queryset = NewsDistribution.objects.filter(news_post__created_by=self.author)
+        with self.assertNumQueries(1):
+            stats = distribution_stats(queryset)
+        self.assertEqual(stats["news_distribution"]["total_distributions"], 7)
+
+
+class PublishPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create(username="author")
+        cls.category = MasterCategory.objects.create(name="News")
+        cls.post = MasterNewsPost.objects.create(title="Post", created_by=cls.author)
+        PortalPrompt.objects.create(name="Global", prompt_text="Global prompt", is_global_prompt=True)
+        for i in range(6):
+            portal = Portal.objects.create(name=f"portal-{i}", base_url=f"https://portal-{i}.example.com")
+            portal_category = PortalCategory.objects.create(portal=portal, name="News", external_id=str(i))
+            MasterCategoryMapping.objects.create(
+                master_category=cls.category, portal_category=portal_category, use_default_content=i % 3 == 0
+            )
+            if i % 2:
+                PortalPrompt.objects.create(portal=portal, name=f"Prompt {i}", prompt_text=f"Prompt {i}")
+                PortalUserMapping.objects.create(
+                    user=cls.author, portal=portal, portal_user_id=str(i), status="MATCHED"
+                )
+                NewsDistribution.objects.create(news_post=cls.post, portal=portal, status="FAILED")
+
+    def test_four_queries(self):
+        with self.assertNumQueries(4):
+            plan = build_publish_plan(self.post, self.category.id, self.author, excluded_portals=["portal-5"])
+            summary = plan.to_dict()
+
+        self.assertEqual(summary["total_portals"], 6)
+        self.assertEqual(summary["to_publish"], 2)
+        self.assertEqual(summary["gpt_rewrites"], 3)
+        rows = {row["portal"]: row for row in summary["portals"]}
+        self.assertEqual(rows["portal-0"]["prompt_source"], None)
+        self.assertEqual(rows["portal-1"]["prompt_source"], "PORTAL")
+        self.assertEqual(rows["portal-2"]["prompt_source"], "GLOBAL")
+        self.assertEqual(rows["portal-3"]["existing_distribution_status"], "FAILED")
+        self.assertEqual(rows["portal-5"]["action"], "SKIP")
+
+
+@override_settings(CACHES={"stats": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"}})
+class StatsCacheCounterTests(SimpleTestCase):
+    def setUp(self):
+        caches["stats"].clear()
+
+    def test_counts_summed_over_processes(self):
+        caches["stats"].set("stats:counters:other", {"fresh_hits": 3, "misses": 1})
+        caches["stats"].set("stats:counters:processes", ["other"])
+        _bump("misses")
+        stats = stats_cache_stats()
+        self.assertEqual((stats["fresh_hits"], stats["misses"]), (3, 2))
+
+    def test_expired_processes_pruned(self):
+        caches["stats"].set("stats:counters:live", {"misses": 1})
+        caches["stats"].set("stats:counters:processes", ["exited", "live"])
+        self.assertEqual(stats_cache_stats()["misses"], 1)
+        self.assertEqual(caches["stats"].get("stats:counters:processes"), ["live"])
+
+        # Registering a new process prunes as well
+        caches["stats"].set("stats:counters:processes", ["exited", "live"])
+        with mock.patch.dict("app.stats_cache._process", pid=None):
+            _bump("misses")
+        self.assertEqual(caches["stats"].get("stats:counters:processes")[:1], ["live"])
+        self.assertEqual(len(caches["stats"].get("stats:counters:processes")), 2)
+
+
+class RollupTests(TestCase):
+    """DistributionDailyRollup must match a rebuild after every kind of distribution write."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create(username="author")
+        cls.category = MasterCategory.objects.create(name="News")
+        cls.portals = [
+            Portal.objects.create(name=f"portal-{i}", base_url=f"https://portal-{i}.example.com") for i in range(2)
+        ]
+        cls.post = MasterNewsPost.objects.create(title="Post", created_by=cls.author)
+
+    def rollups(self):
+        # Rows emptied by live updates are kept at zero; a rebuild drops them
+        rollups = DistributionDailyRollup.objects.exclude(count=0, retry_sum=0)
+        return list(rollups.order_by(*ROLLUP_KEY_FIELDS).values_list(*ROLLUP_KEY_FIELDS, "count", "retry_sum"))
+
+    def assertRollupsMatchRebuild(self):
+        live = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(live, self.rollups())
+
+    def publish(self, success):
+        plan = PublishPlan.for_targets(
+            self.post, self.category.id, self.author, [(portal, None, True, False) for portal in self.portals]
+        )
+        rewritten = ("Title", "Short", "Content", "Meta", "slug")
+        save_distribution(self.post, plan.entries[0], self.category.id, success, "ok", None, rewritten)
+        writer = DistributionWriter()
+        writer.add(self.post, plan.entries[1], self.category.id, success, "ok", None, rewritten)
+        writer.flush()
+
+    def test_publish(self):
+        self.publish(success=False)
+        self.assertEqual(self.rollups()[0][-2:], (1, 0))
+        self.assertRollupsMatchRebuild()
+        self.publish(success=True)
+        self.assertRollupsMatchRebuild()
+
+    def test_retry(self):
+        self.publish(success=False)
+        with mock.patch("app.retries.deliver_to_portal", return_value=(False, "down")):
+            for distribution in NewsDistribution.objects.select_related("news_post", "portal"):
+                retry_distribution(distribution)
+        self.assertRollupsMatchRebuild()
+
+    def test_republish_resets_retry_count(self):
+        self.publish(success=False)
+        NewsDistribution.objects.update(status="DEAD", retry_count=5)
+        rebuild_rollups()
+        self.publish(success=False)
+        self.assertEqual(list(NewsDistribution.objects.values_list("status", "retry_count")), [("FAILED", 0)] * 2)
+        self.assertRollupsMatchRebuild()
+
+    def test_save(self):
+        self.publish(success=False)
+        distribution = NewsDistribution.objects.get(portal=self.portals[0])
+        distribution.status = "SUCCESS"
+        distribution.retry_count = 2
+        distribution.save()
+        self.assertRollupsMatchRebuild()
+        other_post = MasterNewsPost.objects.create(title="Other post", created_by=self.author)
+        NewsDistribution.objects.create(news_post=other_post, portal=self.portals[0], status="PENDING")
+        self.assertRollupsMatchRebuild()
+
+    def test_delete(self):
+        self.publish(success=True)
+        NewsDistribution.objects.get(portal=self.portals[0]).delete()
+        self.assertRollupsMatchRebuild()
+        self.post.delete()
+        self.assertRollupsMatchRebuild()
+        self.assertEqual(self.rollups(), [])
+
+
+@mock.patch("app.publishing.deliver_to_portal", return_value=(True, "Published"))
+class PublishTaskLeaseTests(TestCase):
+    REWRITTEN = ("Title", "Short", "Content", "Meta", "slug")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create(username="author")
+        cls.portal = Portal.objects.create(name="portal", base_url="https://portal.example.com")
+        PortalUserMapping.objects.create(user=cls.author, portal=cls.portal, portal_user_id="42", status="MATCHED")
+        cls.post = MasterNewsPost.objects.create(title="Post", created_by=cls.author)
+
+    def setUp(self):
+        self.job = PublishJob.objects.create(news_post=self.post, requested_by=self.author, total_tasks=1)
+        self.task = PublishTask.objects.create(job=self.job, portal=self.portal, use_default_content=True)
+
+    def lease(self, worker_id):
+        tasks = lease_tasks(worker_id)
+        return tasks[0] if tasks else None
+
+    def expire_lease(self):
+        PublishTask.objects.filter(pk=self.task.pk).update(leased_until=timezone.now() - timedelta(seconds=1))
+
+    def run_leased(self, task, writer=None):
+        return run_task(task, plan_tasks([task])[task.id], rewritten=self.REWRITTEN, writer=writer)
+
+    def test_expired_lease_is_taken_over(self, deliver):
+        first = self.lease("worker-1")
+        self.assertIsNone(self.lease("worker-2"))
+
+        self.expire_lease()
+        second = self.lease("worker-2")
+        self.assertEqual((second.worker_id, second.attempts), ("worker-2", 2))
+
+        # The first worker can no longer record an outcome; the new holder can
+        with self.assertLogs("publish", "WARNING"):
+            self.assertFalse(complete_task(first, {"success": False, "response": "late"}))
+        self.assertTrue(complete_task(second, {"success": True, "response": "Published"}))
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.response_message), ("SUCCESS", "Published"))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "COMPLETED")
+
+    @override_settings(PUBLISH_TASK_MAX_ATTEMPTS=2)
+    def test_task_failed_at_attempt_cap(self, deliver):
+        self.lease("worker-1")
+        self.expire_lease()
+        self.lease("worker-2")
+        self.expire_lease()
+
+        with self.assertLogs("publish", "WARNING"):
+            self.assertIsNone(self.lease("worker-3"))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, "FAILED")
+        self.assertEqual(self.task.response_message, "Gave up after 2 attempts")
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "COMPLETED")
+
+    def test_lost_lease_is_not_delivered(self, deliver):
+        first = self.lease("worker-1")
+        self.expire_lease()
+        self.lease("worker-2")
+
+        with self.assertLogs("publish", "WARNING"):
+            result = self.run_leased(first)
+        self.assertEqual(result, {"success": False, "response": "Lease lost before delivery"})
+        deliver.assert_not_called()
+        self.assertFalse(NewsDistribution.objects.exists())
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.worker_id), ("RUNNING", "worker-2"))
+
+    def test_completed_after_distribution_written(self, deliver):
+        writer = DistributionWriter(batch_size=10)
+        self.run_leased(self.lease("worker-1"), writer=writer)
+        deliver.assert_called_once()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, "RUNNING")
+
+        writer.flush()
+        self.assertEqual(NewsDistribution.objects.get().status, "SUCCESS")
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, "SUCCESS")
+
+    def test_failed_when_distribution_write_fails(self, deliver):
+        writer = DistributionWriter(batch_size=10)
+        self.run_leased(self.lease("worker-1"), writer=writer)
+
+        with mock.patch("app.publishing.write_distributions", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                writer.flush()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, "FAILED")
+        self.assertEqual(self.task.response_message, "Could not record the result: disk full")
+
+
+@override_settings(CIRCUIT_FAILURE_THRESHOLD=3, CIRCUIT_RESET_SECONDS=60)
+class CircuitBreakerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.portal = Portal.objects.create(name="portal", base_url="https://portal.example.com")
+
+    def state(self):
+        return get_health(self.portal).state
+
+    def open_circuit(self):
+        with self.assertLogs("publish", "WARNING"):
+            for _ in range(3):
+                record_failure(self.portal, 100, "boom")
+
+    def age_circuit(self, seconds=61):
+        """Move the circuit's opened_at `seconds` into the past."""
+        opened_at = get_health(self.portal).opened_at
+        PortalHealth.objects.filter(portal=self.portal).update(opened_at=opened_at - timedelta(seconds=seconds))
+
+    def test_opens_at_failure_threshold(self):
+        record_failure(self.portal, 100, "boom")
+        record_failure(self.portal, 100, "boom")
+        self.assertEqual(self.state(), "CLOSED")
+        self.assertTrue(allow_request(self.portal))
+
+        with self.assertLogs("publish", "WARNING"):
+            record_failure(self.portal, 100, "boom")
+        self.assertEqual(self.state(), "OPEN")
+        self.assertFalse(allow_request(self.portal))
+
+    def test_success_resets_failure_count(self):
+        record_failure(self.portal, 100, "boom")
+        record_failure(self.portal, 100, "boom")
+        record_success(self.portal, 50)
+        record_failure(self.portal, 100, "boom")
+        self.assertEqual(self.state(), "CLOSED")
+
+    def test_half_open_after_reset_period(self):
+        self.open_circuit()
+        self.age_circuit(seconds=59)
+        self.assertFalse(allow_request(self.portal))
+
+        self.age_circuit(seconds=2)
+        with self.assertLogs("publish", "INFO"):
+            self.assertTrue(allow_request(self.portal))
+        self.assertEqual(self.state(), "HALF_OPEN")
+        # The probe is out: nobody else gets through meanwhile
+        self.assertFalse(allow_request(self.portal))
+
+    def test_successful_probe_closes(self):
+        self.open_circuit()
+        self.age_circuit()
+        with self.assertLogs("publish", "INFO"):
+            allow_request(self.portal)
+        record_success(self.portal, 50)
+        self.assertEqual(self.state(), "CLOSED")
+        self.assertTrue(allow_request(self.portal))
+
+    def test_failed_probe_reopens(self):
+        self.open_circuit()
+        self.age_circuit()
+        with self.assertLogs("publish", "INFO"):
+            allow_request(self.portal)
+        with self.assertLogs("publish", "WARNING"):
+            record_failure(self.portal, 100, "still down")
+        self.assertEqual(self.state(), "OPEN")
+        self.assertFalse(allow_request(self.portal))
+
+    def test_lost_probe_is_replaced(self):
+        self.open_circuit()
+        self.age_circuit()
+        with self.assertLogs("publish", "INFO"):
+            allow_request(self.portal)
+        self.age_circuit()
+        with self.assertLogs("publish", "INFO"):
+            self.assertTrue(allow_request(self.portal))
+
+    def test_single_probe_between_racing_callers(self):
+        self.open_circuit()
+        self.age_circuit()
+        # Both callers read the OPEN row before either switched it to HALF_OPEN
+        stale = get_health(self.portal)
+        with mock.patch("app.circuit_breaker.get_health", return_value=stale):
+            with self.assertLogs("publish", "INFO"):
+                self.assertTrue(allow_request(self.portal))
+            self.assertFalse(allow_request(self.portal))
+        self.assertEqual(self.state(), "HALF_OPEN")
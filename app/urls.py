@@ -5,7 +5,9 @@ from .views import (
     GroupCreateListAPIView, GroupRetrieveUpdateDeleteAPIView, GroupCategoriesListAPIView, MasterNewsPostPublishAPIView,
     NewsPostCreateAPIView, PortalCreateAPIView, UserPostsListAPIView, AllNewsPostsAPIView, NewsDistributionListAPIView,
     NewsDistributionDetailAPIView, AdminStatsAPIView, DomainDistributionStatsAPIView, AllPortalsTagsLiveAPIView, 
-    NewsPostUpdateAPIView, MyPostsListAPIView
+    NewsPostUpdateAPIView, MyPostsListAPIView, PublishJobStatusAPIView,
+    RewriteCacheStatsAPIView, PortalHealthAPIView, PublishPlanAPIView, MasterNewsPostPublishStreamAPIView,
+    PublishJobEventsAPIView, MasterNewsPostScheduleAPIView, RewriteStatsAPIView, StatsCacheAPIView
 )
 
 urlpatterns = [
@@ -36,6 +38,11 @@ urlpatterns = [
     path('news/create/', NewsPostCreateAPIView.as_view()),
     path('news/update/<int:pk>/', NewsPostUpdateAPIView.as_view()),
     path('publish/news/<int:pk>/', MasterNewsPostPublishAPIView.as_view()),
+    path('publish/news/<int:pk>/stream/', MasterNewsPostPublishStreamAPIView.as_view()),
+    path('publish/news/<int:pk>/schedule/', MasterNewsPostScheduleAPIView.as_view()),
+    path('publish/jobs/<int:pk>/', PublishJobStatusAPIView.as_view()),
+    path('publish/jobs/<int:pk>/events/', PublishJobEventsAPIView.as_view()),
+    path('publish/plan/<int:pk>/', PublishPlanAPIView.as_view()),
     path('user/news/posts/', UserPostsListAPIView.as_view()),
     path('my/news/posts/', MyPostsListAPIView.as_view()),
     path('all/posts/', AllNewsPostsAPIView.as_view()),
@@ -44,5 +51,9 @@ urlpatterns = [
     
     # Stats 
     path('admin/stats/', AdminStatsAPIView.as_view()),
+    path('admin/stats/cache/', StatsCacheAPIView.as_view()),
     path('domain/distribution/', DomainDistributionStatsAPIView.as_view()),
+    path('domain/health/', PortalHealthAPIView.as_view()),
+    path('ai/cache/stats/', RewriteCacheStatsAPIView.as_view()),
+    path('ai/rewrite/stats/', RewriteStatsAPIView.as_view()),
 ]
@@ -1,91 +1,266 @@
+import asyncio
 import json
-import re
+import time
 import logging
+from collections import namedtuple
 
-from app.models import MasterCategoryMapping
-from openai import OpenAI
+from app.fanout import FanOutExecutor
+from app.html_segments import SegmentedHTML
+from app.models import MasterCategory, MasterCategoryMapping, Portal
+from app.rewrite_cache import make_cache_key, get_cached_variation, store_variation
+from app.rewrite_prompts import (
+    batch_instruction, build_rewrite_input, headline_instruction, part_instruction, portal_instruction,
+    prompt_cache_key, retry_instruction,
+)
+from app.rewrite_schema import (
+    FIELD_NAMES, batch_schema, invalid_paths, merge_reply, parse_reply, text_format, variation_schema,
+)
+from app.rewrite_service import RewriteServiceError, get_rewrite_service
+from app.rewrite_stats import bump_rewrite_stats, record_reply, record_response
 
 from django.conf import settings
+from django.db.models import Q
 from django.utils.text import slugify
 
 logger = logging.getLogger("ai_variation") 
 
-client = OpenAI(api_key=settings.OPEN_AI_KEY)
-
 def success_response(data, message = None):
     return {"status": True, "data":data, "message":message}
 
 def error_response(message):
     return {"status": False, "message":message}
 
-def generate_variation_with_gpt(title, short_desc, desc, prompt_text, meta_title=None, slug=None, portal_name=None):
+def build_rewrite_payload(title, short_desc, desc, meta_title=None, slug=None):
     """
-    Generate rephrased version of news fields using GPT.
-    Always tries to parse JSON safely.
-    Returns (title, short_desc, desc, meta_title, slug).
+    The article fields as sent to GPT, plus the SegmentedHTML of the description.
+    With REWRITE_HTML_SEGMENTS on, only the description's text nodes are sent
+    (as `description_segments`, keyed by segment id); otherwise the full HTML
+    is sent and the segmented description is None.
     """
-    logger.info("Started AI generation for portal: %s", portal_name)
+    payload = {
+        "title": title,
+        "short_description": short_desc,
+        "meta_title": meta_title or title,
+        "slug": slug or slugify(meta_title or title),
+    }
+    segmented = None
+    if settings.REWRITE_HTML_SEGMENTS:
+        segmented = SegmentedHTML(desc)
+        payload["description_segments"] = segmented.segments
+    else:
+        payload["description"] = desc
+    return payload, segmented
+
+def sent_description(desc, segmented):
+    """The description as GPT sees (and returns) it; used for token estimates."""
+    return desc if segmented is None else json.dumps(segmented.segments, ensure_ascii=False)
+
+REWRITE_OPTION_FIELDS = ["chunk_chars", "chunk_parallelism", "model", "fallback_model", "latency_budget_ms"]
+
+class RewriteOptions(namedtuple("RewriteOptions", REWRITE_OPTION_FIELDS, defaults=[None] * len(REWRITE_OPTION_FIELDS))):
+    """Per-prompt rewrite tuning (from PortalPrompt); empty fields fall back to settings."""
+
+    @classmethod
+    def from_prompt(cls, prompt):
+        return cls(*[getattr(prompt, field, None) or None for field in REWRITE_OPTION_FIELDS])
+
+    @property
+    def rewrite_model(self):
+        return self.model or settings.OPENAI_REWRITE_MODEL
+
+    @property
+    def hedge_model(self):
+        """Model of hedged requests (None: the rewrite model itself)."""
+        return self.fallback_model or settings.OPENAI_FALLBACK_MODEL or None
 
+    @property
+    def max_chunk_chars(self):
+        return self.chunk_chars or settings.REWRITE_CHUNK_CHARS
 
-    user_content = f"""
-    Rewrite the following news content for the portal
-    Each portal must have a unique variation of the rewritten content.
+    @property
+    def parallelism(self):
+        return max(1, self.chunk_parallelism or settings.REWRITE_CHUNK_PARALLELISM)
 
-    Rules:
-    - Preserve all HTML tags, attributes, styles, images, links, lists, and formatting inside the description.
-    - Rewrite the textual content for: title, short_description, description, and meta_title.
-    - The short_description must be a concise 1–2 sentence less than 160 characters, summary of the rewritten description.
-    - Generate a new slug as a clean, URL-safe version of the rewritten meta_title (lowercase, hyphen separated).
-    - Ensure wording differs slightly for each portal, but keep meaning intact.
-    - Do not remove, add, or modify any HTML structure.
+    def should_chunk(self, segmented):
+        """Long segmented articles are rewritten chunk by chunk."""
+        if segmented is None or not self.max_chunk_chars:
+            return False
+        return sum(len(text) for text in segmented.segments.values()) > self.max_chunk_chars
 
-    Return ONLY valid JSON with keys: title, short_description, description, meta_title, slug.
+DEFAULT_REWRITE_OPTIONS = RewriteOptions()
 
-    {{
-        "title": "{title}",
-        "short_description": "{short_desc}",
-        "description": "{desc}",
-        "meta_title": "{meta_title or title}",
-        "slug": "{slug or slugify(meta_title or title)}",
-        "portal_name":{portal_name}
-    }}
+def variation_from_reply(data, default, segmented=None):
+    """
+    Build the (title, short_desc, desc, meta_title, slug) tuple from a parsed GPT reply,
+    re-stitching segmented descriptions into the original markup.
+    Fields missing (or empty) in the reply keep their `default` value.
+    """
+    def field(name, fallback):
+        value = data.get(name)
+        return value if isinstance(value, str) and value.strip() else fallback
+
+    if segmented is not None:
+        segments = data.get("description_segments")
+        description = segmented.render(segments if isinstance(segments, dict) else None)
+    else:
+        description = field("description", default[2])
+    return (
+        field("title", default[0]),
+        field("short_description", default[1]),
+        description,
+        field("meta_title", default[3]),
+        field("slug", default[4]),
+    )
+
+def reply_schema(segmented):
+    """JSON schema of one variation reply for a payload built by build_rewrite_payload."""
+    if segmented is None:
+        return variation_schema(html_description=True)
+    return variation_schema(segment_ids=list(segmented.segments))
+
+def has_json_reply(response):
+    """A reply is usable (wins a hedged race) when it holds a JSON object; missing fields are retried later."""
+    return parse_reply(response.output_text, {"properties": {}}).decoded
+
+def estimate_input_tokens(messages):
+    return estimate_tokens(*[message["content"] for message in messages])
+
+def send_rewrite(service, estimated_tokens, messages, schema, schema_name, options):
+    """
+    Awaitable hedged rewrite request on the prompt's model (see
+    RewriteService.ahedged_response). `messages` come from build_rewrite_input;
+    their shared prefix also keys the provider's prompt cache.
+    """
+    return service.ahedged_response(
+        estimated_tokens,
+        options.rewrite_model,
+        options.hedge_model,
+        options.latency_budget_ms,
+        validate=has_json_reply,
+        input=messages,
+        prompt_cache_key=prompt_cache_key(messages),
+        **text_format(schema_name, schema),
+    )
+
+def request_rewrite(estimated_tokens, messages, schema, schema_name, source=None, options=None):
+    """
+    Send one schema-constrained (hedged) rewrite request and parse/validate the
+    reply against the `source` payload in a single pass. Returns a
+    rewrite_schema.ParsedReply; parse, hedge and token metrics are recorded.
+    Raises RewriteServiceError when the request itself fails.
     """
+    service = get_rewrite_service()
+    hedged = service.run(send_rewrite(
+        service, estimated_tokens, messages, schema, schema_name, options or DEFAULT_REWRITE_OPTIONS
+    ))
+    record_response(hedged)
+    content = hedged.response.output_text.strip()
+    logger.info("Raw GPT response from %s (first 500 chars): %s", hedged.model, content[:500])  # debug
+    return record_reply(parse_reply(content, schema, source))
 
+def retry_invalid_fields(prompt_text, portal_name, payload, segmented, invalid, options=None):
+    """
+    Ask GPT again for only the `invalid` paths of a variation reply (e.g. "slug",
+    "description_segments.s4"), sending just the source text of those fields.
+    Returns the retry reply to merge into the variation ({} if the retry failed too).
+    """
+    fields = [path for path in invalid if "." not in path]
+    segment_ids = [path.split(".", 1)[1] for path in invalid if path.startswith("description_segments.")]
+    partial = {name: payload[name] for name in fields if name in payload}
+    if segment_ids:
+        partial["description_segments"] = {
+            segment_id: payload["description_segments"][segment_id] for segment_id in segment_ids
+        }
+    schema = variation_schema(
+        fields=[name for name in fields if name in FIELD_NAMES],
+        segment_ids=segment_ids,
+        html_description="description" in fields,
+    )
+    messages = build_rewrite_input(segmented, partial, prompt_text, retry_instruction(portal_name, partial))
 
+    logger.info("Retrying %s invalid fields for %s: %s", len(invalid), portal_name, ", ".join(invalid))
     try:
-        response = client.responses.create(
-            model="gpt-4o-mini",
-            input=[
-                {"role": "developer", "content": prompt_text},
-                {"role": "user", "content": user_content}
-            ],
+        parsed = request_rewrite(
+            estimate_input_tokens(messages) + estimate_tokens(json.dumps(partial, ensure_ascii=False)) + 50,
+            messages, schema, "variation_retry", partial, options,
         )
+    except Exception as e:
+        logger.warning("Field retry for %s failed: %s", portal_name, str(e))
+        bump_rewrite_stats(retried_fields=len(invalid))
+        return {}
+    bump_rewrite_stats(retried_fields=len(invalid), recovered_fields=len(invalid) - len(parsed.invalid))
+    return parsed.data
 
-        content = response.output_text.strip()
-        logger.info("Raw GPT response (first 500 chars): %s", content[:500])  # debug
+def generate_variation_with_gpt(title, short_desc, desc, prompt_text, meta_title=None, slug=None, portal_name=None,
+                                options=None):
+    """
+    Generate rephrased version of news fields using GPT.
+    Always tries to parse JSON safely.
+    Results are served from the rewrite cache when the same inputs were rewritten before.
+    Long articles are rewritten in concurrent chunks; `options` (a RewriteOptions)
+    also picks the model and the latency budget of hedged requests.
+    Returns (title, short_desc, desc, meta_title, slug).
+    """
+    options = options or DEFAULT_REWRITE_OPTIONS
+    model = options.rewrite_model
+    cache_key = make_cache_key(title, short_desc, desc, meta_title, slug, prompt_text, portal_name, model)
+    try:
+        cached = get_cached_variation(cache_key)
+    except Exception as e:
+        logger.warning("Rewrite cache lookup failed for %s: %s", portal_name, str(e))
+        cached = None
+    if cached:
+        logger.info("Served AI variation for %s from rewrite cache", portal_name)
+        return cached
+
+    logger.info("Started AI generation for portal: %s", portal_name)
+
+    try:
+        payload, segmented = build_rewrite_payload(title, short_desc, desc, meta_title, slug)
+        if options.should_chunk(segmented):
+            return generate_chunked_variation(
+                title, short_desc, desc, prompt_text, meta_title, slug, portal_name, segmented, options, cache_key
+            )
+
+        messages = build_rewrite_input(segmented, payload, prompt_text, portal_instruction(portal_name, payload))
+        started = time.monotonic()
+        parsed = request_rewrite(
+            estimate_input_tokens(messages)
+            + estimate_variation_tokens(title, short_desc, sent_description(desc, segmented), meta_title),
+            messages, reply_schema(segmented), "variation", payload, options,
+        )
+        data = parsed.data
+        if parsed.invalid:
+            merge_reply(
+                data, retry_invalid_fields(prompt_text, portal_name, payload, segmented, parsed.invalid, options)
+            )
 
-        # Try strict JSON parse
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError:
-            # Fallback: extract JSON from text
-            import re
-            match = re.search(r"\{.*\}", content, re.DOTALL)
-            if match:
-                data = json.loads(match.group(0))
-            else:
-                raise ValueError("No valid JSON in GPT response")
-        
         logger.info("Successfully generated AI variation for %s", portal_name)
 
-        return (
-            data.get("title", title),
-            data.get("short_description", short_desc),
-            data.get("description", desc),
-            data.get("meta_title", meta_title or title),
-            data.get("slug", slug or slugify(meta_title or title)),
+        result = variation_from_reply(
+            data, (title, short_desc, desc, meta_title or title, slug or slugify(meta_title or title)), segmented
         )
+        if invalid_paths(data, reply_schema(segmented), payload):
+            # Incomplete even after the retry: serve it, but let the next publish try again
+            return result
+        try:
+            store_variation(
+                cache_key, result, portal_name=portal_name, model=model,
+                generation_ms=(time.monotonic() - started) * 1000,
+            )
+        except Exception as e:
+            logger.warning("Rewrite cache store failed for %s: %s", portal_name, str(e))
+        return result
 
+    except RewriteServiceError as e:
+        logger.error("AI generation for %s gave up, publishing the original content: %s", portal_name, str(e))
+        return (
+            title,
+            short_desc,
+            desc,
+            meta_title or title,
+            slug or slugify(meta_title or title),
+        )
     except Exception as e:
         logger.exception("AI generation failed for %s: %s", portal_name, str(e))
         # fallback if GPT fails
@@ -97,6 +272,206 @@ def generate_variation_with_gpt(title, short_desc, desc, prompt_text, meta_title
             slug or slugify(meta_title or title),
         )
 
+def generate_chunked_variation(title, short_desc, desc, prompt_text, meta_title, slug, portal_name, segmented,
+                               options, cache_key):
+    """
+    Rewrite a long article as concurrent requests: one small request for the
+    title, short_description, meta_title and slug, and one per chunk of the
+    description's text segments (split at block boundaries, at most
+    `options.max_chunk_chars` each, `options.parallelism` at a time).
+    Chunks are reassembled in document order; fields missing from the replies
+    are retried together in one request, a failed chunk keeps its original
+    text and a partly failed result is not cached.
+    """
+    model = options.rewrite_model
+    default = (title, short_desc, desc, meta_title or title, slug or slugify(meta_title or title))
+    chunks = segmented.chunks(options.max_chunk_chars)
+    logger.info("Started chunked AI generation for %s (%s chunks)", portal_name, len(chunks))
+
+    fields = {
+        "title": title,
+        "short_description": short_desc,
+        "meta_title": meta_title or title,
+        "slug": slug or slugify(meta_title or title),
+    }
+    excerpt = " ".join(segmented.segments.values())[:1500]
+    messages = build_rewrite_input(
+        segmented, fields, prompt_text, headline_instruction(portal_name, fields), context=excerpt
+    )
+    requests = [(
+        estimate_input_tokens(messages) + estimate_tokens(*fields.values()) + 50,
+        messages,
+        variation_schema(),
+        fields,
+    )]
+    for number, chunk in enumerate(chunks, start=1):
+        article = {"description_segments": chunk}
+        messages = build_rewrite_input(
+            segmented, article, prompt_text, part_instruction(portal_name, number, len(chunks)),
+            note=f"part {number} of {len(chunks)}",
+        )
+        requests.append((
+            estimate_input_tokens(messages) + estimate_tokens(json.dumps(chunk, ensure_ascii=False)) + 100,
+            messages,
+            variation_schema(fields=(), segment_ids=list(chunk)),
+            article,
+        ))
+
+    service = get_rewrite_service()
+
+    async def rewrite_all():
+        limit = asyncio.Semaphore(options.parallelism)
+
+        async def rewrite(estimated_tokens, messages, schema, source):
+            async with limit:
+                return await send_rewrite(service, estimated_tokens, messages, schema, "variation_part", options)
+
+        return await asyncio.gather(*[rewrite(*request) for request in requests], return_exceptions=True)
+
+    started = time.monotonic()
+    replies = service.run(rewrite_all())
+    failures = [reply for reply in replies if isinstance(reply, BaseException)]
+    for failure in failures:
+        logger.error("Chunked AI generation for %s: a request failed: %s", portal_name, str(failure))
+
+    # Parse and validate on this thread (stats are written to the database)
+    data, invalid = {"description_segments": {}}, []
+    for reply, (_, _, schema, source) in zip(replies, requests):
+        if not isinstance(reply, BaseException):
+            record_response(reply)
+            parsed = record_reply(parse_reply(reply.response.output_text.strip(), schema, source))
+            merge_reply(data, parsed.data)
+            invalid.extend(parsed.invalid)
+    payload = dict(fields, description_segments=segmented.segments)
+    if invalid:
+        merge_reply(data, retry_invalid_fields(prompt_text, portal_name, payload, segmented, invalid, options))
+    result = variation_from_reply(data, default, segmented)
+
+    if not failures and not invalid_paths(data, reply_schema(segmented), payload):
+        logger.info("Successfully generated chunked AI variation for %s", portal_name)
+        try:
+            store_variation(
+                cache_key, result, portal_name=portal_name, model=model,
+                generation_ms=(time.monotonic() - started) * 1000,
+            )
+        except Exception as e:
+            logger.warning("Rewrite cache store failed for %s: %s", portal_name, str(e))
+    return result
+
+def estimate_tokens(*texts):
+    """Rough token estimate (~4 characters per token) used to size batched requests."""
+    return sum(len(text or "") for text in texts) // 4 + 1
+
+def estimate_variation_tokens(title, short_desc, desc, meta_title=None):
+    """Expected output tokens of one rewritten variation (all fields plus JSON overhead)."""
+    return int(estimate_tokens(title, short_desc, desc, meta_title, title) * 1.2) + 50
+
+def split_portals_for_batch(portal_names, title, short_desc, desc, meta_title=None):
+    """
+    Split portal names into batches whose combined output (one full variation
+    per portal) stays within OPENAI_MAX_OUTPUT_TOKENS.
+    """
+    per_variation = estimate_variation_tokens(title, short_desc, desc, meta_title)
+    per_batch = max(1, settings.OPENAI_MAX_OUTPUT_TOKENS // per_variation)
+    per_batch = min(per_batch, settings.REWRITE_BATCH_MAX_PORTALS)
+    return [portal_names[i:i + per_batch] for i in range(0, len(portal_names), per_batch)]
+
+def generate_variations_batch_with_gpt(title, short_desc, desc, prompt_text, portal_names, meta_title=None, slug=None,
+                                       options=None):
+    """
+    Generate one distinct variation per portal in a single GPT request
+    (split into several requests when the output would be too large).
+    Cached variations are reused; portals missing from a batched reply
+    fall back to generate_variation_with_gpt, and portals with only some
+    fields missing get those fields retried. Articles long enough to be
+    chunked (see RewriteOptions) are rewritten per portal instead.
+    Returns {portal_name: (title, short_desc, desc, meta_title, slug)}.
+    """
+    options = options or DEFAULT_REWRITE_OPTIONS
+    model = options.rewrite_model
+    default = (title, short_desc, desc, meta_title or title, slug or slugify(meta_title or title))
+    payload, segmented = build_rewrite_payload(title, short_desc, desc, meta_title, slug)
+
+    results = {}
+    pending = []
+    for portal_name in portal_names:
+        try:
+            cached = get_cached_variation(
+                make_cache_key(title, short_desc, desc, meta_title, slug, prompt_text, portal_name, model)
+            )
+        except Exception as e:
+            logger.warning("Rewrite cache lookup failed for %s: %s", portal_name, str(e))
+            cached = None
+        if cached:
+            results[portal_name] = cached
+        else:
+            pending.append(portal_name)
+
+    if options.should_chunk(segmented):
+        variations = FanOutExecutor().map(
+            lambda portal_name: generate_variation_with_gpt(
+                title, short_desc, desc, prompt_text, meta_title, slug, portal_name=portal_name, options=options
+            ),
+            pending,
+        )
+        results.update(zip(pending, variations))
+        return results
+
+    body = sent_description(desc, segmented)
+    for batch in split_portals_for_batch(pending, title, short_desc, body, meta_title):
+        if len(batch) == 1:
+            results[batch[0]] = generate_variation_with_gpt(
+                title, short_desc, desc, prompt_text, meta_title, slug, portal_name=batch[0], options=options
+            )
+            continue
+
+        logger.info("Started batched AI generation for portals: %s", ", ".join(batch))
+
+        messages = build_rewrite_input(segmented, payload, prompt_text, batch_instruction(batch, payload))
+
+        data = {}
+        schema = reply_schema(segmented)
+        try:
+            started = time.monotonic()
+            data = request_rewrite(
+                estimate_input_tokens(messages)
+                + estimate_variation_tokens(title, short_desc, body, meta_title) * len(batch),
+                messages, batch_schema(batch, schema), "variations",
+                {portal_name: payload for portal_name in batch}, options,
+            ).data
+            elapsed_ms = (time.monotonic() - started) * 1000 / len(batch)
+            logger.info("Successfully generated batched AI variations for %s", ", ".join(batch))
+        except Exception as e:
+            logger.exception("Batched AI generation failed for %s: %s", ", ".join(batch), str(e))
+
+        for portal_name in batch:
+            variation = data.get(portal_name)
+            if not isinstance(variation, dict) or not variation:
+                # Missing or malformed entry: rewrite this portal on its own
+                results[portal_name] = generate_variation_with_gpt(
+                    title, short_desc, desc, prompt_text, meta_title, slug, portal_name=portal_name, options=options
+                )
+                continue
+
+            invalid = invalid_paths(variation, schema, payload)
+            if invalid:
+                merge_reply(
+                    variation, retry_invalid_fields(prompt_text, portal_name, payload, segmented, invalid, options)
+                )
+            result = variation_from_reply(variation, default, segmented)
+            results[portal_name] = result
+            if invalid and invalid_paths(variation, schema, payload):
+                continue
+            try:
+                store_variation(
+                    make_cache_key(title, short_desc, desc, meta_title, slug, prompt_text, portal_name, model),
+                    result, portal_name=portal_name, model=model, generation_ms=elapsed_ms,
+                )
+            except Exception as e:
+                logger.warning("Rewrite cache store failed for %s: %s", portal_name, str(e))
+
+    return results
+
 def get_portals_from_assignment(assignment):
     """
     Given a UserCategoryGroupAssignment, return all (portal, portal_category) pairs.
@@ -121,3 +496,20 @@ def get_portals_from_assignment(assignment):
                 portals.append((mapping.portal_category.portal, mapping.portal_category))
 
     return portals
+
+
+def get_assigned_master_categories(user):
+    """Master categories assigned to `user` directly or through a group."""
+    return MasterCategory.objects.filter(
+        Q(user_assignments__user=user) | Q(groups__user_assignments__user=user)
+    ).distinct()
+
+
+def get_assigned_portals(user):
+    """
+    Portals of every assignment of `user` (the portals get_portals_from_assignment
+    yields over all of them), resolved in a single query.
+    """
+    return Portal.objects.filter(
+        categories__mappings__master_category__in=get_assigned_master_categories(user)
+    ).distinct()
@@ -1,4 +1,3 @@
-import requests
 from urllib.parse import urljoin
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -8,15 +7,16 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from django.http import Http404
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Q, Count, Sum
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth import get_user_model
-from django.utils.text import slugify
 
 
 from .models import (
-    Portal, PortalCategory, MasterCategory, MasterCategoryMapping, Group, MasterNewsPost, NewsDistribution, PortalPrompt
+    Portal, PortalCategory, MasterCategory, MasterCategoryMapping, Group, MasterNewsPost, NewsDistribution, PublishJob,
+    PortalHealth, ScheduledPublish
 )
 from .serializers import (
     PortalSerializer, PortalSafeSerializer, PortalCategorySerializer, MasterCategorySerializer, 
@@ -24,11 +24,25 @@ from .serializers import (
     NewsDistributionListSerializer, NewsDistributionSerializer
 )
 from .utils import (
-    success_response, error_response, generate_variation_with_gpt, get_portals_from_assignment
+    success_response, error_response, get_assigned_master_categories, get_assigned_portals
 )
+from .planner import build_publish_plan
+from .publishing import enqueue_publish_job, job_progress
+from .progress_stream import job_event_response
+from .drafts import content_snapshot, invalidate_drafts, pregenerate_requested, request_drafts
+from .scheduling import WAITING_STATUSES, reschedule_post, schedule_publish
+from .rewrite_cache import cache_stats
+from .rewrite_stats import rewrite_stats
+from .stats import (
+    distribution_stats, domain_distribution_stats, request_date_window, rollup_distributions, window_lookup
+)
+from .stats_cache import cached_stats, stats_cache_stats
+from .portal_client import get_portal_client, portal_timeout
+from .circuit_breaker import health_summary
+from .post_images import generate_post_image_variants
 from .pagination import PaginationMixin
 from user.models import (
-    UserCategoryGroupAssignment, PortalUserMapping
+    UserCategoryGroupAssignment
 )
 
 User = get_user_model()
@@ -637,8 +651,9 @@ class GroupCategoriesListAPIView(APIView, PaginationMixin):
 
 class MasterNewsPostPublishAPIView(APIView):
     """
-    POST /api/master-news/{id}/publish/
-    Publishes a MasterNewsPost to portals mapped under the selected master category.
+    POST /api/publish/news/{id}/
+    Queues a publish job for a MasterNewsPost to portals mapped under the selected master category.
+    The job runs in the `run_publish_worker` process; poll GET /api/publish/jobs/{job_id}/ for progress.
     """
 
     permission_classes = [IsAuthenticated]
@@ -687,138 +702,191 @@ class MasterNewsPostPublishAPIView(APIView):
                 # Use default master category from mapping
                 master_category_id = default_mapping.master_category.id
 
-            # Now fetch all portal mappings under this master category
-            mappings = MasterCategoryMapping.objects.filter(
-                master_category_id=master_category_id
-            ).select_related("portal_category", "portal_category__portal")
+            excluded_portals = request.data.get("excluded_portals", [])
+            if not isinstance(excluded_portals, list):
+                excluded_portals = []
+
+            # Now plan all portal mappings under this master category
+            plan = build_publish_plan(news_post, master_category_id, user, excluded_portals)
 
-            if not mappings.exists():
+            if not plan.entries:
                 return Response(
                     error_response("No portals mapped for this master category."),
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            excluded_portals = request.data.get("excluded_portals", [])
-            if not isinstance(excluded_portals, list):
-                excluded_portals = []
+            return self.plan_response(request, plan)
 
-            results = []
-
-            # 4. Iterate through mapped portals
-            for mapping in mappings:
-                portal = mapping.portal_category.portal
-                portal_category = mapping.portal_category
-
-                # Skip excluded ones
-                if portal.id in excluded_portals or portal.name in excluded_portals:
-                    results.append({
-                        "portal": portal.name,
-                        "category": portal_category.name,
-                        "success": False,
-                        "response": "Skipped manually by user",
-                    })
-                    continue
-
-                # Rewriting logic same as before ↓
-                if mapping.use_default_content:
-                    rewritten_title = news_post.title
-                    rewritten_short = news_post.short_description
-                    rewritten_content = news_post.content
-                    rewritten_meta = news_post.meta_title or news_post.title
-                    rewritten_slug = news_post.slug or slugify(news_post.meta_title or news_post.title)
-                else:
-                    portal_prompt = (
-                        PortalPrompt.objects.filter(portal=portal, is_active=True).first()
-                        or PortalPrompt.objects.filter(portal__isnull=True, is_active=True).first()
-                    )
-                    prompt_text = (
-                        portal_prompt.prompt_text
-                        if portal_prompt
-                        else "Rewrite the content slightly for clarity and engagement."
-                    )
-                    rewritten_title, rewritten_short, rewritten_content, rewritten_meta, rewritten_slug = generate_variation_with_gpt(
-                        news_post.title,
-                        news_post.short_description,
-                        news_post.content,
-                        prompt_text,
-                        news_post.meta_title,
-                        news_post.slug,
-                        portal_name=portal.name,
-                    )
+        except Exception as e:
+            return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                # Get portal user mapping
-                portal_user = PortalUserMapping.objects.filter(
-                    user=user, portal=portal, status="MATCHED"
-                ).first()
-                if not portal_user:
-                    results.append({
-                        "portal": portal.name,
-                        "category": portal_category.name,
-                        "success": False,
-                        "response": "No valid portal user mapping found.",
-                    })
-                    continue
-
-                payload = {
-                    "post_cat": portal_category.external_id if portal_category else None,
-                    "post_title": rewritten_title,
-                    "post_short_des": rewritten_short,
-                    "post_des": rewritten_content,
-                    "meta_title": rewritten_meta,
-                    "slug": rewritten_slug,
-                    "post_tag": news_post.post_tag or "",
-                    "author": portal_user.portal_user_id,
-                    
-                    # Dates
-                    "Event_date": (news_post.Event_date or timezone.now().date()).isoformat(),
-                    "Eventend_date": (news_post.Event_end_date or timezone.now().date()).isoformat(),
-                    "schedule_date": (news_post.schedule_date or timezone.now()).isoformat(),
-
-                    # Flags
-                    "is_active": int(bool(news_post.latest_news)) if news_post.latest_news is not None else 0,
-                    "Event": int(bool(news_post.upcoming_event)) if news_post.upcoming_event is not None else 0,
-                    "Head_Lines": int(bool(news_post.Head_Lines)) if news_post.Head_Lines is not None else 0,
-                    "articles": int(bool(news_post.articles)) if news_post.articles is not None else 0,
-                    "trending": int(bool(news_post.trending)) if news_post.trending is not None else 0,
-                    "BreakingNews": int(bool(news_post.BreakingNews)) if news_post.BreakingNews is not None else 0,
-                    "post_status": news_post.counter or 0,
-                }
-                files = {"post_image": open(news_post.post_image.path, "rb")} if news_post.post_image else {}
-
-                api_url = f"{portal.base_url}/api/create-news/"
-                try:
-                    response = requests.post(api_url, data=payload, files=files, timeout=10)
-                    success = response.status_code in [200, 201]
-                    response_msg = response.text
-                except Exception as e:
-                    success = False
-                    response_msg = str(e)
-
-                NewsDistribution.objects.update_or_create(
-                    news_post=news_post,
-                    portal=portal,
-                    defaults={
-                        "portal_category": portal_category,
-                        "master_category_id": master_category_id,
-                        "status": "SUCCESS" if success else "FAILED",
-                        "response_message": response_msg,
-                        "ai_title": rewritten_title,
-                        "ai_short_description": rewritten_short,
-                        "ai_content": rewritten_content,
-                        "ai_meta_title": rewritten_meta,
-                        "ai_slug": rewritten_slug,
-                    },
+    def plan_response(self, request, plan):
+        # 4. Queue one task per mapped portal; the publish worker delivers them
+        job = enqueue_publish_job(plan)
+        return self.job_response(request, job)
+
+    def job_response(self, request, job):
+        return Response(
+            success_response(
+                {"job_id": job.id, "status": job.status, "total_tasks": job.total_tasks},
+                "Publish job queued successfully.",
+            ),
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class MasterNewsPostPublishStreamAPIView(MasterNewsPostPublishAPIView):
+    """
+    POST /api/publish/news/{id}/stream/
+    Same as the publish endpoint, but answers with a Server-Sent Events stream
+    of per-portal progress (started, rewritten, delivered/failed/skipped)
+    that ends with a `done` event once every portal has finished.
+    """
+
+    def job_response(self, request, job):
+        return job_event_response(request, job)
+
+
+class PublishPlanAPIView(APIView):
+    """
+    GET /api/publish/plan/{id}/?master_category_id=3&excluded_portals=5,Portal%20B
+    Dry run of a publish: shows, per mapped portal, whether it would be published,
+    skipped or blocked by a missing portal user mapping, which prompt would be used
+    and the existing distribution. Nothing is rewritten or sent.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            user = request.user
+            master_category_id = request.query_params.get("master_category_id")
+
+            if not master_category_id:
+                return Response(
+                    error_response("Please provide master_category_id."),
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
 
-                results.append({
-                    "portal": portal.name,
-                    "category": portal_category.name,
-                    "success": success,
-                    "response": response_msg,
-                })
+            news_post = get_object_or_404(MasterNewsPost, pk=pk)
+
+            if not UserCategoryGroupAssignment.objects.filter(
+                user=user, master_category_id=master_category_id
+            ).exists():
+                return Response(
+                    error_response("You are not assigned to this master category."),
+                    status=status.HTTP_403_FORBIDDEN,
+                )
 
-            return Response(success_response(results, "News published successfully."))
+            excluded_portals = []
+            for value in request.query_params.get("excluded_portals", "").split(","):
+                value = value.strip()
+                if value:
+                    excluded_portals.append(int(value) if value.isdigit() else value)
 
+            plan = build_publish_plan(news_post, master_category_id, user, excluded_portals)
+            return Response(
+                success_response(plan.to_dict(), "Publish plan generated successfully"),
+                status=status.HTTP_200_OK,
+            )
+        except Http404:
+            return Response(error_response("News post not found"), status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class PublishJobStatusAPIView(APIView):
+    """
+    GET /api/publish/jobs/{job_id}/
+    Returns the progress of a publish job and the per-portal results collected so far.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            job = get_object_or_404(PublishJob, pk=pk, requested_by=request.user)
+            return Response(
+                success_response(job_progress(job), "Publish job status fetched successfully"),
+                status=status.HTTP_200_OK,
+            )
+        except Http404:
+            return Response(error_response("Publish job not found"), status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MasterNewsPostScheduleAPIView(MasterNewsPostPublishAPIView):
+    """
+    POST /api/publish/news/{id}/schedule/
+    Same body as the publish endpoint plus an optional `schedule_date`
+    (defaults to the post's). The run_publish_scheduler process pre-generates
+    the AI variations and queues the publish job when the date is reached.
+
+    DELETE /api/publish/news/{id}/schedule/
+    Cancels the post's waiting schedules.
+    """
+
+    def plan_response(self, request, plan):
+        news_post = plan.news_post
+        schedule_date = request.data.get("schedule_date")
+        if schedule_date:
+            publish_at = parse_datetime(str(schedule_date))
+            if publish_at is None:
+                return Response(
+                    error_response("schedule_date must be an ISO 8601 datetime."),
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if timezone.is_naive(publish_at):
+                publish_at = timezone.make_aware(publish_at)
+            news_post.schedule_date = publish_at
+            news_post.save(update_fields=["schedule_date", "updated_at"])
+        elif not news_post.schedule_date:
+            return Response(
+                error_response("Please provide schedule_date."),
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        schedule = schedule_publish(plan, news_post.schedule_date)
+        return Response(
+            success_response(
+                {"schedule_id": schedule.id, "publish_at": schedule.publish_at, "status": schedule.status},
+                "Publish scheduled successfully.",
+            ),
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    def delete(self, request, pk):
+        try:
+            news_post = get_object_or_404(MasterNewsPost, pk=pk)
+            cancelled = ScheduledPublish.objects.filter(
+                news_post=news_post, requested_by=request.user, status__in=WAITING_STATUSES
+            ).update(status="CANCELLED", updated_at=timezone.now())
+            return Response(
+                success_response({"cancelled": cancelled}, "Scheduled publish cancelled."),
+                status=status.HTTP_200_OK,
+            )
+        except Http404:
+            return Response(error_response("Post not found"), status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class PublishJobEventsAPIView(APIView):
+    """
+    GET /api/publish/jobs/{job_id}/events/
+    Server-Sent Events stream of a publish job's progress (for EventSource
+    clients and for re-attaching to a job after a dropped stream).
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            job = get_object_or_404(PublishJob, pk=pk, requested_by=request.user)
+            return job_event_response(request, job)
+        except Http404:
+            return Response(error_response("Publish job not found"), status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -838,7 +906,10 @@ class NewsPostCreateAPIView(APIView):
 
             serializer = MasterNewsPostSerializer(data=data)
             if serializer.is_valid():
-                serializer.save()
+                news_post = serializer.save()
+                generate_post_image_variants(news_post)
+                if pregenerate_requested(request.data):
+                    request_drafts(news_post, request.user)
                 return Response(
                     success_response(
                         serializer.data,
@@ -1019,104 +1090,75 @@ class AdminStatsAPIView(APIView):
         try:
             user = request.user
             role = getattr(user.role, "role", None)
-
-            # --- Date Filtering ---
-            today_param = request.query_params.get("today")
-            start_date = request.query_params.get("start_date")
-            end_date = request.query_params.get("end_date")
-
-            # Default: No filtering
-            date_filter = {}
-
-            # Today filter (if ?today=true)
-            if today_param and today_param.lower() == "true":
-                today = timezone.now().date()
-                date_filter["created_at__date"] = today
-
-            # Custom date range filter
-            elif start_date and end_date:
-                date_filter["created_at__date__range"] = [start_date, end_date]
-
-            # --- MASTER ADMIN STATS ---
-            if role and role.name.upper() == "MASTER":
-                stats = {
-                    "total_posts": MasterNewsPost.objects.filter(**date_filter).count(),
-                    "total_users": User.objects.filter(**date_filter).count()
-                    if "created_at__date" in date_filter or "created_at__date__range" in date_filter else User.objects.count(),
-                    "total_portals": Portal.objects.filter(**date_filter).count(),
-                    "total_master_categories": MasterCategory.objects.filter(**date_filter).count(),
-                }
-
-                distributions = NewsDistribution.objects.filter(**date_filter)
-                stats.update(self._get_distribution_stats(distributions))
-
-            # --- USER STATS ---
-            elif role and role.name.upper() == "USER":
-                user_posts = MasterNewsPost.objects.filter(created_by=user, **date_filter)
-                assignments = UserCategoryGroupAssignment.objects.filter(user=user)
-                
-                # Collect related portals and master categories
-                portals = set()
-                master_categories = set()
-                for assignment in assignments:
-                    if assignment.master_category:
-                        master_categories.add(assignment.master_category)
-                    if assignment.group:
-                        master_categories.update(assignment.group.master_categories.all())
-                    for portal, _ in get_portals_from_assignment(assignment):
-                        portals.add(portal)
-
-                user_distributions = NewsDistribution.objects.filter(news_post__created_by=user, **date_filter)
-
-                stats = {
-                    "total_posts": user_posts.count(),
-                    "total_portals": len(portals),
-                    "total_master_categories": len(master_categories),
-                }
-                stats.update(self._get_distribution_stats(user_distributions))
-
-            else:
+            role_name = role.name.upper() if role else None
+            if role_name not in ("MASTER", "USER"):
                 return Response(
                     error_response("Role not recognized or not assigned"),
                     status=status.HTTP_403_FORBIDDEN
                 )
 
+            # --- Date Window (?today=true or ?start_date=&end_date=; default: none) ---
+            window = request_date_window(request.query_params)
+
+            # Served from the stats cache (app.stats_cache) while no distribution/post was written
+            stats = cached_stats(
+                "admin", role_name, user, window, lambda: self._get_stats(user, role_name, window)
+            )
+
             return Response(
                 success_response(stats, "Stats fetched successfully"),
                 status=status.HTTP_200_OK
             )
 
+        except ValidationError as e:
+            return Response(error_response(e.messages[0]), status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 error_response(str(e)),
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _get_stats(self, user, role_name, window):
+        created = window_lookup(window)
+
+        # --- MASTER ADMIN STATS ---
+        if role_name == "MASTER":
+            stats = {
+                "total_posts": MasterNewsPost.objects.filter(**created).count(),
+                # Users have no created_at: count the ones who joined in the window
+                "total_users": User.objects.filter(**window_lookup(window, "date_joined")).count(),
+                "total_portals": Portal.objects.filter(**created).count(),
+                "total_master_categories": MasterCategory.objects.filter(**created).count(),
+            }
+
+            # Date windows are answered from the daily rollups instead of scanning distributions
+            if window:
+                distributions = rollup_distributions(window)
+            else:
+                distributions = NewsDistribution.objects.all()
+            stats.update(self._get_distribution_stats(distributions))
+
+        # --- USER STATS ---
+        else:
+            user_posts = MasterNewsPost.objects.filter(created_by=user, **created)
+
+            if window:
+                user_distributions = rollup_distributions(window, author=user)
+            else:
+                user_distributions = NewsDistribution.objects.filter(news_post__created_by=user)
+
+            stats = {
+                "total_posts": user_posts.count(),
+                "total_portals": get_assigned_portals(user).count(),
+                "total_master_categories": get_assigned_master_categories(user).count(),
+            }
+            stats.update(self._get_distribution_stats(user_distributions))
+
+        return stats
+
     # --- Helper function for clean reuse ---
     def _get_distribution_stats(self, queryset):
-        total_distributions = queryset.count()
-        successful_distributions = queryset.filter(status="SUCCESS").count()
-        failed_distributions = queryset.filter(status="FAILED").count()
-        pending_distributions = queryset.filter(status="PENDING").count()
-        retry_counts = queryset.aggregate(total=Sum("retry_count"))["total"] or 0
-
-        portal_distribution = (
-            queryset.values("portal__name")
-            .annotate(total=Count("id"))
-            .order_by("portal__name")
-        )
-        portal_distribution_dict = {item["portal__name"]: item["total"] for item in portal_distribution}
-
-        return {
-            "news_distribution": {
-                "total_distributions": total_distributions,
-                "successful_distributions": successful_distributions,
-                "failed_distributions": failed_distributions,
-                "pending_distributions": pending_distributions,
-                "retry_counts": retry_counts,
-                "portal_distribution_counts": portal_distribution_dict,
-            }
-        }
+        return distribution_stats(queryset)
 
 
 class DomainDistributionStatsAPIView(APIView):
@@ -1126,71 +1168,144 @@ class DomainDistributionStatsAPIView(APIView):
         try:
             user = request.user
             role = getattr(user.role, "role", None)  # UserRole relation
-
-            stats = []
-
-            # ADMIN → all portals
-            if role and role.name.upper() == "MASTER":
-                domains = Portal.objects.all()
-                for domain in domains:
-                    distributions = NewsDistribution.objects.filter(portal=domain)
-
-                    domain_stats = {
-                        "portal_id": domain.id,
-                        "portal_name": domain.name,
-                        "total_distributions": distributions.count(),
-                        "successful_distributions": distributions.filter(status="SUCCESS").count(),
-                        "failed_distributions": distributions.filter(status="FAILED").count(),
-                        "pending_distributions": distributions.filter(status="PENDING").count(),
-                        "retry_counts": distributions.aggregate(total=Sum("retry_count"))["total"] or 0,
-                    }
-                    stats.append(domain_stats)
-
-            # USER → only assigned portals + their own posts
-            elif role and role.name.upper() == "USER":
-                assignments = UserCategoryGroupAssignment.objects.filter(user=user)
-
-                # Collect unique portals assigned
-                assigned_portals = set()
-                for assignment in assignments:
-                    for portal, _ in get_portals_from_assignment(assignment):
-                        assigned_portals.add(portal)
-
-                # Loop through only assigned portals
-                for domain in assigned_portals:
-                    distributions = NewsDistribution.objects.filter(
-                        portal=domain,
-                        news_post__created_by=user  # only user's posts
-                    )
-
-                    domain_stats = {
-                        "portal_id": domain.id,
-                        "portal_name": domain.name,
-                        "total_distributions": distributions.count(),
-                        "successful_distributions": distributions.filter(status="SUCCESS").count(),
-                        "failed_distributions": distributions.filter(status="FAILED").count(),
-                        "pending_distributions": distributions.filter(status="PENDING").count(),
-                        "retry_counts": distributions.aggregate(total=Sum("retry_count"))["total"] or 0,
-                    }
-                    stats.append(domain_stats)
-
-            else:
+            role_name = role.name.upper() if role else None
+            if role_name not in ("MASTER", "USER"):
                 return Response(
                     error_response("Role not recognized or not assigned"),
                     status=status.HTTP_403_FORBIDDEN
                 )
 
+            # Optional ?today=true or ?start_date=&end_date= window, answered from the daily rollups
+            window = request_date_window(request.query_params)
+
+            # Served from the stats cache (app.stats_cache) while no distribution/post was written
+            stats = cached_stats(
+                "domain", role_name, user, window, lambda: self._get_stats(user, role_name, window)
+            )
+
             return Response(
                 success_response(stats, "Domain-wise distribution stats fetched successfully"),
                 status=status.HTTP_200_OK
             )
 
+        except ValidationError as e:
+            return Response(error_response(e.messages[0]), status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 error_response(str(e)),
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-            
+
+    def _get_stats(self, user, role_name, window):
+        # ADMIN → all portals
+        if role_name == "MASTER":
+            domains = list(Portal.objects.all())
+            if window:
+                distributions = rollup_distributions(window)
+            else:
+                distributions = NewsDistribution.objects.all()
+
+        # USER → only assigned portals + their own posts
+        else:
+            domains = list(get_assigned_portals(user))
+            domain_ids = [domain.id for domain in domains]
+            if window:
+                distributions = rollup_distributions(window, author=user, portal_id__in=domain_ids)
+            else:
+                distributions = NewsDistribution.objects.filter(news_post__created_by=user, portal_id__in=domain_ids)
+
+        # One grouped query for every domain's counters
+        return domain_distribution_stats(domains, distributions)
+
+
+class StatsCacheAPIView(APIView):
+    """
+    GET /api/admin/stats/cache/
+    Hit/miss counters and hit ratios of the dashboard stats cache.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return Response(
+                success_response(stats_cache_stats(), "Stats cache stats fetched successfully"),
+                status=status.HTTP_200_OK
+            )
+        except Exception as e:
+            return Response(
+                error_response(str(e)),
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class PortalHealthAPIView(APIView):
+    """
+    GET /api/domain/health/
+    Circuit breaker state and health score of every portal.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            stats = []
+            for portal in Portal.objects.select_related("health").order_by("name"):
+                try:
+                    health = portal.health
+                except PortalHealth.DoesNotExist:
+                    health = PortalHealth(portal=portal)
+                stats.append(health_summary(health))
+
+            return Response(
+                success_response(stats, "Portal health fetched successfully"),
+                status=status.HTTP_200_OK
+            )
+        except Exception as e:
+            return Response(
+                error_response(str(e)),
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class RewriteCacheStatsAPIView(APIView):
+    """
+    GET /api/ai/cache/stats/
+    Hit/miss counters of the GPT rewrite cache and the GPT time it saved.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return Response(
+                success_response(cache_stats(), "Rewrite cache stats fetched successfully"),
+                status=status.HTTP_200_OK
+            )
+        except Exception as e:
+            return Response(
+                error_response(str(e)),
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class RewriteStatsAPIView(APIView):
+    """
+    GET /api/ai/rewrite/stats/
+    Parse-failure rate, parse time, field-retry and hedging counters of GPT rewrite replies,
+    and how many input tokens the provider served from its prompt cache.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return Response(
+                success_response(rewrite_stats(), "Rewrite stats fetched successfully"),
+                status=status.HTTP_200_OK
+            )
+        except Exception as e:
+            return Response(
+                error_response(str(e)),
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 
 class AllPortalsTagsLiveAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1202,8 +1317,7 @@ class AllPortalsTagsLiveAPIView(APIView):
 
         for portal in portals:
             try:
-                api_url = f"{portal.base_url}/api/tags/"
-                response = requests.get(api_url, timeout=10)
+                response = get_portal_client(portal).get("/api/tags/", timeout=portal_timeout(portal, 10))
                 if response.status_code == 200:
                     res_json = response.json()
                     # adapt to actual response structure
@@ -1242,7 +1356,16 @@ class NewsPostUpdateAPIView(APIView):
 
             serializer = MasterNewsPostSerializer(post, data=request.data, partial=True)
             if serializer.is_valid():
-                serializer.save()
+                content_before = content_snapshot(post)
+                post = serializer.save()
+                if "post_image" in request.FILES:
+                    generate_post_image_variants(post)
+                content_changed = content_snapshot(post) != content_before
+                if content_changed:
+                    invalidate_drafts(post)
+                if pregenerate_requested(request.data):
+                    request_drafts(post, request.user)
+                reschedule_post(post, content_changed=content_changed)
                 return Response(
                     success_response(
                         serializer.data,
@@ -15,6 +15,7 @@ from datetime import timedelta
 from dotenv import load_dotenv
 import os
 import logging
+import tempfile
 
 # Load environment variables from the .env file (if present)
 load_dotenv()
@@ -154,6 +155,95 @@ SIMPLE_JWT = {
 
 
 OPEN_AI_KEY =  os.getenv('OPEN_AI_KEY')
+OPENAI_REWRITE_MODEL = os.getenv('OPENAI_REWRITE_MODEL', 'gpt-4o-mini')
+# Hedged rewrites: a duplicate request (on OPENAI_FALLBACK_MODEL if set) is sent when the first is slower
+# than the model's recent p95 latency, capped by REWRITE_LATENCY_BUDGET_MS (0 = no budget);
+# PortalPrompt.model / fallback_model / latency_budget_ms override per prompt
+OPENAI_FALLBACK_MODEL = os.getenv('OPENAI_FALLBACK_MODEL', '')
+REWRITE_HEDGING = os.getenv('REWRITE_HEDGING', 'true').lower() == 'true'
+REWRITE_LATENCY_BUDGET_MS = int(os.getenv('REWRITE_LATENCY_BUDGET_MS', 0))
+REWRITE_HEDGE_PERCENTILE = float(os.getenv('REWRITE_HEDGE_PERCENTILE', 95))
+REWRITE_HEDGE_MIN_SAMPLES = int(os.getenv('REWRITE_HEDGE_MIN_SAMPLES', 20))
+# Batched rewrites: output budget per request and max portals per request
+OPENAI_MAX_OUTPUT_TOKENS = int(os.getenv('OPENAI_MAX_OUTPUT_TOKENS', 16000))
+REWRITE_BATCH_MAX_PORTALS = int(os.getenv('REWRITE_BATCH_MAX_PORTALS', 10))
+# Send only the text nodes of post HTML to GPT and re-stitch the original markup (app.html_segments)
+REWRITE_HTML_SEGMENTS = os.getenv('REWRITE_HTML_SEGMENTS', 'true').lower() == 'true'
+# Articles with more text than this are rewritten in concurrent chunks (0 disables;
+# PortalPrompt.chunk_chars / chunk_parallelism override per prompt)
+REWRITE_CHUNK_CHARS = int(os.getenv('REWRITE_CHUNK_CHARS', 6000))
+REWRITE_CHUNK_PARALLELISM = int(os.getenv('REWRITE_CHUNK_PARALLELISM', 4))
+# Ask for schema-constrained JSON (response_format json_schema, strict) instead of prompt-only JSON
+OPENAI_STRUCTURED_OUTPUTS = os.getenv('OPENAI_STRUCTURED_OUTPUTS', 'true').lower() == 'true'
+# OpenAI account limits enforced by app.rewrite_service (per process)
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 8))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', 500))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv('OPENAI_TOKENS_PER_MINUTE', 200000))
+OPENAI_REQUEST_TIMEOUT = float(os.getenv('OPENAI_REQUEST_TIMEOUT', 120))
+# 429s and transient errors: retries with exponential backoff (or the server's Retry-After)
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 5))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv('OPENAI_BACKOFF_BASE_SECONDS', 1))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv('OPENAI_BACKOFF_MAX_SECONDS', 60))
+
+# Persistent cache of GPT rewrites (app.rewrite_cache)
+REWRITE_CACHE_TTL_SECONDS = int(os.getenv('REWRITE_CACHE_TTL_SECONDS', 7 * 24 * 60 * 60))
+REWRITE_CACHE_MAX_ENTRIES = int(os.getenv('REWRITE_CACHE_MAX_ENTRIES', 5000))
+
+# Outbound portal HTTP (app.portal_client): keep-alive pool per portal base_url
+PORTAL_HTTP_POOL_SIZE = int(os.getenv('PORTAL_HTTP_POOL_SIZE', 10))
+PORTAL_HTTP_TIMEOUT = float(os.getenv('PORTAL_HTTP_TIMEOUT', 10))
+PORTAL_HTTP2 = os.getenv('PORTAL_HTTP2', 'false').lower() == 'true'
+# Per-portal circuit breaker (app.circuit_breaker)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_SECONDS = int(os.getenv('CIRCUIT_RESET_SECONDS', 60))
+
+# Background publishing (see app/management/commands/run_publish_worker.py)
+PUBLISH_WORKER_BATCH_SIZE = int(os.getenv('PUBLISH_WORKER_BATCH_SIZE', 50))
+PUBLISH_WORKER_POLL_INTERVAL = float(os.getenv('PUBLISH_WORKER_POLL_INTERVAL', 2))
+PUBLISH_TASK_LEASE_SECONDS = int(os.getenv('PUBLISH_TASK_LEASE_SECONDS', 300))
+# Leases a task may take; one whose last lease expired is failed instead of delivered yet again
+PUBLISH_TASK_MAX_ATTEMPTS = int(os.getenv('PUBLISH_TASK_MAX_ATTEMPTS', 3))
+# Portal rewrite + delivery units run in parallel: total in flight / per portal
+PUBLISH_MAX_CONCURRENCY = int(os.getenv('PUBLISH_MAX_CONCURRENCY', 16))
+PUBLISH_PER_PORTAL_CONCURRENCY = int(os.getenv('PUBLISH_PER_PORTAL_CONCURRENCY', 2))
+# NewsDistribution results are upserted in bulk every N results (and at the end of a batch)
+PUBLISH_RESULT_FLUSH_SIZE = int(os.getenv('PUBLISH_RESULT_FLUSH_SIZE', 50))
+# Server-Sent Events progress streams: how often to poll task state, and when to give up
+PUBLISH_STREAM_POLL_INTERVAL = float(os.getenv('PUBLISH_STREAM_POLL_INTERVAL', 0.5))
+PUBLISH_STREAM_TIMEOUT = int(os.getenv('PUBLISH_STREAM_TIMEOUT', 600))
+
+# Generate AI variations in the background when a post is created/updated
+# (per request: pregenerate_variations=true/false); publishing then only delivers
+AI_PREGENERATE_DRAFTS = os.getenv('AI_PREGENERATE_DRAFTS', 'false').lower() == 'true'
+
+# Scheduled publishing (run_publish_scheduler)
+# AI variations are pre-generated this many seconds before a post's schedule_date
+SCHEDULED_PUBLISH_PREPARE_SECONDS = int(os.getenv('SCHEDULED_PUBLISH_PREPARE_SECONDS', 900))
+SCHEDULED_PUBLISH_PREPARE_BATCH_SIZE = int(os.getenv('SCHEDULED_PUBLISH_PREPARE_BATCH_SIZE', 5))
+SCHEDULED_PUBLISH_POLL_INTERVAL = float(os.getenv('SCHEDULED_PUBLISH_POLL_INTERVAL', 1))
+
+# Retry scheduler for FAILED/PENDING distributions (app/management/commands/run_retry_scheduler.py)
+DISTRIBUTION_MAX_RETRIES = int(os.getenv('DISTRIBUTION_MAX_RETRIES', 5))
+DISTRIBUTION_RETRY_BASE_SECONDS = int(os.getenv('DISTRIBUTION_RETRY_BASE_SECONDS', 60))
+DISTRIBUTION_RETRY_MAX_SECONDS = int(os.getenv('DISTRIBUTION_RETRY_MAX_SECONDS', 3600))
+# Failed rows with no retry schedule (recorded before the scheduler existed) are only retried this young
+DISTRIBUTION_RETRY_MAX_AGE_SECONDS = int(os.getenv('DISTRIBUTION_RETRY_MAX_AGE_SECONDS', 86400))
+
+# Dashboard stats cache (app.stats_cache): entries are fresh for STATS_CACHE_TTL_SECONDS unless a
+# distribution/post write invalidates them, then served stale (while refreshed in the background)
+# up to STATS_CACHE_MAX_STALE_SECONDS. The file backend is shared by the web and worker processes
+# of a host, so publish writes reach it; locmem only sees writes of its own process.
+STATS_CACHE_TTL_SECONDS = int(os.getenv('STATS_CACHE_TTL_SECONDS', 60))
+STATS_CACHE_MAX_STALE_SECONDS = int(os.getenv('STATS_CACHE_MAX_STALE_SECONDS', 600))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'stats': {
+        'BACKEND': os.getenv('STATS_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('STATS_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'recon-stats-cache')),
+    },
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -194,5 +284,11 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        # Background publish jobs and portal delivery
+        "publish": {
+            "handlers": ["file", "console"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
\ No newline at end of file
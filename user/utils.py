@@ -1,4 +1,4 @@
-import requests
+from app.portal_client import get_portal_client, portal_timeout
 from .models import Portal, PortalUserMapping
 from .serializers import PortalUserMappingSerializer
 
@@ -12,8 +12,9 @@ def map_user_to_portals(user_id, username):
 
     for portal in portals:
         try:
-            url = f"{portal.base_url}/api/check-username/"
-            r = requests.get(url, params={"username": username}, timeout=60)
+            r = get_portal_client(portal).get(
+                "/api/check-username/", params={"username": username}, timeout=portal_timeout(portal, 60)
+            )
 
             if r.status_code == 200 and r.json().get("status"):
                 user_data = r.json().get("data", {})
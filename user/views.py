@@ -11,8 +11,6 @@ from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 
-import requests
-
 from .models import (
     PortalUserMapping, UserCategoryGroupAssignment, Role, UserRole
 )
@@ -27,6 +25,7 @@ from .utils import (
 from app.models import (
     Portal
 )
+from app.portal_client import get_portal_client, portal_timeout
 from app.serializers import (
     PortalSafeSerializer
 )
@@ -116,8 +115,9 @@ class CheckUsernameAcrossPortalsAPIView(APIView, PaginationMixin):
 
         for portal in Portal.objects.all():
             try:
-                url = f"{portal.base_url}/api/check-username/"
-                r = requests.get(url, params={"username": username}, timeout=5)
+                r = get_portal_client(portal).get(
+                    "/api/check-username/", params={"username": username}, timeout=portal_timeout(portal, 5)
+                )
 
                 if r.status_code == 200 and r.json().get("status"):
                     user_data = r.json().get("data", {})